@@ -0,0 +1,130 @@
+"""
+bench.alfresco_stub
+===================
+
+In-process stand-in for the Alfresco REST API used by enrichment.
+
+Answers the two calls `core.enrichment.AlfrescoClient` makes:
+- `GET .../nodes/{id}` with a synthetic node entry
+- `POST .../search` with one entry per `ID:"..."` term in the query
+
+Every node exists. Each request waits `latency_ms` before answering so
+the effect of the cache and of batching shows in benchmark results;
+the number of requests per kind is kept in `requests`.
+"""
+
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+_ID_TERM = re.compile(r'ID:"[^"]*/([^"/]+)"')
+
+
+def _entry(node_id: str) -> dict:
+    return {
+        "id": node_id,
+        "name": f"{node_id}.pdf",
+        "nodeType": "cm:content",
+        "aspectNames": ["cm:titled", "cm:auditable"],
+        "properties": {"cm:title": f"Document {node_id}"},
+        "path": {"name": "/Company Home/Sites/finance/documentLibrary"},
+    }
+
+
+class AlfrescoStub:
+    """
+    Minimal HTTP server answering node and search requests.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0):
+        """
+        Parameters
+        ----------
+        host : str, optional
+            Interface to bind.
+        port : int, optional
+            Port to bind; 0 picks a free port.
+        latency_ms : float, optional
+            Delay added to every response.
+        """
+        self.latency = latency_ms / 1000.0
+        self.requests: Counter = Counter()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """
+        Base URL to use as `ALFRESCO_URL`.
+        """
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> Tuple[str, int]:
+        """
+        Serve requests in a background thread.
+
+        Returns
+        -------
+        tuple of (str, int)
+            Bound host and port.
+        """
+        self._thread = threading.Thread(
+            target=self._server.serve_forever,
+            name="alfresco-stub",
+            daemon=True,
+        )
+        self._thread.start()
+        return self._server.server_address[:2]
+
+    def stop(self) -> None:
+        """
+        Stop serving and close the socket.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, kind: str) -> None:
+        with self._lock:
+            self.requests[kind] += 1
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):  # noqa: N802 - http.server API
+                stub._count("get")
+                path = self.path.split("?", 1)[0]
+                if "/nodes/" not in path:
+                    self._reply(404, {"error": {"statusCode": 404}})
+                    return
+                self._reply(200, {"entry": _entry(path.rsplit("/", 1)[-1])})
+
+            def do_POST(self):  # noqa: N802 - http.server API
+                stub._count("search")
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                ids = _ID_TERM.findall(body.get("query", {}).get("query", ""))
+                entries = [{"entry": _entry(node_id)} for node_id in ids]
+                self._reply(200, {"list": {"entries": entries}})
+
+            def _reply(self, status: int, document: dict) -> None:
+                if stub.latency:
+                    time.sleep(stub.latency)
+                data = json.dumps(document).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):  # noqa: A002
+                pass
+
+        return Handler
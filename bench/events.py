@@ -0,0 +1,163 @@
+"""
+bench.events
+============
+
+Event streams for benchmarks.
+
+Synthetic streams are generated from a seeded random source so runs
+are reproducible. The mix controls the share of each event type, the
+share of events under excluded system paths, and the padding added to
+every body to reach a target size. Recorded streams are read from a
+JSON-lines file holding one event object per line.
+"""
+
+import json
+import random
+import uuid
+from typing import Dict, List, Optional
+
+DEFAULT_MIX: Dict[str, float] = {
+    "BINARY_CHANGED": 0.4,
+    "PROPERTIES_CHANGED": 0.3,
+    "NODE_CREATED": 0.2,
+    "NODE_DELETED": 0.1,
+}
+
+_MIME_TYPES = (
+    "application/pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "text/plain",
+    "image/png",
+)
+_FOLDERS = (
+    "/Company Home/Sites/finance/documentLibrary",
+    "/Company Home/Sites/legal/documentLibrary/contracts",
+    "/Company Home/Shared",
+    "/Company Home/User Homes/jdoe",
+)
+_SYSTEM_FOLDER = "/Company Home/RULE_BASED_TAGS"
+_EXTENSIONS = {
+    "application/pdf": "pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx",
+    "text/plain": "txt",
+    "image/png": "png",
+}
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """
+    Parse an event mix such as "BINARY_CHANGED=0.7,NODE_CREATED=0.3".
+
+    Parameters
+    ----------
+    spec : str
+        Comma-separated `eventType=weight` pairs.
+
+    Returns
+    -------
+    dict
+        Event type to weight.
+    """
+    mix = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        event_type, _, weight = part.partition("=")
+        mix[event_type.strip()] = float(weight or 1)
+    if not mix:
+        raise ValueError(f"Empty event mix: {spec!r}")
+    return mix
+
+
+def synthetic_events(
+    count: int,
+    mix: Optional[Dict[str, float]] = None,
+    body_size: int = 0,
+    system_ratio: float = 0.05,
+    nodes: int = 0,
+    seed: int = 1,
+) -> List[bytes]:
+    """
+    Generate encoded repository events.
+
+    Parameters
+    ----------
+    count : int
+        Number of events.
+    mix : dict, optional
+        Event type weights, by default `DEFAULT_MIX`.
+    body_size : int, optional
+        Minimum encoded size in bytes; bodies are padded with an
+        `x-padding` field the router ignores. 0 disables padding.
+    system_ratio : float, optional
+        Share of events under an excluded system folder.
+    nodes : int, optional
+        Number of distinct nodes to draw from, so repeated edits of
+        the same node can be simulated. 0 gives every event its own
+        node.
+    seed : int, optional
+        Random seed.
+
+    Returns
+    -------
+    list of bytes
+        Encoded event bodies.
+    """
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    event_types = list(mix)
+    weights = [mix[t] for t in event_types]
+    node_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(nodes)]
+
+    bodies = []
+    for index in range(count):
+        event_type = rng.choices(event_types, weights)[0]
+        mime_type = rng.choice(_MIME_TYPES)
+        folder = _SYSTEM_FOLDER if rng.random() < system_ratio else rng.choice(_FOLDERS)
+        node_id = rng.choice(node_ids) if node_ids else str(uuid.UUID(int=rng.getrandbits(128)))
+        name = f"doc-{index}.{_EXTENSIONS[mime_type]}"
+
+        event = {
+            "schemaVersion": 1,
+            "eventType": event_type,
+            "timestamp": 1_700_000_000_000 + index,
+            "nodeRef": f"workspace://SpacesStore/{node_id}",
+            "storeRef": "workspace://SpacesStore",
+            "parentNodeRef": "workspace://SpacesStore/parent",
+            "name": name,
+            "path": f"{folder}/{name}",
+            "mimeType": mime_type,
+            "size": rng.randint(1, 50_000_000),
+            "encoding": "UTF-8",
+            "versionLabel": f"1.{index}",
+            "creator": "admin",
+            "modifier": "jdoe",
+            "createdAt": 1_700_000_000_000,
+            "modifiedAt": 1_700_000_000_000 + index,
+            "nodeType": "cm:content",
+        }
+        body = json.dumps(event).encode("utf-8")
+        if len(body) < body_size:
+            event["x-padding"] = "x" * (body_size - len(body) - 16)
+            body = json.dumps(event).encode("utf-8")
+        bodies.append(body)
+
+    return bodies
+
+
+def load_events(path: str) -> List[bytes]:
+    """
+    Read a recorded event stream.
+
+    Parameters
+    ----------
+    path : str
+        JSON-lines file with one event object per line.
+
+    Returns
+    -------
+    list of bytes
+        Encoded event bodies.
+    """
+    with open(path, "rb") as f:
+        return [line.rstrip(b"\r\n") for line in f if line.strip()]
@@ -0,0 +1,564 @@
+"""
+bench.fake_broker
+=================
+
+In-process stand-in for ActiveMQ's STOMP connector.
+
+Implements the subset of STOMP 1.2 the router uses so that it can be
+exercised end to end without Alfresco or a real broker:
+
+- CONNECT / STOMP, DISCONNECT (with RECEIPT)
+- SUBSCRIBE / UNSUBSCRIBE with `client-individual`, `client` or
+  `auto` acknowledgement and `activemq.prefetchSize`
+- Durable topic subscriptions keyed by client-id and
+  `activemq.subscriptionName`; un-ACKed messages are redelivered
+  (with `redelivered:true`) when the subscriber reconnects
+- Competing consumers on queues, and ActiveMQ-style virtual topics:
+  a message sent to `/topic/<name>` is also copied to every existing
+  `/queue/Consumer.<group>.<name>` queue
+- MESSAGE, ACK, NACK
+- SEND to topics and queues
+- BEGIN / COMMIT / ABORT covering SEND, ACK and NACK
+- The statistics plugin's destination query: a SEND to
+  `/queue/ActiveMQ.Statistics.Destination.<name>` with a `reply-to`
+  header is answered with the queue's size (undelivered plus un-ACKed
+  messages), enqueue and consumer counts, encoded as ActiveMQ's
+  `jms-map-json` transformation does
+
+The broker is deliberately simple: all state lives in memory, there
+is no authentication and heart-beating is disabled.
+"""
+
+import itertools
+import json
+import logging
+import socket
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from core.frames import Frame, FrameParser, encode_frame
+
+logger = logging.getLogger("bench.broker")
+
+_STATISTICS_PREFIX = "/queue/ActiveMQ.Statistics.Destination."
+
+
+# ----------------------------------------------------------------------
+# Broker state
+# ----------------------------------------------------------------------
+class Message:
+    """
+    A message stored by the broker.
+    """
+
+    __slots__ = (
+        "message_id",
+        "destination",
+        "headers",
+        "body",
+        "redelivered",
+        "created",
+        "delivered",
+    )
+
+    def __init__(self, message_id: str, destination: str, headers: Dict[str, str], body: bytes):
+        self.message_id = message_id
+        self.destination = destination
+        self.headers = headers
+        self.body = body
+        self.redelivered = False
+        self.created = time.perf_counter()
+        self.delivered = 0.0
+
+
+class _Subscription:
+    """
+    Consumer state for one subscription.
+    """
+
+    def __init__(self, destination: str, sub_id: str, ack: str, prefetch: int):
+        self.destination = destination
+        self.sub_id = sub_id
+        self.ack = ack
+        self.prefetch = max(1, prefetch)
+        self.session: Optional["_Session"] = None
+        # Pending messages for topic subscriptions (queues share a deque)
+        self.pending: Deque[Message] = deque()
+        self.unacked: Dict[str, Message] = {}
+
+
+class _Session:
+    """
+    One client connection.
+    """
+
+    def __init__(self, broker: "FakeStompBroker", sock: socket.socket):
+        self.broker = broker
+        self.sock = sock
+        self.client_id: Optional[str] = None
+        self.subscriptions: Dict[str, _Subscription] = {}
+        self.transactions: Dict[str, List[Frame]] = {}
+        self._write_lock = threading.Lock()
+        self.closed = False
+
+    def send(self, frame: Frame) -> None:
+        data = encode_frame(frame)
+        with self._write_lock:
+            if self.closed:
+                return
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                self.closed = True
+
+    def run(self) -> None:
+        parser = FrameParser()
+        try:
+            while not self.closed:
+                data = self.sock.recv(65536)
+                if not data:
+                    break
+                for frame in parser.feed(data):
+                    self.broker._dispatch(self, frame)
+        except OSError:
+            pass
+        finally:
+            self.broker._close_session(self)
+
+
+class FakeStompBroker:
+    """
+    Threaded in-memory STOMP 1.2 broker.
+
+    Examples
+    --------
+    >>> broker = FakeStompBroker()
+    >>> host, port = broker.start()
+    >>> broker.publish("/topic/events", b'{"eventType": "BINARY_CHANGED"}')
+    >>> broker.stop()
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.on_ack: Optional[Callable[[Message], None]] = None
+        self.on_nack: Optional[Callable[[Message], None]] = None
+
+        self.sent_counts: Dict[str, int] = {}
+        self.sent_bytes: Dict[str, int] = {}
+        self.acked = 0
+        self.nacked = 0
+
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self._sessions: List[_Session] = []
+        # Durable topic subscriptions: (client-id, name) -> subscription
+        self._durable: Dict[Tuple[str, str], _Subscription] = {}
+        # Queues: destination -> messages not yet delivered
+        self._queues: Dict[str, Deque[Message]] = {}
+        self._server: Optional[socket.socket] = None
+        self._stopped = threading.Event()
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def start(self) -> Tuple[str, int]:
+        """
+        Start accepting connections.
+
+        Returns
+        -------
+        tuple of (str, int)
+            Bound host and port.
+        """
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((self.host, self.port))
+        server.listen()
+        self._server = server
+        self.port = server.getsockname()[1]
+
+        threading.Thread(target=self._accept, name="fake-broker", daemon=True).start()
+        return self.host, self.port
+
+    def stop(self) -> None:
+        """
+        Close all connections and stop accepting new ones.
+        """
+        self._stopped.set()
+        if self._server is not None:
+            self._server.close()
+        with self._lock:
+            sessions = list(self._sessions)
+        for session in sessions:
+            self.drop(session)
+
+    def drop(self, session: Optional[_Session] = None) -> None:
+        """
+        Abruptly close client connections, simulating a broker outage.
+
+        Parameters
+        ----------
+        session : _Session, optional
+            Connection to close; all connections when omitted.
+        """
+        with self._lock:
+            sessions = [session] if session else list(self._sessions)
+        for s in sessions:
+            s.closed = True
+            try:
+                s.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            s.sock.close()
+
+    # ------------------------------------------------------------------
+    # Test API
+    # ------------------------------------------------------------------
+    def publish(self, destination: str, body: bytes, headers: Optional[Dict[str, str]] = None) -> str:
+        """
+        Inject a message as if sent by an external producer.
+
+        Parameters
+        ----------
+        destination : str
+            Topic or queue.
+        body : bytes
+            Message body.
+        headers : dict, optional
+            Extra message headers.
+
+        Returns
+        -------
+        str
+            Assigned message id.
+        """
+        message = Message(f"ID:fake-{next(self._ids)}", destination, dict(headers or {}), body)
+        with self._lock:
+            self._route(message)
+        return message.message_id
+
+    def queue_depth(self, destination: str) -> int:
+        """
+        Number of undelivered messages on a queue.
+        """
+        with self._lock:
+            return len(self._queues.get(destination, ()))
+
+    def drain(self, destination: str) -> List[Message]:
+        """
+        Remove and return undelivered messages from a queue.
+        """
+        with self._lock:
+            queue = self._queues.get(destination)
+            if not queue:
+                return []
+            messages = list(queue)
+            queue.clear()
+            return messages
+
+    def wait_for_subscriber(self, destination: str, timeout: float = 5.0) -> bool:
+        """
+        Block until a consumer is attached to `destination`.
+
+        SUBSCRIBE has no reply frame, so clients cannot tell when the
+        broker has registered them.
+
+        Returns
+        -------
+        bool
+            True if a subscriber attached within `timeout` seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if any(
+                    sub.destination == destination and sub.session is not None
+                    for sub in self._all_subscriptions()
+                ):
+                    return True
+            time.sleep(0.005)
+        return False
+
+    def in_flight(self) -> int:
+        """
+        Number of delivered but un-ACKed messages.
+        """
+        with self._lock:
+            return sum(
+                len(sub.unacked)
+                for session in self._sessions
+                for sub in session.subscriptions.values()
+            )
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+    def _accept(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                sock, _ = self._server.accept()
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            session = _Session(self, sock)
+            with self._lock:
+                self._sessions.append(session)
+            threading.Thread(target=session.run, name="fake-broker-session", daemon=True).start()
+
+    def _close_session(self, session: _Session) -> None:
+        session.closed = True
+        with self._lock:
+            if session in self._sessions:
+                self._sessions.remove(session)
+            for sub in session.subscriptions.values():
+                self._detach(sub)
+        try:
+            session.sock.close()
+        except OSError:
+            pass
+
+    def _detach(self, sub: _Subscription) -> None:
+        """
+        Return un-ACKed messages for redelivery. Caller holds the lock.
+        """
+        for message in reversed(list(sub.unacked.values())):
+            message.redelivered = True
+            self._pending_for(sub).appendleft(message)
+        sub.unacked.clear()
+        sub.session = None
+
+    def _pending_for(self, sub: _Subscription) -> Deque[Message]:
+        if _is_topic(sub.destination):
+            return sub.pending
+        return self._queues.setdefault(sub.destination, deque())
+
+    def _dispatch(self, session: _Session, frame: Frame) -> None:
+        handler = getattr(self, f"_on_{frame.command.lower()}", None)
+        if handler is None:
+            session.send(Frame("ERROR", {"message": f"Unsupported command {frame.command}"}))
+            return
+
+        tx = frame.headers.get("transaction")
+        if tx and frame.command in ("SEND", "ACK", "NACK"):
+            with self._lock:
+                if tx not in session.transactions:
+                    session.send(Frame("ERROR", {"message": f"Unknown transaction {tx}"}))
+                    return
+                session.transactions[tx].append(frame)
+        else:
+            handler(session, frame)
+
+        receipt = frame.headers.get("receipt")
+        if receipt and frame.command != "CONNECT":
+            session.send(Frame("RECEIPT", {"receipt-id": receipt}))
+
+    def _on_connect(self, session: _Session, frame: Frame) -> None:
+        session.client_id = frame.headers.get("client-id")
+        session.send(
+            Frame(
+                "CONNECTED",
+                {"version": "1.2", "heart-beat": "0,0", "server": "fake-broker/1.0"},
+            )
+        )
+
+    _on_stomp = _on_connect
+
+    def _on_disconnect(self, session: _Session, frame: Frame) -> None:
+        receipt = frame.headers.get("receipt")
+        if receipt:
+            session.send(Frame("RECEIPT", {"receipt-id": receipt}))
+        self.drop(session)
+
+    def _on_subscribe(self, session: _Session, frame: Frame) -> None:
+        headers = frame.headers
+        destination = headers["destination"]
+        sub_id = headers["id"]
+        prefetch = int(headers.get("activemq.prefetchSize", "1000"))
+        name = headers.get("activemq.subscriptionName")
+
+        with self._lock:
+            sub = None
+            if name and _is_topic(destination) and session.client_id:
+                key = (session.client_id, name)
+                sub = self._durable.get(key)
+                if sub is None:
+                    sub = self._durable[key] = _Subscription(
+                        destination, sub_id, headers.get("ack", "auto"), prefetch
+                    )
+                sub.sub_id = sub_id
+                sub.prefetch = max(1, prefetch)
+            if sub is None:
+                sub = _Subscription(destination, sub_id, headers.get("ack", "auto"), prefetch)
+            if not _is_topic(destination):
+                self._queues.setdefault(destination, deque())
+            sub.session = session
+            session.subscriptions[sub_id] = sub
+            self._deliver(sub)
+
+    def _on_unsubscribe(self, session: _Session, frame: Frame) -> None:
+        with self._lock:
+            sub = session.subscriptions.pop(frame.headers.get("id"), None)
+            if sub is not None:
+                self._detach(sub)
+
+    def _on_send(self, session: _Session, frame: Frame) -> None:
+        headers = {
+            k: v
+            for k, v in frame.headers.items()
+            if k not in ("destination", "transaction", "receipt", "content-length")
+        }
+        message = Message(f"ID:fake-{next(self._ids)}", frame.headers["destination"], headers, frame.body)
+        with self._lock:
+            self._route(message)
+
+    def _on_ack(self, session: _Session, frame: Frame) -> None:
+        self._settle(session, frame.headers.get("id"), ok=True)
+
+    def _on_nack(self, session: _Session, frame: Frame) -> None:
+        self._settle(session, frame.headers.get("id"), ok=False)
+
+    def _on_begin(self, session: _Session, frame: Frame) -> None:
+        with self._lock:
+            session.transactions[frame.headers["transaction"]] = []
+
+    def _on_commit(self, session: _Session, frame: Frame) -> None:
+        with self._lock:
+            frames = session.transactions.pop(frame.headers["transaction"], [])
+        for queued in frames:
+            queued.headers.pop("transaction", None)
+            self._dispatch(session, queued)
+
+    def _on_abort(self, session: _Session, frame: Frame) -> None:
+        with self._lock:
+            session.transactions.pop(frame.headers["transaction"], None)
+
+    def _settle(self, session: _Session, ack_id: Optional[str], ok: bool) -> None:
+        with self._lock:
+            for sub in session.subscriptions.values():
+                message = sub.unacked.pop(ack_id, None)
+                if message is None:
+                    continue
+                if ok:
+                    self.acked += 1
+                    callback = self.on_ack
+                else:
+                    self.nacked += 1
+                    message.redelivered = True
+                    self._pending_for(sub).appendleft(message)
+                    callback = self.on_nack
+                self._deliver(sub)
+                break
+            else:
+                return
+        if callback is not None:
+            callback(message)
+
+    def _route(self, message: Message) -> None:
+        """
+        Store a message for its consumers. Caller holds the lock.
+        """
+        destination = message.destination
+        if destination.startswith(_STATISTICS_PREFIX):
+            self._reply_statistics(message)
+            return
+
+        self.sent_counts[destination] = self.sent_counts.get(destination, 0) + 1
+        self.sent_bytes[destination] = self.sent_bytes.get(destination, 0) + len(message.body)
+
+        if _is_topic(destination):
+            subs = [s for s in self._all_subscriptions() if s.destination == destination]
+            for sub in subs:
+                sub.pending.append(message)
+                if sub.session is not None:
+                    self._deliver(sub)
+
+            # Virtual topics: copy to every Consumer.<group>.<topic> queue
+            suffix = "." + destination[len("/topic/"):]
+            for queue in list(self._queues):
+                if queue.startswith("/queue/Consumer.") and queue.endswith(suffix):
+                    copy = Message(
+                        f"ID:fake-{next(self._ids)}", queue, message.headers, message.body
+                    )
+                    copy.created = message.created
+                    self._route(copy)
+            return
+
+        self._queues.setdefault(destination, deque()).append(message)
+        for sub in self._all_subscriptions():
+            if sub.destination == destination and sub.session is not None:
+                self._deliver(sub)
+
+    def _reply_statistics(self, request: Message) -> None:
+        """
+        Answer a statistics plugin query. Caller holds the lock.
+        """
+        reply_to = request.headers.get("reply-to")
+        if not reply_to:
+            return
+        queue = "/queue/" + request.destination[len(_STATISTICS_PREFIX):]
+        consumers = [
+            sub
+            for sub in self._all_subscriptions()
+            if sub.destination == queue and sub.session is not None
+        ]
+        size = len(self._queues.get(queue, ())) + sum(len(sub.unacked) for sub in consumers)
+        entries = [
+            {"string": ["destinationName", "queue://" + queue[len("/queue/"):]]},
+            {"string": "size", "long": size},
+            {"string": "enqueueCount", "long": self.sent_counts.get(queue, 0)},
+            {"string": "consumerCount", "long": len(consumers)},
+        ]
+        body = json.dumps({"map": {"entry": entries}}).encode("utf-8")
+        reply = Message(
+            f"ID:fake-{next(self._ids)}",
+            reply_to,
+            {"correlation-id": request.message_id},
+            body,
+        )
+        self._route(reply)
+
+    def _all_subscriptions(self):
+        seen = set()
+        for sub in self._durable.values():
+            seen.add(id(sub))
+            yield sub
+        for session in self._sessions:
+            for sub in session.subscriptions.values():
+                if id(sub) not in seen:
+                    yield sub
+
+    def _deliver(self, sub: _Subscription) -> None:
+        """
+        Push pending messages up to the prefetch limit. Caller holds the lock.
+        """
+        session = sub.session
+        if session is None or session.closed:
+            return
+        pending = self._pending_for(sub)
+        while pending and len(sub.unacked) < sub.prefetch:
+            message = pending.popleft()
+            ack_id = f"{message.message_id}:{next(self._ids)}"
+            headers = dict(message.headers)
+            headers.update(
+                {
+                    "subscription": sub.sub_id,
+                    "message-id": message.message_id,
+                    "destination": message.destination,
+                    "ack": ack_id,
+                }
+            )
+            if message.redelivered:
+                headers["redelivered"] = "true"
+            message.delivered = time.perf_counter()
+            if sub.ack == "auto":
+                self.acked += 1
+            else:
+                sub.unacked[ack_id] = message
+            session.send(Frame("MESSAGE", headers, message.body))
+
+
+def _is_topic(destination: str) -> bool:
+    return destination.startswith("/topic/")
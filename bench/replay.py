@@ -0,0 +1,94 @@
+"""
+bench.replay
+============
+
+Replay a frame capture through the router.
+
+Frames recorded with `CAPTURE_FILE` are injected into the event topic
+of the in-process fake broker, and the router consumes them through
+its normal subscription into `TopicRouterListener.on_message`. Because
+the broker enforces `ACTIVEMQ_PREFETCH`, prefetch, worker and route
+settings can be tuned against real traffic shapes.
+
+Pacing:
+- `--speed 1` replays with the recorded inter-arrival times
+- `--speed N` replays N times faster
+- `--speed 0` injects everything at once (as fast as possible)
+
+Results are reported as by `bench.run`.
+
+Usage
+-----
+    python -m bench.replay capture.jsonl.gz --speed 10 --workers 4
+    python -m bench.replay capture.jsonl.gz --speed 0 --prefetch 500 --json
+"""
+
+import argparse
+from typing import Dict, List
+
+from bench.run import add_common_args, configure, report, run_allocations, run_throughput
+
+# Headers assigned by the broker on delivery, re-created on replay
+_DELIVERY_HEADERS = frozenset(
+    {
+        "ack",
+        "content-length",
+        "destination",
+        "message-id",
+        "redelivered",
+        "subscription",
+    }
+)
+
+
+def _parse_args(argv) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("capture", help="capture file written via CAPTURE_FILE")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="replay speed multiplier (0: as fast as possible)",
+    )
+    parser.add_argument("--limit", type=int, default=0, help="replay at most this many frames")
+    add_common_args(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = _parse_args(argv)
+    stub = configure(args)
+
+    from core.capture import read_frames
+
+    bodies: List[bytes] = []
+    headers: List[Dict[str, str]] = []
+    timestamps: List[float] = []
+    for frame in read_frames(args.capture):
+        bodies.append(frame.body.encode("utf-8"))
+        headers.append(
+            {k: v for k, v in frame.headers.items() if k not in _DELIVERY_HEADERS}
+        )
+        timestamps.append(frame.timestamp)
+        if args.limit and len(bodies) >= args.limit:
+            break
+
+    if not bodies:
+        raise SystemExit(f"No frames in {args.capture}")
+
+    offsets = None
+    if args.speed > 0:
+        first = timestamps[0]
+        offsets = [(t - first) / args.speed for t in timestamps]
+
+    results = run_throughput(bodies, args.timeout, offsets=offsets, headers=headers)
+    if stub is not None:
+        results["alfresco_requests"] = dict(stub.requests)
+    if args.alloc_sample > 0:
+        sample = args.alloc_sample
+        results.update(run_allocations(bodies[:sample], headers[:sample]))
+    report(results, args.json)
+
+
+if __name__ == "__main__":
+    main()
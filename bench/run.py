@@ -0,0 +1,488 @@
+"""
+bench.run
+=========
+
+End-to-end router benchmark against the in-process fake broker.
+
+The router runs exactly as in production: a real `stomp.Connection12`
+connects to `bench.fake_broker`, subscribes to the event topic with
+client-individual ACKs and feeds `TopicRouterListener`. Events are
+injected on the broker side and the run ends when every event has been
+ACKed.
+
+Reported figures:
+- events/sec from first injection to last ACK
+- p50 / p99 latency from broker delivery to ACK (service time) and
+  from injection to ACK (including time queued at the broker)
+- messages and body bytes published per queue
+- allocations per event, measured with `tracemalloc` in a separate
+  inline pass so tracing overhead does not distort the timings
+
+Router settings are read from the environment as usual; the options
+below set the common ones before `settings` is imported.
+
+Usage
+-----
+    python -m bench.run --events 20000 --workers 4
+    python -m bench.run --mix BINARY_CHANGED=1 --body-size 4096
+    python -m bench.run --recorded events.jsonl --json
+    python -m bench.run --enrich autotag --alfresco-latency-ms 20
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+from bench.alfresco_stub import AlfrescoStub
+from bench.events import load_events, parse_mix, synthetic_events
+from bench.fake_broker import FakeStompBroker
+
+logger = logging.getLogger("bench.run")
+
+# Required router settings, filled in when not already set
+_ENV_DEFAULTS = {
+    "EVENT_TOPIC": "/topic/alfresco.events",
+    "ROUTER_CLIENT_ID": "bench-router",
+    "ROUTER_SUBSCRIPTION_NAME": "bench-subscription",
+    "AUTOTAG_QUEUE": "/queue/autotag",
+    "AUTOMETA_QUEUE": "/queue/autometa",
+    "VECTOR_QUEUE": "/queue/vector",
+}
+
+
+def _parse_args(argv) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    source = parser.add_argument_group("event stream")
+    source.add_argument("--events", type=int, default=10_000, help="number of synthetic events")
+    source.add_argument("--mix", type=parse_mix, default=None, help="eventType=weight,...")
+    source.add_argument("--body-size", type=int, default=0, help="pad bodies to this many bytes")
+    source.add_argument("--system-ratio", type=float, default=0.05, help="share of events under excluded paths")
+    source.add_argument("--nodes", type=int, default=0, help="distinct nodes (0: one per event)")
+    source.add_argument("--seed", type=int, default=1)
+    source.add_argument("--recorded", metavar="FILE", help="JSON-lines event stream instead of synthetic events")
+    add_common_args(parser)
+    return parser.parse_args(argv)
+
+
+def add_common_args(parser: argparse.ArgumentParser) -> None:
+    """
+    Add router and output options shared by the benchmark tools.
+    """
+    router = parser.add_argument_group("router")
+    router.add_argument("--runtime", choices=("threaded", "asyncio"), help="ROUTER_RUNTIME")
+    router.add_argument("--workers", type=int, help="ROUTER_WORKERS")
+    router.add_argument("--prefetch", type=int, help="ACTIVEMQ_PREFETCH")
+    router.add_argument("--batch", type=int, help="BATCH_MAX_EVENTS")
+    router.add_argument("--rules", metavar="FILE", help="ROUTE_RULES_FILE")
+    router.add_argument("--log-level", default="WARNING")
+    router.add_argument(
+        "--enrich",
+        metavar="ROUTES",
+        help="ENRICH_ROUTES, served by an in-process Alfresco stub",
+    )
+    router.add_argument(
+        "--alfresco-latency-ms",
+        type=float,
+        default=5.0,
+        help="response delay of the Alfresco stub",
+    )
+
+    output = parser.add_argument_group("output")
+    output.add_argument("--alloc-sample", type=int, default=1000, help="events traced for allocations (0: skip)")
+    output.add_argument("--timeout", type=float, default=300.0, help="seconds to wait for all ACKs")
+    output.add_argument("--json", action="store_true", help="print results as JSON")
+
+
+def configure(args: argparse.Namespace) -> Optional[AlfrescoStub]:
+    """
+    Export router settings and set up logging.
+
+    Must run before `settings` is first imported.
+
+    Returns
+    -------
+    AlfrescoStub or None
+        Running repository stub when `--enrich` is given.
+    """
+    for key, value in _ENV_DEFAULTS.items():
+        os.environ.setdefault(key, value)
+    # Never record benchmark traffic into a production capture file
+    os.environ.pop("CAPTURE_FILE", None)
+
+    overrides = {
+        "ROUTER_RUNTIME": args.runtime,
+        "ROUTER_WORKERS": args.workers,
+        "ACTIVEMQ_PREFETCH": args.prefetch,
+        "BATCH_MAX_EVENTS": args.batch,
+        "ROUTE_RULES_FILE": args.rules,
+    }
+    for key, value in overrides.items():
+        if value is not None:
+            os.environ[key] = str(value)
+
+    stub = None
+    if args.enrich:
+        stub = AlfrescoStub(latency_ms=args.alfresco_latency_ms)
+        stub.start()
+        os.environ["ALFRESCO_URL"] = stub.url
+        os.environ["ENRICH_ROUTES"] = args.enrich
+
+    # Logs go to stderr so results on stdout stay machine-readable
+    logging.basicConfig(
+        level=args.log_level.upper(),
+        stream=sys.stderr,
+        format="%(asctime)s | %(levelname)-8s | %(name)s | %(message)s",
+    )
+    return stub
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class _DiscardConnection:
+    """
+    Connection that accepts and drops every frame.
+
+    Used for the allocation pass, where only router work should be
+    traced. Requested receipts are confirmed immediately.
+    """
+
+    def __init__(self):
+        self._tx = 0
+        self._listeners = {}
+
+    def set_listener(self, name, listener):
+        self._listeners[name] = listener
+
+    def send(self, destination, body, content_type=None, headers=None, **kwargs):
+        pass
+
+    def send_frame(self, cmd, headers=None, body=""):
+        pass
+
+    def begin(self, transaction=None, headers=None, **kwargs):
+        self._tx += 1
+        return str(self._tx)
+
+    def commit(self, transaction=None, headers=None, **kwargs):
+        from stomp.utils import Frame
+
+        receipt = (headers or {}).get("receipt")
+        if receipt:
+            frame = Frame("RECEIPT", {"receipt-id": receipt})
+            for listener in self._listeners.values():
+                if hasattr(listener, "on_receipt"):
+                    listener.on_receipt(frame)
+
+    def abort(self, transaction=None, headers=None, **kwargs):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def disconnect(self, *args, **kwargs):
+        pass
+
+
+def _subscribe_headers() -> Dict[str, str]:
+    from settings import settings
+
+    return {
+        "activemq.subscriptionName": settings.ROUTER_SUBSCRIPTION_NAME,
+        "activemq.prefetchSize": str(settings.ACTIVEMQ_PREFETCH),
+    }
+
+
+def _start_threaded_router(host: str, port: int) -> Callable[[], None]:
+    """
+    Connect a stomp.py `TopicRouterListener` to the broker.
+
+    Returns
+    -------
+    callable
+        Stops the router and disconnects.
+    """
+    import stomp
+
+    from settings import settings
+    from core.listener import TopicRouterListener
+
+    conn = stomp.Connection12([(host, port)], heartbeats=(0, 0))
+    listener = TopicRouterListener(conn)
+    conn.set_listener("", listener)
+    conn.connect(wait=True, headers={"client-id": settings.ROUTER_CLIENT_ID})
+    conn.subscribe(
+        destination=settings.EVENT_TOPIC,
+        id=settings.ROUTER_SUBSCRIPTION_NAME,
+        ack="client-individual",
+        headers=_subscribe_headers(),
+    )
+
+    def stop() -> None:
+        listener.close()
+        conn.disconnect()
+
+    return stop
+
+
+def _start_asyncio_router(host: str, port: int) -> Callable[[], None]:
+    """
+    Run an `AsyncTopicRouter` on an event loop in a background thread.
+
+    Returns
+    -------
+    callable
+        Stops the router and disconnects.
+    """
+    from settings import settings
+    from core.aiorouter import AsyncTopicRouter
+    from core.aiostomp import AsyncStompConnection
+
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="bench-asyncio", daemon=True).start()
+
+    async def start():
+        conn = AsyncStompConnection(host, port)
+        router = AsyncTopicRouter(conn)
+        await conn.connect(headers={"client-id": settings.ROUTER_CLIENT_ID})
+        await conn.subscribe(
+            destination=settings.EVENT_TOPIC,
+            id=settings.ROUTER_SUBSCRIPTION_NAME,
+            ack="client-individual",
+            headers=_subscribe_headers(),
+        )
+        return conn, router, asyncio.create_task(router.run())
+
+    conn, router, task = asyncio.run_coroutine_threadsafe(start(), loop).result()
+
+    async def shutdown():
+        task.cancel()
+        await router.close()
+        await conn.disconnect()
+
+    def stop() -> None:
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+    return stop
+
+
+def run_throughput(
+    bodies: List[bytes],
+    timeout: float,
+    offsets: Optional[List[float]] = None,
+    headers: Optional[List[Dict[str, str]]] = None,
+) -> Dict[str, float]:
+    """
+    Route `bodies` through the router over a real STOMP connection.
+
+    Parameters
+    ----------
+    bodies : list of bytes
+        Encoded events.
+    timeout : float
+        Seconds to wait for every event to be ACKed.
+    offsets : list of float, optional
+        Seconds after the start at which each event is injected.
+        By default all events are injected at once.
+    headers : list of dict, optional
+        Message headers per event, by default a JSON content-type.
+
+    Returns
+    -------
+    dict
+        Throughput and latency figures.
+    """
+    from settings import settings
+
+    broker = FakeStompBroker()
+    host, port = broker.start()
+
+    service: List[float] = []
+    end_to_end: List[float] = []
+    done = threading.Event()
+    total = len(bodies)
+
+    def on_ack(message):
+        now = time.perf_counter()
+        service.append(now - message.delivered)
+        end_to_end.append(now - message.created)
+        if len(service) >= total:
+            done.set()
+
+    broker.on_ack = on_ack
+
+    if settings.ROUTER_RUNTIME == "asyncio":
+        stop_router = _start_asyncio_router(host, port)
+    else:
+        stop_router = _start_threaded_router(host, port)
+    if not broker.wait_for_subscriber(settings.EVENT_TOPIC):
+        raise RuntimeError("Router did not subscribe to the event topic")
+
+    default_headers = {"content-type": "application/json"}
+    start = time.perf_counter()
+    for index, body in enumerate(bodies):
+        if offsets is not None:
+            delay = start + offsets[index] - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        broker.publish(
+            settings.EVENT_TOPIC,
+            body,
+            headers[index] if headers is not None else default_headers,
+        )
+    completed = done.wait(timeout)
+    elapsed = time.perf_counter() - start
+
+    stop_router()
+    broker.stop()
+
+    if not completed:
+        logger.warning("Timed out with %d of %d events ACKed", len(service), total)
+
+    events = len(service)
+    return {
+        "events": events,
+        "nacked": broker.nacked,
+        "seconds": round(elapsed, 3),
+        "events_per_sec": round(events / elapsed, 1) if elapsed else 0.0,
+        "service_p50_ms": round(_percentile(service, 50) * 1000, 3),
+        "service_p99_ms": round(_percentile(service, 99) * 1000, 3),
+        "e2e_p50_ms": round(_percentile(end_to_end, 50) * 1000, 3),
+        "e2e_p99_ms": round(_percentile(end_to_end, 99) * 1000, 3),
+        "published": {
+            dest: count
+            for dest, count in broker.sent_counts.items()
+            if dest != settings.EVENT_TOPIC
+        },
+        "published_bytes": {
+            dest: size
+            for dest, size in broker.sent_bytes.items()
+            if dest != settings.EVENT_TOPIC
+        },
+    }
+
+
+def run_allocations(
+    bodies: List[bytes],
+    headers: Optional[List[Dict[str, str]]] = None,
+) -> Dict[str, float]:
+    """
+    Trace memory allocations while routing `bodies` inline.
+
+    Parameters
+    ----------
+    bodies : list of bytes
+        Encoded events.
+    headers : list of dict, optional
+        Message headers per event.
+
+    Returns
+    -------
+    dict
+        Mean transient peak and retained bytes per event.
+    """
+    from stomp.utils import Frame
+
+    from core.listener import TopicRouterListener
+
+    listener = TopicRouterListener(_DiscardConnection(), workers=0)
+    frames = [
+        Frame(
+            "MESSAGE",
+            {
+                **(headers[i] if headers is not None else {}),
+                "message-id": f"ID:alloc-{i}",
+                "subscription": "alloc",
+                "ack": f"ack-{i}",
+            },
+            body.decode("utf-8"),
+        )
+        for i, body in enumerate(bodies)
+    ]
+
+    # Warm caches (route dispatch, imports) outside the traced window
+    for frame in frames[: min(100, len(frames))]:
+        listener.on_message(frame)
+
+    peaks = []
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for frame in frames:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        listener.on_message(frame)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    listener.close()
+    return {
+        "alloc_peak_bytes_per_event": round(statistics.fmean(peaks), 1),
+        "alloc_retained_bytes_per_event": round(retained / len(frames), 1),
+    }
+
+
+def main(argv=None) -> None:
+    args = _parse_args(argv)
+    stub = configure(args)
+
+    if args.recorded:
+        bodies = load_events(args.recorded)
+    else:
+        bodies = synthetic_events(
+            args.events,
+            mix=args.mix,
+            body_size=args.body_size,
+            system_ratio=args.system_ratio,
+            nodes=args.nodes,
+            seed=args.seed,
+        )
+
+    results = run_throughput(bodies, args.timeout)
+    if stub is not None:
+        results["alfresco_requests"] = dict(stub.requests)
+    if args.alloc_sample > 0:
+        results.update(run_allocations(bodies[: args.alloc_sample]))
+    report(results, args.json)
+
+
+def report(results: Dict, as_json: bool = False) -> None:
+    """
+    Print benchmark results to stdout.
+
+    Parameters
+    ----------
+    results : dict
+        Figures returned by `run_throughput` / `run_allocations`.
+    as_json : bool, optional
+        Print a JSON document instead of a table.
+    """
+    if as_json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+        return
+
+    for key, value in results.items():
+        if isinstance(value, dict):
+            for dest, count in sorted(value.items()):
+                print(f"{key + ' ' + dest:<40} {count}")
+        else:
+            print(f"{key:<40} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+"""
+core.aiorouter
+==============
+
+Asyncio runtime for the event router.
+
+`AsyncTopicRouter` is the asyncio counterpart of
+`core.listener.TopicRouterListener`. It consumes frames from an
+`AsyncStompConnection` and handles each one in its own task, so many
+events can be in flight on a single thread while they wait on broker
+I/O or on asynchronous route hooks (`should_route_async`,
+`transform_async`).
+
+Both runtimes share the routes, the `RepoEvent` schema and the decode,
+validate and duplicate-suppression stages (`core.pipeline`), and
+follow the same "ACK on success or discard" strategy, including
+dead-lettering (`core.deadletter`).
+
+Concurrency is bounded by `settings.ROUTER_ASYNC_CONCURRENCY`; when
+the limit is reached no further frames are read, which lets the
+prefetch window apply backpressure to the broker. Tasks waiting for
+a rate-limited route (`core.ratelimit`) count against the limit, so
+throttling holds back deliveries the same way. Transaction batching,
+coalescing, worker threads, producer pools and the spool are specific
+to the threaded runtime and are ignored here. Route isolation is
+rejected: every publish shares the consumer's socket, so a blocked
+destination would delay ACKs and other routes regardless.
+
+After a reconnect the router is rebound to the new connection; events
+still in flight from the lost connection are cancelled and redelivered
+by the broker.
+"""
+
+import asyncio
+import json
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+from pydantic import ValidationError
+
+from settings import settings
+from core.cache import TTLCache
+from core.capture import FrameRecorder
+from core.deadletter import DeadLetterQueue
+from core.decoders import DecoderRegistry, UnsupportedSchemaVersion
+from core.encodings import route_encodings
+from core.lanes import LanePolicy
+from core.ratelimit import RateLimiter
+from core.enrichment import Enricher, EnrichmentError
+from core.metrics import (
+    DEAD_LETTERED,
+    FRAMES_ACKED,
+    FRAMES_DROPPED,
+    FRAMES_FAILED,
+    FRAMES_NACKED,
+    FRAMES_RECEIVED,
+    FRAMES_REDELIVERED,
+    ROUTE_PUBLISHED,
+    STAGE_SECONDS,
+)
+from core.pipeline import match_routes_async, needs_enrichment, prepare, route_messages
+from core.publisher import AsyncQueuePublisher
+from core.registry import RouteTable, load_routes
+
+logger = logging.getLogger("router.aiorouter")
+
+
+class AsyncTopicRouter:
+    """
+    Asyncio topic router for repository events.
+    """
+
+    def __init__(
+        self,
+        conn,
+        publisher: Optional[AsyncQueuePublisher] = None,
+        concurrency: Optional[int] = None,
+    ):
+        """
+        Initialize the router.
+
+        Parameters
+        ----------
+        conn : AsyncStompConnection
+            Connection subscribed to the event topic.
+        publisher : AsyncQueuePublisher, optional
+            Publisher for routed payloads. Defaults to publishing on
+            `conn`.
+        concurrency : int, optional
+            Maximum events handled at once. Defaults to
+            `settings.ROUTER_ASYNC_CONCURRENCY`.
+        """
+        self.conn = conn
+        self.publisher = publisher or AsyncQueuePublisher(conn)
+        self.concurrency = concurrency or settings.ROUTER_ASYNC_CONCURRENCY
+        self.recorder = (
+            FrameRecorder(settings.CAPTURE_FILE) if settings.CAPTURE_FILE else None
+        )
+        self.routes = load_routes()
+        self.table = RouteTable(self.routes)
+        logger.info("Loaded %d routes", len(self.routes))
+        # After loading routes, which may register schema decoders
+        self.decoders = DecoderRegistry.from_settings()
+
+        self.dedup = (
+            TTLCache(settings.DEDUP_WINDOW_SECONDS, settings.DEDUP_MAX_ENTRIES)
+            if settings.DEDUP_WINDOW_SECONDS > 0
+            else None
+        )
+
+        # Output encoding per route name
+        self.encodings = route_encodings(self.routes)
+
+        # Small / large lanes for lane routes
+        self.lanes = LanePolicy.from_settings(self.routes)
+
+        # Repository metadata lookups for enriched routes
+        self.enricher = Enricher.from_settings(self.routes)
+
+        # Token buckets for rate-limited routes
+        self.limiter = RateLimiter.from_settings(self.routes, self._queues)
+
+        # Destination of poison and crash-looping events
+        self.deadletters = DeadLetterQueue.from_settings()
+
+        ignored = [
+            name
+            for name, enabled in (
+                ("ROUTER_WORKERS", settings.ROUTER_WORKERS > 0),
+                ("BATCH_MAX_EVENTS", settings.BATCH_MAX_EVENTS > 0),
+                ("PUBLISHER_CONNECTIONS", settings.PUBLISHER_CONNECTIONS > 0),
+                ("COALESCE_QUIET_MS", settings.COALESCE_QUIET_MS > 0),
+                ("SPOOL_DIR", bool(settings.SPOOL_DIR)),
+            )
+            if enabled
+        ]
+        if ignored:
+            logger.warning(
+                "Settings not supported by the asyncio runtime are ignored: %s",
+                ", ".join(ignored),
+            )
+
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def run(self) -> None:
+        """
+        Consume frames until the connection closes or the task is
+        cancelled.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        def done(task: asyncio.Task) -> None:
+            self._tasks.discard(task)
+            semaphore.release()
+            if not task.cancelled() and task.exception() is not None:
+                # e.g. the connection closed while ACKing
+                logger.error("Event task failed: %s", task.exception())
+
+        async for frame in self.conn.frames():
+            FRAMES_RECEIVED.inc()
+            if frame.headers.get("redelivered") == "true":
+                FRAMES_REDELIVERED.inc()
+            if self.recorder is not None:
+                self.recorder.record(frame)
+
+            await semaphore.acquire()
+            task = asyncio.create_task(self._handle(frame))
+            self._tasks.add(task)
+            task.add_done_callback(done)
+
+    async def rebind(self, conn) -> None:
+        """
+        Switch to a new connection after a reconnect.
+
+        Must be called before the new connection subscribes. Tasks
+        still handling frames of the lost connection are cancelled,
+        since those frames can no longer be ACKed; the broker
+        redelivers them.
+
+        Parameters
+        ----------
+        conn : AsyncStompConnection
+            Newly connected connection.
+        """
+        abandoned = list(self._tasks)
+        for task in abandoned:
+            task.cancel()
+        if abandoned:
+            await asyncio.gather(*abandoned, return_exceptions=True)
+            FRAMES_DROPPED.inc(len(abandoned), reason="stale")
+
+        self.conn = conn
+        self.publisher.rebind(conn)
+        logger.warning(
+            "Router rebound to new connection",
+            extra={"abandoned_frames": len(abandoned)},
+        )
+
+    async def close(self) -> None:
+        """
+        Release events waiting for a rate limit, wait for in-flight
+        events, then stop the enricher and close the capture file.
+
+        Must be called before the connection is closed so that
+        in-flight frames can still be ACKed.
+        """
+        if self.limiter is not None:
+            self.limiter.close()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.enricher is not None:
+            await asyncio.to_thread(self.enricher.close)
+        if self.recorder is not None:
+            self.recorder.close()
+
+    async def _handle(self, frame) -> None:
+        """
+        Process a single STOMP message.
+
+        Follows the same flow as `TopicRouterListener._handle`, using
+        the asynchronous route hooks and publishing to all matched
+        destinations concurrently.
+
+        Parameters
+        ----------
+        frame : Frame
+            MESSAGE frame.
+        """
+        if self.deadletters is not None:
+            message = self.deadletters.exhausted(frame)
+            if message is not None:
+                await self._forward(frame, message)
+                return
+
+        try:
+            prepared = prepare(frame.body, self.table, self.decoders, self.dedup)
+            if prepared is None:
+                await self._acknowledge("ACK", frame)
+                return
+            event, candidates, dedup_key = prepared
+
+            with STAGE_SECONDS.time(stage="route"):
+                matches = await match_routes_async(event, candidates)
+                # Looked up once and shared by all enriched routes
+                enrichment = (
+                    await self._enrich(event)
+                    if needs_enrichment(matches, self.enricher)
+                    else None
+                )
+                messages, limited = route_messages(
+                    event,
+                    matches,
+                    self.encodings,
+                    self.enricher,
+                    enrichment,
+                    self.lanes,
+                    self.limiter,
+                )
+
+            for name in limited:
+                await self.limiter.wait_async(name)
+
+            if not messages:
+                FRAMES_DROPPED.inc(reason="unmatched")
+            else:
+                with STAGE_SECONDS.time(stage="publish"):
+                    await self._publish(messages)
+
+            # ACK only after full success; remember the event only once published
+            await self._acknowledge("ACK", frame)
+            # One message per match, in order
+            for match in matches:
+                ROUTE_PUBLISHED.inc(route=match.route.name)
+            if dedup_key is not None and messages:
+                self.dedup.put(dedup_key)
+
+        except EnrichmentError as e:
+            if not await self._dead_letter(frame, e):
+                logger.error("Enrichment failed, NACK (redelivery): %s", e)
+                await self._acknowledge("NACK", frame)
+
+        except json.JSONDecodeError as e:
+            if not await self._dead_letter(frame, e):
+                logger.error("Invalid JSON payload, ACK & drop", exc_info=e)
+                FRAMES_DROPPED.inc(reason="invalid_json")
+                await self._acknowledge("ACK", frame)
+
+        except ValidationError as e:
+            if not await self._dead_letter(frame, e):
+                logger.error("Invalid event schema, ACK & drop", exc_info=e)
+                FRAMES_DROPPED.inc(reason="invalid_schema")
+                await self._acknowledge("ACK", frame)
+
+        except UnsupportedSchemaVersion as e:
+            if not await self._dead_letter(frame, e):
+                logger.error("%s, ACK & drop", e)
+                FRAMES_DROPPED.inc(reason="unsupported_version")
+                await self._acknowledge("ACK", frame)
+
+        except Exception as e:
+            FRAMES_FAILED.inc()
+            if self.deadletters is None:
+                logger.exception("Router failure, NO ACK (redelivery)")
+            elif not await self._dead_letter(frame, e):
+                # Redeliver now so that the delivery budget is used up
+                logger.exception("Router failure, NACK (redelivery)")
+                await self._acknowledge("NACK", frame)
+
+    async def _dead_letter(self, frame, error: Exception) -> bool:
+        """
+        Forward a failed frame to the dead-letter queue if it is
+        poison or has used up its delivery budget.
+
+        Parameters
+        ----------
+        frame : Frame
+            Source MESSAGE frame.
+        error : Exception
+            Processing error.
+
+        Returns
+        -------
+        bool
+            True if the frame was handed to the dead-letter queue;
+            False if there is none or the frame should be redelivered.
+        """
+        if self.deadletters is None:
+            return False
+        message = self.deadletters.failed(frame, error)
+        if message is None:
+            return False
+        await self._forward(frame, message)
+        return True
+
+    async def _forward(self, frame, message) -> None:
+        """
+        Publish a dead-letter message and ACK its source frame.
+
+        If the publish fails the frame is NACKed or left un-ACKed; on
+        redelivery it is forwarded again without being processed.
+        """
+        queue = self.deadletters.queue
+        try:
+            await self._publish([(queue, message)])
+            await self._acknowledge("ACK", frame)
+        except Exception:
+            logger.exception("Dead-lettering failed, NO ACK (redelivery)")
+            return
+        DEAD_LETTERED.inc(reason=message.headers["dlq-reason"])
+
+    def _queues(self, route) -> Tuple[str, ...]:
+        """
+        Every destination queue a route can publish to.
+        """
+        return self.lanes.queues(route) if self.lanes is not None else (route.queue,)
+
+    async def _enrich(self, event) -> Optional[Dict]:
+        """
+        Look up repository metadata without blocking the event loop.
+
+        Parameters
+        ----------
+        event : CompactEvent
+            Validated event.
+
+        Returns
+        -------
+        dict or None
+            Enrichment dict, or None if the lookup failed and
+            enrichment is optional.
+
+        Raises
+        ------
+        EnrichmentError
+            If the lookup failed and `settings.ENRICH_REQUIRED` is set.
+        """
+        with STAGE_SECONDS.time(stage="enrich"):
+            try:
+                return await asyncio.wait_for(
+                    asyncio.wrap_future(self.enricher.submit(event)),
+                    self.enricher.timeout,
+                )
+            except Exception as e:
+                if settings.ENRICH_REQUIRED:
+                    raise EnrichmentError(str(e) or type(e).__name__) from e
+                logger.warning(
+                    "Enrichment failed, publishing without metadata: %s",
+                    str(e) or type(e).__name__,
+                    extra={"nodeRef": event.nodeRef},
+                )
+                return None
+
+    async def _publish(self, messages: List[Tuple[str, Dict]]) -> None:
+        """
+        Publish payloads to all destinations concurrently.
+
+        A publish failure propagates and leaves the frame un-ACKed, as
+        in the threaded runtime.
+
+        Parameters
+        ----------
+        messages : list of (str, dict)
+            Destination queue and payload pairs.
+        """
+        if len(messages) == 1:
+            await self.publisher.publish(*messages[0])
+        else:
+            await asyncio.gather(
+                *(self.publisher.publish(d, p) for d, p in messages)
+            )
+
+    async def _acknowledge(self, command: str, frame) -> None:
+        """
+        Send an ACK or NACK for a frame.
+
+        Parameters
+        ----------
+        command : str
+            "ACK" or "NACK".
+        frame : Frame
+            Source MESSAGE frame.
+        """
+        headers = {
+            "id": frame.headers.get("ack"),
+            "subscription": frame.headers.get("subscription"),
+        }
+        with STAGE_SECONDS.time(stage="ack"):
+            await self.conn.send_frame(command, headers=headers)
+        (FRAMES_ACKED if command == "ACK" else FRAMES_NACKED).inc()
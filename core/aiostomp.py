@@ -0,0 +1,370 @@
+"""
+core.aiostomp
+=============
+
+Minimal asyncio STOMP 1.2 client for the asyncio runtime.
+
+Implements the subset of STOMP the router needs: CONNECT, SUBSCRIBE,
+SEND, ACK / NACK, BEGIN / COMMIT / ABORT and DISCONNECT with receipts,
+plus heart-beating in both directions. Received MESSAGE frames are
+delivered through the `frames()` async iterator.
+
+The connection mirrors the parts of the stomp.py API the router uses
+(`send`, `send_frame`, `begin`, `commit`, `abort`, `is_connected`),
+except that every method that writes is a coroutine.
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from typing import AsyncIterator, Dict, Optional, Tuple, Union
+
+from core.frames import Frame, FrameParser, encode_frame
+
+logger = logging.getLogger("router.aiostomp")
+
+# Queued to end the `frames()` iterator when the connection closes
+_CLOSED = object()
+
+
+class StompError(ConnectionError):
+    """
+    Raised when the broker rejects a frame or the connection is lost.
+    """
+
+
+class AsyncStompConnection:
+    """
+    Single asyncio STOMP 1.2 connection.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        heartbeats: Tuple[int, int] = (0, 0),
+    ):
+        """
+        Parameters
+        ----------
+        host : str
+            Broker host.
+        port : int
+            Broker STOMP port.
+        heartbeats : tuple of (int, int), optional
+            Outgoing and incoming heart-beat intervals in milliseconds,
+            as for `stomp.Connection12`. 0 disables a direction.
+        """
+        self.host = host
+        self.port = port
+        self.heartbeats = heartbeats
+
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._messages: "asyncio.Queue" = asyncio.Queue()
+        self._receipts: Dict[str, asyncio.Future] = {}
+        self._connected: Optional[asyncio.Future] = None
+        self._ids = itertools.count(1)
+        self._tasks = []
+        self._last_received = 0.0
+        self._closed = True
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def is_connected(self) -> bool:
+        """
+        Whether the connection is established and open.
+        """
+        return not self._closed
+
+    async def connect(
+        self,
+        login: Optional[str] = None,
+        passcode: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: float = 10.0,
+    ) -> None:
+        """
+        Open the socket and perform the STOMP handshake.
+
+        Parameters
+        ----------
+        login : str, optional
+            Broker username.
+        passcode : str, optional
+            Broker password.
+        headers : dict, optional
+            Extra CONNECT headers, e.g. `client-id`.
+        timeout : float, optional
+            Seconds to wait for CONNECTED.
+
+        Raises
+        ------
+        StompError
+            If the broker answers with ERROR or closes the connection.
+        """
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), timeout
+        )
+        self._closed = False
+        self._last_received = time.monotonic()
+
+        loop = asyncio.get_running_loop()
+        self._connected = loop.create_future()
+        self._tasks = [loop.create_task(self._read_loop(), name="stomp-reader")]
+
+        connect_headers = {
+            "accept-version": "1.2",
+            "host": self.host,
+            "heart-beat": f"{self.heartbeats[0]},{self.heartbeats[1]}",
+        }
+        if login is not None:
+            connect_headers["login"] = login
+        if passcode is not None:
+            connect_headers["passcode"] = passcode
+        connect_headers.update(headers or {})
+
+        await self._write(Frame("CONNECT", connect_headers))
+        connected = await asyncio.wait_for(self._connected, timeout)
+        self._start_heartbeats(connected.headers.get("heart-beat", "0,0"))
+
+    async def disconnect(self, timeout: float = 5.0) -> None:
+        """
+        Send DISCONNECT, wait for its receipt and close the socket.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Seconds to wait for the receipt.
+        """
+        if self._closed:
+            return
+        try:
+            await self._request(Frame("DISCONNECT", {}), timeout)
+        except (StompError, asyncio.TimeoutError, OSError):
+            logger.debug("No receipt for DISCONNECT")
+        await self._close()
+
+    # ------------------------------------------------------------------
+    # Frames
+    # ------------------------------------------------------------------
+    async def subscribe(
+        self,
+        destination: str,
+        id: str,  # noqa: A002 - matches stomp.py
+        ack: str = "auto",
+        headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """
+        Subscribe to a destination and wait for the broker's receipt.
+
+        Parameters
+        ----------
+        destination : str
+            Topic or queue.
+        id : str
+            Subscription id.
+        ack : str, optional
+            Acknowledgement mode.
+        headers : dict, optional
+            Extra SUBSCRIBE headers.
+        """
+        frame_headers = {"destination": destination, "id": id, "ack": ack}
+        frame_headers.update(headers or {})
+        await self._request(Frame("SUBSCRIBE", frame_headers))
+
+    async def send(
+        self,
+        destination: str,
+        body: Union[str, bytes],
+        content_type: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """
+        Send a message.
+
+        Parameters
+        ----------
+        destination : str
+            Queue or topic.
+        body : str or bytes
+            Message body; str is encoded as UTF-8.
+        content_type : str, optional
+            Content type header.
+        headers : dict, optional
+            Extra message headers.
+        """
+        frame_headers = {"destination": destination}
+        if content_type:
+            frame_headers["content-type"] = content_type
+        frame_headers.update(headers or {})
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        await self._write(Frame("SEND", frame_headers, body))
+
+    async def send_frame(self, cmd: str, headers: Optional[Dict[str, str]] = None, body: bytes = b"") -> None:
+        """
+        Send an arbitrary frame (e.g. ACK or NACK).
+        """
+        await self._write(Frame(cmd, dict(headers or {}), body))
+
+    async def begin(self) -> str:
+        """
+        Start a transaction.
+
+        Returns
+        -------
+        str
+            Transaction id.
+        """
+        tx = f"tx-{next(self._ids)}"
+        await self._write(Frame("BEGIN", {"transaction": tx}))
+        return tx
+
+    async def commit(self, transaction: str) -> None:
+        """
+        Commit a transaction and wait for the broker's receipt.
+        """
+        await self._request(Frame("COMMIT", {"transaction": transaction}))
+
+    async def abort(self, transaction: str) -> None:
+        """
+        Abort a transaction.
+        """
+        await self._write(Frame("ABORT", {"transaction": transaction}))
+
+    async def frames(self) -> AsyncIterator[Frame]:
+        """
+        Iterate over received MESSAGE frames until the connection closes.
+
+        Yields
+        ------
+        Frame
+            MESSAGE frame; the body is bytes.
+        """
+        while True:
+            frame = await self._messages.get()
+            if frame is _CLOSED:
+                return
+            yield frame
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+    async def _write(self, frame: Frame) -> None:
+        if self._closed:
+            raise StompError("Not connected")
+        self._writer.write(encode_frame(frame))
+        await self._writer.drain()
+
+    async def _request(self, frame: Frame, timeout: float = 30.0) -> Frame:
+        """
+        Send a frame with a receipt header and wait for the receipt.
+        """
+        receipt = f"r-{next(self._ids)}"
+        frame.headers["receipt"] = receipt
+        future = asyncio.get_running_loop().create_future()
+        self._receipts[receipt] = future
+        try:
+            await self._write(frame)
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._receipts.pop(receipt, None)
+
+    async def _read_loop(self) -> None:
+        parser = FrameParser()
+        try:
+            while True:
+                data = await self._reader.read(65536)
+                if not data:
+                    break
+                self._last_received = time.monotonic()
+                for frame in parser.feed(data):
+                    self._on_frame(frame)
+        except (OSError, asyncio.IncompleteReadError) as e:
+            logger.warning("STOMP connection lost: %s", e)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            await self._close()
+
+    def _on_frame(self, frame: Frame) -> None:
+        command = frame.command
+        if command == "MESSAGE":
+            self._messages.put_nowait(frame)
+        elif command == "RECEIPT":
+            future = self._receipts.get(frame.headers.get("receipt-id"))
+            if future is not None and not future.done():
+                future.set_result(frame)
+        elif command == "CONNECTED":
+            if self._connected is not None and not self._connected.done():
+                self._connected.set_result(frame)
+        elif command == "ERROR":
+            message = frame.headers.get("message", "")
+            logger.error(
+                "Broker error: %s",
+                message,
+                extra={"body": frame.body.decode("utf-8", errors="replace")},
+            )
+            error = StompError(message or "Broker error")
+            receipt = self._receipts.get(frame.headers.get("receipt-id"))
+            for future in ([receipt] if receipt else []) + [self._connected]:
+                if future is not None and not future.done():
+                    future.set_exception(error)
+
+    def _start_heartbeats(self, server_heartbeats: str) -> None:
+        """
+        Start heart-beat tasks as negotiated with the broker.
+        """
+        sx, sy = (int(v) for v in server_heartbeats.split(","))
+        cx, cy = self.heartbeats
+        loop = asyncio.get_running_loop()
+
+        if cx and sy:
+            interval = max(cx, sy) / 1000.0
+            self._tasks.append(loop.create_task(self._send_heartbeats(interval)))
+        if cy and sx:
+            interval = max(cy, sx) / 1000.0
+            self._tasks.append(loop.create_task(self._check_heartbeats(interval)))
+
+    async def _send_heartbeats(self, interval: float) -> None:
+        while not self._closed:
+            await asyncio.sleep(interval)
+            try:
+                self._writer.write(b"\n")
+                await self._writer.drain()
+            except OSError:
+                return
+
+    async def _check_heartbeats(self, interval: float) -> None:
+        # Allow twice the negotiated interval before declaring the broker dead
+        while not self._closed:
+            await asyncio.sleep(interval)
+            if time.monotonic() - self._last_received > 2 * interval:
+                logger.warning("STOMP heartbeat timeout detected")
+                await self._close()
+                return
+
+    async def _close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+
+        current = asyncio.current_task()
+        for task in self._tasks:
+            if task is not current:
+                task.cancel()
+
+        error = StompError("Connection closed")
+        for future in list(self._receipts.values()) + [self._connected]:
+            if future is not None and not future.done():
+                future.set_exception(error)
+
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except OSError:
+            pass
+        self._messages.put_nowait(_CLOSED)
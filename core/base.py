@@ -16,9 +16,9 @@ Design principles:
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict
+from typing import Dict, FrozenSet, Optional, Tuple
 
-from core.schema import RepoEvent
+from core.schema import CompactEvent
 
 
 class BaseRoute(ABC):
@@ -33,8 +33,59 @@ class BaseRoute(ABC):
 
     Concrete implementations are expected to be stateless and
     side-effect free.
+
+    Attributes
+    ----------
+    event_types : frozenset of str, optional
+        Event types this route can ever accept. The listener uses the
+        union over all routes to discard other events before full
+        schema validation. None (the default) means any event type.
+    mime_types : frozenset of str, optional
+        MIME types this route can accept; `major/*` wildcards are
+        allowed. None (the default) means any MIME type.
+    include_prefixes : tuple of str
+        If non-empty, only events whose path starts with one of these
+        prefixes are offered to the route.
+    exclude_prefixes : tuple of str
+        Events whose path starts with one of these prefixes are never
+        offered to the route.
+    publish_timeout_ms : int, optional
+        Time allowed for this route's destination to confirm a publish
+        when route isolation is enabled. Defaults to
+        `settings.ROUTE_PUBLISH_TIMEOUT_MS`.
+    coalesce : bool
+        Hold events for the same node and publish only the latest one
+        after `settings.COALESCE_QUIET_MS` of quiet. Can also be
+        enabled per route name via `settings.COALESCE_ROUTES`.
+    enrich : bool
+        Add repository metadata (node properties, aspects, parent) to
+        the payload under `enrichment`; see `core.enrichment`. Can
+        also be enabled per route name via `settings.ENRICH_ROUTES`.
+    encoding : str, optional
+        Output encoding of published payloads, e.g. "json-compact" or
+        "msgpack+zstd"; see `core.encodings`. Defaults to
+        `settings.PAYLOAD_ENCODING`; `settings.ROUTE_ENCODINGS` takes
+        precedence.
+    lanes : bool
+        Split the route's events into small / large lanes by size,
+        MIME type and path, via JMS priority and/or lane queues; see
+        `core.lanes`. Can also be enabled per route name via
+        `settings.LANE_ROUTES`.
+
+    The matching attributes (event, MIME and path filters) are
+    compiled once by the route registry; see `core.registry.RouteTable`.
     """
 
+    event_types: Optional[FrozenSet[str]] = None
+    mime_types: Optional[FrozenSet[str]] = None
+    include_prefixes: Tuple[str, ...] = ()
+    exclude_prefixes: Tuple[str, ...] = ()
+    publish_timeout_ms: Optional[int] = None
+    coalesce: bool = False
+    enrich: bool = False
+    encoding: Optional[str] = None
+    lanes: bool = False
+
     @property
     @abstractmethod
     def name(self) -> str:
@@ -71,7 +122,7 @@ class BaseRoute(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    def should_route(self, event: RepoEvent) -> bool:
+    def should_route(self, event: CompactEvent) -> bool:
         """
         Determine whether the given event should be routed.
 
@@ -80,7 +131,7 @@ class BaseRoute(ABC):
 
         Parameters
         ----------
-        event : RepoEvent
+        event : CompactEvent
             Incoming repository event.
 
         Returns
@@ -91,13 +142,19 @@ class BaseRoute(ABC):
         """
         raise NotImplementedError
 
-    def transform(self, event: RepoEvent) -> Dict:
+    def transform(self, event: CompactEvent) -> Dict:
         """
         Transform the event payload before publishing.
 
         By default, this method returns the raw event model
-        as a dictionary. Subclasses may override this method
-        to enrich, filter, or reshape the payload.
+        as a dictionary plus any `extra_fields`. Subclasses may
+        override this method to enrich, filter, or reshape the
+        payload.
+
+        Routes that keep this default share a single serialization of
+        the event with every other such route; a route that only adds
+        fields should override `extra_fields` instead, so it keeps
+        sharing it.
 
         Examples
         --------
@@ -108,7 +165,74 @@ class BaseRoute(ABC):
 
         Parameters
         ----------
-        event : RepoEvent
+        event : CompactEvent
+            Incoming repository event.
+
+        Returns
+        -------
+        dict
+            Transformed event payload.
+        """
+        payload = event.model_dump(by_alias=True)
+        payload.update(self.extra_fields(event))
+        return payload
+
+    def extra_fields(self, event: CompactEvent) -> Dict:
+        """
+        Fields added to the default payload.
+
+        Used only while `transform` is not overridden. The fields are
+        appended to the event's shared serialization, so the event is
+        not encoded again for this route. Fields that replace event
+        fields are supported but force a separate serialization.
+
+        Parameters
+        ----------
+        event : CompactEvent
+            Incoming repository event.
+
+        Returns
+        -------
+        dict
+            JSON-serializable fields; empty by default.
+        """
+        return {}
+
+    # ------------------------------------------------------------------
+    # Asyncio runtime hooks
+    # ------------------------------------------------------------------
+    async def should_route_async(self, event: CompactEvent) -> bool:
+        """
+        Asynchronous variant of `should_route`.
+
+        Used by the asyncio runtime (`ROUTER_RUNTIME=asyncio`). The
+        default delegates to `should_route`; override it when the
+        decision needs I/O, so the event loop keeps serving other
+        events while this one waits.
+
+        Parameters
+        ----------
+        event : CompactEvent
+            Incoming repository event.
+
+        Returns
+        -------
+        bool
+            True if the event should be routed.
+        """
+        return self.should_route(event)
+
+    async def transform_async(self, event: CompactEvent) -> Dict:
+        """
+        Asynchronous variant of `transform`.
+
+        Used by the asyncio runtime. The default delegates to
+        `transform`; override it for transformations that await I/O,
+        such as enrichment lookups.
+
+        Parameters
+        ----------
+        event : CompactEvent
             Incoming repository event.
 
         Returns
@@ -116,4 +240,4 @@ class BaseRoute(ABC):
         dict
             Transformed event payload.
         """
-        return event.model_dump(by_alias=True)
+        return self.transform(event)
@@ -0,0 +1,275 @@
+"""
+core.batcher
+============
+
+Transactional batching of publishes and ACKs.
+
+By default every routed event costs one persistent SEND per matching
+route plus one ACK, each of which is synced by the broker on its own.
+In batching mode, completed events are buffered and written in groups
+inside a single STOMP transaction:
+
+    BEGIN -> SEND ... -> ACK ... -> COMMIT
+
+A batch is committed when it reaches a configured number of events or
+when the oldest buffered event has waited for a configured delay.
+
+Delivery guarantees are unchanged: a source frame is only ACKed in the
+same transaction that publishes its payloads. COMMIT is sent with a
+receipt, and a batch only counts as committed once the broker has
+confirmed it. If any part of the batch fails, or the broker rejects or
+does not confirm the COMMIT, the transaction is aborted and the batch's
+frames are NACKed outside of it, so the broker redelivers them instead
+of holding them in the prefetch window. When publishing through a pool
+of producer connections, the payloads are committed in a producer-side
+transaction before the ACK transaction is committed.
+
+Commits run on the batcher's own thread: the receipt is delivered on
+stomp.py's receiver thread, which must not be the one waiting for it
+(see `core.receipts`).
+
+Note
+----
+Batching only helps when the broker is allowed to deliver more than
+one unacknowledged frame, i.e. `ACTIVEMQ_PREFETCH` should be at least
+the batch size.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from core.metrics import FRAMES_ACKED, FRAMES_NACKED, STAGE_SECONDS
+from core.receipts import ReceiptWaiter
+
+logger = logging.getLogger("router.batcher")
+
+
+class TransactionBatcher:
+    """
+    Groups event deliveries and their ACKs into STOMP transactions.
+
+    Thread-safe: deliveries may be added from any thread, including
+    stomp.py's receiver thread. Commits run on the batcher thread.
+    """
+
+    def __init__(
+        self,
+        conn,
+        publisher,
+        max_events: int,
+        max_delay_ms: int,
+    ):
+        """
+        Initialize the batcher and start its flush timer.
+
+        Parameters
+        ----------
+        conn : Any
+            Active STOMP connection used for BEGIN/ACK/COMMIT.
+        publisher : QueuePublisher
+            Publisher used to send payloads within the transaction.
+        max_events : int
+            Number of events that triggers an immediate commit.
+        max_delay_ms : int
+            Maximum time an event may wait in the buffer.
+        """
+        self.conn = conn
+        self.publisher = publisher
+        self.max_events = max(1, max_events)
+        self.max_delay = max_delay_ms / 1000.0
+
+        self._pending: List[Tuple[Sequence[Tuple[str, Dict]], Dict, Optional[Callable]]] = []
+        self._oldest: float = 0.0
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._full = threading.Event()
+        self._stopped = threading.Event()
+
+        self._receipts = ReceiptWaiter()
+        conn.set_listener("batcher", self._receipts)
+
+        self._timer = threading.Thread(
+            target=self._run_timer,
+            name="router-batcher",
+            daemon=True,
+        )
+        self._timer.start()
+
+    def add(
+        self,
+        messages: Sequence[Tuple[str, Dict]],
+        ack_headers: Dict,
+        on_commit: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """
+        Buffer a completed event; a full batch wakes the batcher thread.
+
+        Parameters
+        ----------
+        messages : sequence of (str, dict)
+            Destination queue and payload pairs to publish.
+        ack_headers : dict
+            Headers of the ACK frame for the source message
+            (`id` and `subscription`).
+        on_commit : callable, optional
+            Invoked after the event's transaction has committed.
+        """
+        with self._lock:
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append((messages, ack_headers, on_commit))
+            full = len(self._pending) >= self.max_events
+
+        if full:
+            self._full.set()
+
+    def flush(self) -> None:
+        """
+        Commit all buffered events immediately.
+        """
+        with self._lock:
+            conn, batch = self.conn, self._take()
+
+        if batch:
+            self._commit(batch, conn)
+
+    def close(self) -> None:
+        """
+        Stop the batcher thread and commit any remaining events.
+        """
+        self._stopped.set()
+        self._full.set()
+        self._timer.join()
+        self.flush()
+
+    def rebind(self, conn) -> None:
+        """
+        Switch to a new connection after a reconnect.
+
+        Buffered events belong to frames of the lost connection, which
+        the broker redelivers; they are discarded unpublished.
+
+        Parameters
+        ----------
+        conn : Any
+            Newly connected STOMP connection.
+        """
+        with self._commit_lock, self._lock:
+            discarded = self._take()
+            self.conn = conn
+            conn.set_listener("batcher", self._receipts)
+        if discarded:
+            self._discard(discarded)
+
+    def _discard(self, batch: List) -> None:
+        """
+        Drop a batch taken from a lost connection unpublished.
+        """
+        logger.warning(
+            "Discarded batched events of the lost connection",
+            extra={"events": len(batch)},
+        )
+
+    def _take(self) -> List:
+        """
+        Detach the current buffer. Caller must hold `_lock`.
+        """
+        batch, self._pending = self._pending, []
+        return batch
+
+    def _commit(self, batch: List, conn) -> None:
+        """
+        Write a batch inside a single STOMP transaction.
+
+        Parameters
+        ----------
+        batch : list
+            Buffered (messages, ack_headers, on_commit) entries.
+        conn : Any
+            Connection the batch was taken on. If the batcher has been
+            rebound since, the batch's ack ids are unknown to the new
+            connection and it is discarded like in `rebind`.
+        """
+        start = time.perf_counter()
+
+        with self._commit_lock:
+            if conn is not self.conn:
+                self._discard(batch)
+                return
+            tx = self.conn.begin()
+            try:
+                self.publisher.publish_batch(
+                    [message for messages, _, _ in batch for message in messages],
+                    transaction=tx,
+                )
+
+                for _, ack_headers, _ in batch:
+                    self.conn.send_frame(
+                        "ACK",
+                        headers={**ack_headers, "transaction": tx},
+                    )
+
+                self._receipts.confirm(
+                    lambda receipt: self.conn.commit(tx, headers={"receipt": receipt}),
+                    f"commit-{tx}",
+                )
+
+            except Exception:
+                logger.exception(
+                    "Batch commit failed, NACK (redelivery)",
+                    extra={"events": len(batch)},
+                )
+                try:
+                    self.conn.abort(tx)
+                except Exception:
+                    logger.warning("Failed to abort transaction %s", tx)
+                self._nack(batch)
+                return
+
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage="commit")
+        FRAMES_ACKED.inc(len(batch))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Committed batch", extra={"events": len(batch)})
+
+        for _, _, on_commit in batch:
+            if on_commit is not None:
+                on_commit()
+
+    def _nack(self, batch: List) -> None:
+        """
+        NACK the frames of an aborted batch outside any transaction.
+
+        Caller must hold `_commit_lock`.
+        """
+        nacked = 0
+        try:
+            for _, ack_headers, _ in batch:
+                self.conn.send_frame("NACK", headers=ack_headers)
+                nacked += 1
+        except Exception:
+            # The broker redelivers the rest once the connection drops
+            logger.warning(
+                "Failed to NACK aborted batch",
+                extra={"events": len(batch) - nacked},
+            )
+        FRAMES_NACKED.inc(nacked)
+
+    def _run_timer(self) -> None:
+        """
+        Commit full batches and batches whose oldest event exceeded
+        the maximum delay.
+        """
+        while not self._stopped.is_set():
+            self._full.wait(self.max_delay / 2)
+            self._full.clear()
+            with self._lock:
+                due = self._pending and (
+                    len(self._pending) >= self.max_events
+                    or time.monotonic() - self._oldest >= self.max_delay
+                )
+                conn, batch = self.conn, (self._take() if due else None)
+
+            if batch:
+                self._commit(batch, conn)
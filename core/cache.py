@@ -0,0 +1,143 @@
+"""
+core.cache
+==========
+
+Bounded in-process caching primitives.
+
+`TTLCache` combines a time-to-live with least-recently-written
+eviction and a hard entry limit, so caches fed by event data cannot
+grow without bound. All operations are thread-safe and O(1)
+amortized.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire after a fixed TTL.
+
+    Entries are ordered by write time: `put` moves a key to the most
+    recent position and restarts its TTL. Expired entries are removed
+    lazily on access and whenever new entries are written.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        max_entries: int,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Parameters
+        ----------
+        ttl : float
+            Entry lifetime in seconds.
+        max_entries : int
+            Maximum number of entries; the least recently written
+            entry is evicted when the limit is exceeded.
+        clock : callable, optional
+            Monotonic time source, by default `time.monotonic`.
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries must be >= 1")
+
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Return the value for `key` if present and not expired.
+
+        Parameters
+        ----------
+        key : Hashable
+            Cache key.
+        default : Any, optional
+            Value returned on a miss, by default None.
+
+        Returns
+        -------
+        Any
+            Cached value or `default`.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires <= self._clock():
+                del self._data[key]
+                return default
+            return value
+
+    def put(self, key: Hashable, value: Any = True) -> None:
+        """
+        Insert or refresh an entry.
+
+        Parameters
+        ----------
+        key : Hashable
+            Cache key.
+        value : Any, optional
+            Value to store, by default True.
+        """
+        with self._lock:
+            now = self._clock()
+            self._data[key] = (now + self.ttl, value)
+            self._data.move_to_end(key)
+            self._evict(now)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Remove an entry.
+
+        Parameters
+        ----------
+        key : Hashable
+            Cache key.
+        default : Any, optional
+            Value returned if the key is absent.
+
+        Returns
+        -------
+        Any
+            Removed value or `default`.
+        """
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self) -> None:
+        """
+        Remove all entries.
+        """
+        with self._lock:
+            self._data.clear()
+
+    def _evict(self, now: float) -> None:
+        """
+        Drop expired entries and enforce the size limit.
+        Caller must hold the lock.
+        """
+        data = self._data
+        while data:
+            key, (expires, _) = next(iter(data.items()))
+            if expires > now and len(data) <= self.max_entries:
+                return
+            del data[key]
+
+
+_MISSING = object()
@@ -0,0 +1,172 @@
+"""
+core.capture
+============
+
+Recording of incoming frames for later replay.
+
+When `settings.CAPTURE_FILE` is set, the listener appends every frame
+it receives (headers, body and arrival time) to a gzip-compressed
+JSON-lines file while routing normally. The file can be fed back
+through the router with `python -m bench.replay` to reproduce real
+production traffic locally.
+
+File format
+-----------
+One JSON object per line: `{"t": <epoch seconds>, "h": {headers},
+"b": "<body>"}`. Every time the router starts, a new gzip member is
+appended to the file; standard gzip readers treat the concatenation
+as a single stream. A background thread flushes buffered records
+about once per second, so a crash loses at most the last second of
+capture.
+
+Capture is best effort: if the file cannot be written (e.g. the disk
+is full) recording stops with an error log and routing continues.
+"""
+
+import gzip
+import logging
+import threading
+import time
+import zlib
+from typing import Dict, Iterator, NamedTuple
+
+from core.codec import dumps, loads
+
+logger = logging.getLogger("router.capture")
+
+_FLUSH_INTERVAL = 1.0
+
+
+class CapturedFrame(NamedTuple):
+    """
+    A recorded frame.
+    """
+
+    timestamp: float
+    headers: Dict[str, str]
+    body: str
+
+
+class FrameRecorder:
+    """
+    Append-only, compressed recorder of received frames.
+    """
+
+    def __init__(self, path: str, compresslevel: int = 6):
+        """
+        Open the capture file for appending.
+
+        Parameters
+        ----------
+        path : str
+            Capture file path.
+        compresslevel : int, optional
+            gzip compression level, by default 6.
+        """
+        self.path = path
+        self._file = gzip.open(path, "ab", compresslevel=compresslevel)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._failed = False
+        self._stopped = threading.Event()
+        self.records = 0
+
+        self._flusher = threading.Thread(
+            target=self._run_flusher,
+            name="router-capture",
+            daemon=True,
+        )
+        self._flusher.start()
+
+        logger.info("Capturing frames", extra={"path": path})
+
+    def record(self, frame) -> None:
+        """
+        Append a frame to the capture file.
+
+        Parameters
+        ----------
+        frame : Any
+            STOMP frame with `headers` and `body`.
+        """
+        body = frame.body
+        if isinstance(body, bytes):
+            body = body.decode("utf-8", errors="replace")
+        line = dumps({"t": time.time(), "h": dict(frame.headers), "b": body})
+
+        with self._lock:
+            if self._failed:
+                return
+            try:
+                self._file.write(line.encode("utf-8") + b"\n")
+            except OSError:
+                self._fail()
+                return
+            self._dirty = True
+            self.records += 1
+
+    def close(self) -> None:
+        """
+        Flush and close the capture file.
+        """
+        self._stopped.set()
+        self._flusher.join()
+        with self._lock:
+            try:
+                self._file.close()
+            except OSError:
+                logger.exception("Failed to close capture file")
+        logger.info(
+            "Capture closed",
+            extra={"path": self.path, "records": self.records},
+        )
+
+    def _run_flusher(self) -> None:
+        """
+        Flush records written since the last flush every interval.
+        """
+        while not self._stopped.wait(_FLUSH_INTERVAL):
+            with self._lock:
+                if not self._dirty or self._failed:
+                    continue
+                try:
+                    self._file.flush()
+                except OSError:
+                    self._fail()
+                    continue
+                self._dirty = False
+
+    def _fail(self) -> None:
+        """
+        Stop recording after a write error. Caller must hold `_lock`.
+        """
+        self._failed = True
+        logger.exception("Frame capture failed, recording stopped")
+
+
+def read_frames(path: str) -> Iterator[CapturedFrame]:
+    """
+    Iterate over the frames in a capture file.
+
+    A truncated final record (e.g. after a crash) ends the iteration
+    instead of raising.
+
+    Parameters
+    ----------
+    path : str
+        Capture file path.
+
+    Yields
+    ------
+    CapturedFrame
+        Recorded frames in arrival order.
+    """
+    with gzip.open(path, "rb") as f:
+        try:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                record = loads(line)
+                yield CapturedFrame(record["t"], record["h"], record["b"])
+        except (EOFError, gzip.BadGzipFile, zlib.error):
+            logger.warning("Capture file is truncated", extra={"path": path})
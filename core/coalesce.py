@@ -0,0 +1,254 @@
+"""
+core.coalesce
+=============
+
+Debounce / coalescing window for selected routes.
+
+Bulk-editing sessions can save the same document many times in a
+minute, and every save produces an event. For routes with coalescing
+enabled, events for the same node are held for a quiet period and
+only the most recent payload is published once no newer event has
+arrived for that node within the period.
+
+Delivery remains at-least-once: every source frame that contributed
+to a held entry stays un-ACKed until the coalesced payload has been
+published, and is NACKed for redelivery if that publish fails.
+
+Note
+----
+Held frames count against the broker's prefetch window, so
+`ACTIVEMQ_PREFETCH` should comfortably exceed the number of nodes
+expected to be held at once.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from core.metrics import EVENTS_COALESCED, ROUTE_PUBLISHED
+
+logger = logging.getLogger("router.coalesce")
+
+
+class FrameTracker:
+    """
+    Completion tracker for a source frame split into several parts.
+
+    The frame is ACKed when every part succeeded, or NACKed once all
+    parts have finished and at least one failed.
+    """
+
+    def __init__(
+        self,
+        acknowledge: Callable[[str, Dict], None],
+        ack_headers: Dict,
+        parts: int,
+        on_success: Optional[Callable[[], None]] = None,
+    ):
+        """
+        Parameters
+        ----------
+        acknowledge : callable
+            Called as `acknowledge(command, headers)` with "ACK" or
+            "NACK" once the frame completes.
+        ack_headers : dict
+            ACK/NACK headers of the source frame.
+        parts : int
+            Number of parts that must finish.
+        on_success : callable, optional
+            Invoked after the frame has been ACKed.
+        """
+        self._acknowledge = acknowledge
+        self._ack_headers = ack_headers
+        self._remaining = parts
+        self._failed = False
+        self._on_success = on_success
+        self._lock = threading.Lock()
+
+    def part_done(self, ok: bool) -> None:
+        """
+        Record completion of one part.
+
+        Parameters
+        ----------
+        ok : bool
+            Whether the part succeeded.
+        """
+        with self._lock:
+            self._remaining -= 1
+            self._failed = self._failed or not ok
+            if self._remaining:
+                return
+            failed = self._failed
+
+        if failed:
+            self._acknowledge("NACK", self._ack_headers)
+            return
+
+        self._acknowledge("ACK", self._ack_headers)
+        if self._on_success is not None:
+            self._on_success()
+
+
+class _Held:
+    """
+    Latest payload for a (destination, node) pair and its frames.
+    """
+
+    __slots__ = ("route", "payload", "trackers", "due")
+
+    def __init__(self, route: str, payload: dict, due: float):
+        self.route = route
+        self.payload = payload
+        self.trackers: List[FrameTracker] = []
+        self.due = due
+
+
+class Coalescer:
+    """
+    Holds per-node payloads until they have been quiet for a period.
+    """
+
+    def __init__(self, publisher, quiet_ms: int, max_pending: int):
+        """
+        Initialize the coalescer and start its flush thread.
+
+        Parameters
+        ----------
+        publisher : QueuePublisher
+            Publisher used for coalesced payloads.
+        quiet_ms : int
+            Quiet period after the latest event for a node before its
+            payload is published.
+        max_pending : int
+            Maximum held entries; the entry that has been quiet the
+            longest is published early when the limit is exceeded.
+        """
+        self.publisher = publisher
+        self.quiet = quiet_ms / 1000.0
+        self.max_pending = max(1, max_pending)
+
+        self._held: "OrderedDict[Tuple[str, str], _Held]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="router-coalescer",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def __len__(self) -> int:
+        return len(self._held)
+
+    def add(
+        self,
+        route: str,
+        destination: str,
+        node_ref: str,
+        payload: dict,
+        tracker: FrameTracker,
+    ) -> None:
+        """
+        Hold a payload, superseding any held payload for the same node.
+
+        Parameters
+        ----------
+        route : str
+            Name of the route the payload belongs to.
+        destination : str
+            Queue name.
+        node_ref : str
+            Node the event refers to.
+        payload : dict
+            Message payload.
+        tracker : FrameTracker
+            Tracker of the source frame; completed when the coalesced
+            payload is published.
+        """
+        key = (destination, node_ref)
+        overflow = None
+
+        with self._lock:
+            due = time.monotonic() + self.quiet
+            entry = self._held.get(key)
+            if entry is None:
+                entry = self._held[key] = _Held(route, payload, due)
+            else:
+                entry.route = route
+                entry.payload = payload
+                entry.due = due
+                self._held.move_to_end(key)
+            entry.trackers.append(tracker)
+
+            if len(self._held) > self.max_pending:
+                overflow = self._held.popitem(last=False)
+
+        if overflow is not None:
+            self._publish(*overflow)
+
+    def close(self) -> None:
+        """
+        Stop the flush thread and publish everything still held.
+        """
+        self._stopped.set()
+        self._thread.join()
+
+        with self._lock:
+            entries = list(self._held.items())
+            self._held.clear()
+
+        for key, entry in entries:
+            self._publish(key, entry)
+
+    def _publish(self, key: Tuple[str, str], entry: _Held) -> None:
+        """
+        Publish a coalesced payload and complete its frames.
+        """
+        destination, node_ref = key
+        try:
+            self.publisher.publish(destination, entry.payload)
+            ok = True
+        except Exception:
+            logger.exception(
+                "Coalesced publish failed, NACK (redelivery)",
+                extra={"nodeRef": node_ref, "destination": destination},
+            )
+            ok = False
+
+        if ok:
+            ROUTE_PUBLISHED.inc(route=entry.route)
+            if len(entry.trackers) > 1:
+                EVENTS_COALESCED.inc(len(entry.trackers) - 1, queue=destination)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(
+                        "Coalesced %d events",
+                        len(entry.trackers),
+                        extra={"nodeRef": node_ref, "destination": destination},
+                    )
+
+        for tracker in entry.trackers:
+            tracker.part_done(ok)
+
+    def _run(self) -> None:
+        """
+        Publish entries whose quiet period has elapsed.
+        """
+        interval = max(0.01, self.quiet / 4)
+
+        while not self._stopped.wait(interval):
+            now = time.monotonic()
+            due = []
+            with self._lock:
+                # Entries are ordered by last update, so due ones lead
+                while self._held:
+                    key, entry = next(iter(self._held.items()))
+                    if entry.due > now:
+                        break
+                    del self._held[key]
+                    due.append((key, entry))
+
+            for key, entry in due:
+                self._publish(key, entry)
@@ -0,0 +1,308 @@
+"""
+core.codec
+==========
+
+JSON encoding and decoding for the router hot path.
+
+The standard library `json` module is always available. When the
+optional `orjson` package is installed it is used instead, which
+decodes and encodes event payloads several times faster.
+
+The backend is selected once at import time from
+`settings.JSON_BACKEND`:
+- "auto": use orjson when installed, otherwise json
+- "orjson": require orjson (fail fast if missing)
+- "json": always use the standard library
+
+Decode errors from either backend are raised as
+`json.JSONDecodeError` (orjson's error type subclasses it).
+
+Published payloads keep the router's original wire format:
+`dumps_payload` is plain `json.dumps` output (`", "` and `": "`
+separators, non-ASCII escaped) whatever the backend, so consumers see
+byte-identical bodies. `dumps` is the faster compact form used
+internally and by the `json-compact` encoding.
+
+Payloads shared by several destinations are encoded once and passed
+around as `Encoded` bodies; `extend` appends route-specific fields to
+a JSON body without re-serializing the event.
+"""
+
+import json
+import logging
+from typing import Any, Callable, Dict, Optional, Union
+
+from settings import settings
+
+logger = logging.getLogger("router.codec")
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+def _select_backend(name: str) -> str:
+    """
+    Resolve the configured backend name.
+
+    Parameters
+    ----------
+    name : str
+        Configured backend ("auto", "orjson" or "json").
+
+    Returns
+    -------
+    str
+        Backend actually used.
+
+    Raises
+    ------
+    RuntimeError
+        If "orjson" is requested but not installed.
+    """
+    if name == "json":
+        return "json"
+    if orjson is not None:
+        return "orjson"
+    if name == "orjson":
+        raise RuntimeError("JSON_BACKEND=orjson but orjson is not installed")
+    return "json"
+
+
+JSON_BACKEND = _select_backend(settings.JSON_BACKEND)
+logger.debug("JSON backend: %s", JSON_BACKEND)
+
+
+if JSON_BACKEND == "orjson":
+
+    def loads(data: Union[str, bytes]) -> Any:
+        """
+        Decode a JSON document.
+
+        Parameters
+        ----------
+        data : str or bytes
+            Encoded JSON.
+
+        Returns
+        -------
+        Any
+            Decoded value.
+
+        Raises
+        ------
+        json.JSONDecodeError
+            If the input is not valid JSON.
+        """
+        return orjson.loads(data)
+
+    def dumps(obj: Any) -> str:
+        """
+        Encode a value as a compact JSON string.
+
+        Parameters
+        ----------
+        obj : Any
+            JSON-serializable value.
+
+        Returns
+        -------
+        str
+            Encoded JSON.
+
+        Raises
+        ------
+        TypeError
+            If the value cannot be serialized.
+        """
+        return orjson.dumps(obj).decode("utf-8")
+
+else:
+
+    def loads(data: Union[str, bytes]) -> Any:
+        """
+        Decode a JSON document.
+
+        Parameters
+        ----------
+        data : str or bytes
+            Encoded JSON.
+
+        Returns
+        -------
+        Any
+            Decoded value.
+
+        Raises
+        ------
+        json.JSONDecodeError
+            If the input is not valid JSON.
+        """
+        return json.loads(data)
+
+    def dumps(obj: Any) -> str:
+        """
+        Encode a value as a compact JSON string.
+
+        Parameters
+        ----------
+        obj : Any
+            JSON-serializable value.
+
+        Returns
+        -------
+        str
+            Encoded JSON.
+
+        Raises
+        ------
+        TypeError
+            If the value cannot be serialized.
+        """
+        return json.dumps(obj, separators=(",", ":"))
+
+
+def dumps_payload(obj: Any) -> str:
+    """
+    Encode a published payload exactly as `json.dumps` does.
+
+    Parameters
+    ----------
+    obj : Any
+        JSON-serializable value.
+
+    Returns
+    -------
+    str
+        Encoded JSON with the standard library's default separators.
+
+    Raises
+    ------
+    TypeError
+        If the value cannot be serialized.
+    """
+    return json.dumps(obj)
+
+
+class Encoded:
+    """
+    Serialized payload that publishers send as-is.
+
+    Payloads are normally dicts serialized at publish time. An
+    `Encoded` payload has already been serialized, so the same body
+    can be published to several destinations without encoding the
+    event again.
+
+    Attributes
+    ----------
+    body : str or bytes
+        Serialized payload; str for JSON.
+    content_type : str
+        `content-type` header value.
+    content_encoding : str or None
+        `content-encoding` header value of compressed bodies.
+    priority : int or None
+        JMS `priority` header value.
+    headers : dict or None
+        Additional message headers, such as the failure metadata of
+        dead-lettered events.
+    """
+
+    __slots__ = ("body", "content_type", "content_encoding", "priority", "headers")
+
+    def __init__(
+        self,
+        body: Union[str, bytes],
+        content_type: str = "application/json",
+        content_encoding: Optional[str] = None,
+        priority: Optional[int] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ):
+        self.body = body
+        self.content_type = content_type
+        self.content_encoding = content_encoding
+        self.priority = priority
+        self.headers = headers
+
+    def with_priority(self, priority: int) -> "Encoded":
+        """
+        Copy sharing the same body, with a JMS priority.
+
+        Parameters
+        ----------
+        priority : int
+            JMS priority, 0 (lowest) to 9.
+
+        Returns
+        -------
+        Encoded
+            New payload; this one is left unchanged.
+        """
+        return Encoded(
+            self.body, self.content_type, self.content_encoding, priority, self.headers
+        )
+
+    def __repr__(self) -> str:
+        return f"Encoded({self.content_type!r}, {len(self.body)} bytes)"
+
+
+def encode(payload: Any) -> Union[str, bytes]:
+    """
+    Serialize a payload unless it is already encoded.
+
+    Parameters
+    ----------
+    payload : dict or Encoded
+        Message payload.
+
+    Returns
+    -------
+    str or bytes
+        Message body.
+
+    Raises
+    ------
+    TypeError
+        If the payload cannot be serialized.
+    """
+    if isinstance(payload, Encoded):
+        return payload.body
+    return dumps_payload(payload)
+
+
+def extend(
+    encoded: Encoded,
+    fields: dict,
+    serialize: Callable[[Any], str] = dumps,
+    separator: str = ",",
+) -> Encoded:
+    """
+    Add fields to an encoded JSON object without decoding it.
+
+    The caller must ensure `fields` does not repeat keys of the
+    encoded object, and that the body is uncompressed JSON text.
+
+    Parameters
+    ----------
+    encoded : Encoded
+        Encoded JSON object.
+    fields : dict
+        Fields to append.
+    serialize : callable, optional
+        Serializer the object was encoded with, by default `dumps`.
+    separator : str, optional
+        Item separator of that serializer, by default ",".
+
+    Returns
+    -------
+    Encoded
+        Encoded object with the fields appended.
+    """
+    if not fields:
+        return encoded
+    tail = serialize(fields)[1:]
+    text = encoded.body
+    if text == "{}":
+        return Encoded("{" + tail, encoded.content_type)
+    return Encoded(text[:-1] + separator + tail, encoded.content_type)
@@ -0,0 +1,233 @@
+"""
+core.deadletter
+===============
+
+Dead-letter queue for events the router cannot process.
+
+Without a dead-letter queue, events that cannot be decoded or fail
+schema validation are ACKed and lost, and events that keep failing
+are redelivered without limit. With `DLQ_QUEUE` set, failures are
+classified instead:
+
+- Poison events (invalid JSON, invalid schema, unsupported schema
+  version) can never succeed and are forwarded to the dead-letter queue on their first delivery.
+- Transient failures (enrichment lookups, broker I/O, unexpected
+  errors) are NACKed for redelivery until the event has been delivered
+  `DLQ_MAX_DELIVERIES` times, then forwarded to the dead-letter queue.
+
+Dead-lettered messages carry the original body and content type plus
+`dlq-*` headers describing the failure. The source frame is ACKed
+only once the dead-letter message has been published.
+
+Delivery counts are derived from the `redelivered` and `message-id`
+headers and kept in memory per router process, so they restart after
+a router restart and are approximate when several processes share a
+subscription.
+"""
+
+import json
+import logging
+import time
+from typing import Optional
+
+from pydantic import ValidationError
+
+from settings import settings
+from core.cache import TTLCache
+from core.codec import Encoded
+from core.decoders import UnsupportedSchemaVersion
+from core.enrichment import EnrichmentError
+
+logger = logging.getLogger("router.deadletter")
+
+# Failure reasons that are dead-lettered on the first delivery
+POISON = frozenset({"invalid_json", "invalid_schema", "unsupported_version"})
+
+# Longest error description copied into the `dlq-error` header
+_MAX_ERROR_LENGTH = 512
+
+
+def classify(error: BaseException) -> str:
+    """
+    Failure reason of an exception raised while processing a frame.
+
+    Parameters
+    ----------
+    error : BaseException
+        Processing error.
+
+    Returns
+    -------
+    str
+        "invalid_json", "invalid_schema", "unsupported_version",
+        "enrichment", "io" or "error".
+    """
+    if isinstance(error, (json.JSONDecodeError, UnicodeDecodeError)):
+        return "invalid_json"
+    if isinstance(error, ValidationError):
+        return "invalid_schema"
+    if isinstance(error, UnsupportedSchemaVersion):
+        return "unsupported_version"
+    if isinstance(error, EnrichmentError):
+        return "enrichment"
+    if isinstance(error, (OSError, TimeoutError)):
+        return "io"
+    return "error"
+
+
+def describe(error: BaseException) -> str:
+    """
+    Single-line description of an exception for a message header.
+    """
+    text = f"{type(error).__name__}: {error}" if str(error) else type(error).__name__
+    text = " ".join(text.split())
+    if len(text) > _MAX_ERROR_LENGTH:
+        text = text[:_MAX_ERROR_LENGTH - 3] + "..."
+    return text
+
+
+class DeadLetterQueue:
+    """
+    Decides when a failed frame is dead-lettered and builds the
+    dead-letter message.
+
+    Thread-safe; one instance is shared by all workers.
+    """
+
+    def __init__(
+        self,
+        queue: str,
+        max_deliveries: int,
+        track_seconds: float,
+        track_max_entries: int,
+    ):
+        """
+        Parameters
+        ----------
+        queue : str
+            Dead-letter destination.
+        max_deliveries : int
+            Deliveries of a transiently failing event before it is
+            dead-lettered.
+        track_seconds : float
+            How long the delivery count of a failing event is kept.
+        track_max_entries : int
+            Maximum failing events tracked at once.
+        """
+        self.queue = queue
+        self.max_deliveries = max_deliveries
+        # message-id -> (deliveries, reason, error) of failed events
+        self._failures = TTLCache(track_seconds, track_max_entries)
+
+    @classmethod
+    def from_settings(cls) -> Optional["DeadLetterQueue"]:
+        """
+        Build the dead-letter queue from the `DLQ_*` settings.
+
+        Returns
+        -------
+        DeadLetterQueue or None
+            None if `DLQ_QUEUE` is unset.
+        """
+        if not settings.DLQ_QUEUE:
+            return None
+        return cls(
+            settings.DLQ_QUEUE,
+            max_deliveries=settings.DLQ_MAX_DELIVERIES,
+            track_seconds=settings.DLQ_TRACK_SECONDS,
+            track_max_entries=settings.DLQ_TRACK_MAX_ENTRIES,
+        )
+
+    def exhausted(self, frame) -> Optional[Encoded]:
+        """
+        Dead-letter message for a redelivered frame that has already
+        used up its delivery budget, so it is not processed again.
+
+        Parameters
+        ----------
+        frame : Any
+            Incoming MESSAGE frame.
+
+        Returns
+        -------
+        Encoded or None
+            Message for the dead-letter queue, or None if the frame
+            should be processed.
+        """
+        if frame.headers.get("redelivered") != "true":
+            return None
+        failure = self._failures.get(frame.headers.get("message-id"))
+        if failure is None:
+            return None
+        deliveries, reason, error = failure
+        if reason not in POISON and deliveries < self.max_deliveries:
+            return None
+        return self._message(frame, reason, error, deliveries + 1)
+
+    def failed(self, frame, error: BaseException) -> Optional[Encoded]:
+        """
+        Record a failed delivery.
+
+        Parameters
+        ----------
+        frame : Any
+            MESSAGE frame whose processing failed.
+        error : BaseException
+            Processing error.
+
+        Returns
+        -------
+        Encoded or None
+            Message for the dead-letter queue if the event is poison
+            or has used up its delivery budget, otherwise None and the
+            frame should be redelivered.
+        """
+        reason = classify(error)
+        text = describe(error)
+        key = frame.headers.get("message-id")
+        deliveries = self._deliveries(frame, key)
+        if key is not None:
+            self._failures.put(key, (deliveries, reason, text))
+        if reason not in POISON and deliveries < self.max_deliveries:
+            return None
+        return self._message(frame, reason, text, deliveries)
+
+    def _deliveries(self, frame, key) -> int:
+        """
+        Deliveries of a frame so far, including this one.
+        """
+        if frame.headers.get("redelivered") != "true":
+            return 1
+        failure = self._failures.get(key) if key is not None else None
+        return failure[0] + 1 if failure is not None else 2
+
+    def _message(self, frame, reason: str, error: str, deliveries: int) -> Encoded:
+        """
+        Dead-letter message carrying the original body and the failure.
+        """
+        headers = frame.headers
+        metadata = {
+            "dlq-reason": reason,
+            "dlq-error": error,
+            "dlq-deliveries": str(deliveries),
+            "dlq-failed-at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+        for name in ("message-id", "destination", "subscription"):
+            if headers.get(name) is not None:
+                metadata[f"dlq-original-{name}"] = headers[name]
+        logger.warning(
+            "Dead-lettering event to %s: %s",
+            self.queue,
+            error,
+            extra={
+                "reason": reason,
+                "deliveries": deliveries,
+                "message_id": headers.get("message-id"),
+            },
+        )
+        return Encoded(
+            frame.body,
+            headers.get("content-type", "application/json"),
+            headers.get("content-encoding"),
+            headers=metadata,
+        )
@@ -0,0 +1,199 @@
+"""
+core.decoders
+=============
+
+Event decoders per `schemaVersion`.
+
+Each schema version emitted by the repository extension is decoded by
+its own precompiled decoder, so a new version can get its own model or
+fast path without slowing down the old ones while both are in flight
+during a rolling upgrade. Every decoder returns a `CompactEvent`.
+
+Version 1 uses the fast path of `CompactEvent.from_dict`. Further
+versions are registered at import time, e.g. from a route module:
+
+    from core.decoders import ModelDecoder, register_decoder
+
+    register_decoder(2, lambda strict: ModelDecoder(RepoEventV2))
+
+Events with an unknown version are decoded with the decoder of
+`SCHEMA_FALLBACK_VERSION`; with no fallback (0) they are rejected with
+`UnsupportedSchemaVersion` and dead-lettered or dropped.
+"""
+
+import logging
+from typing import Any, Callable, Dict, Optional
+
+from pydantic import BaseModel, TypeAdapter
+
+from settings import settings
+from core.metrics import SCHEMA_FALLBACK
+from core.schema import CompactEvent
+
+logger = logging.getLogger("router.decoders")
+
+Decoder = Callable[[Any], CompactEvent]
+
+
+class UnsupportedSchemaVersion(ValueError):
+    """
+    Raised for an event whose `schemaVersion` has no decoder when no
+    fallback is configured.
+    """
+
+
+class FastDecoder:
+    """
+    Decoder for payloads shaped like `RepoEvent`.
+
+    Uses the payload as-is when every field has its exact schema type
+    and validates it with `RepoEvent` otherwise (always when strict).
+    """
+
+    __slots__ = ("strict",)
+
+    def __init__(self, strict: bool = False):
+        """
+        Parameters
+        ----------
+        strict : bool, optional
+            Always validate with `RepoEvent`, by default False.
+        """
+        self.strict = strict
+
+    def __call__(self, raw: Any) -> CompactEvent:
+        return CompactEvent.from_dict(raw, self.strict)
+
+
+class ModelDecoder:
+    """
+    Decoder validating with a pydantic model.
+
+    The model's validator is compiled once into a `TypeAdapter`; the
+    validated model is copied into a `CompactEvent`, so it must have
+    at least the fields of `RepoEvent`.
+    """
+
+    __slots__ = ("_validate",)
+
+    def __init__(self, model: type):
+        """
+        Parameters
+        ----------
+        model : type
+            Pydantic model of the schema version.
+        """
+        if not (isinstance(model, type) and issubclass(model, BaseModel)):
+            raise TypeError(f"{model!r} is not a pydantic model")
+        self._validate = TypeAdapter(model).validate_python
+
+    def __call__(self, raw: Any) -> CompactEvent:
+        return CompactEvent.from_model(self._validate(raw))
+
+
+# schemaVersion -> factory building its decoder from STRICT_VALIDATION
+_FACTORIES: Dict[int, Callable[[bool], Decoder]] = {1: FastDecoder}
+
+
+def register_decoder(version: int, factory: Callable[[bool], Decoder]) -> None:
+    """
+    Register the decoder of a schema version.
+
+    Must be called before the router starts, e.g. when a route module
+    is imported; registering a version again replaces its decoder.
+
+    Parameters
+    ----------
+    version : int
+        `schemaVersion` value.
+    factory : callable
+        Called once with `settings.STRICT_VALIDATION`; returns the
+        decoder, a callable taking the decoded JSON payload and
+        returning a `CompactEvent`.
+    """
+    _FACTORIES[version] = factory
+
+
+class DecoderRegistry:
+    """
+    Decoders of the supported schema versions.
+    """
+
+    def __init__(self, decoders: Dict[int, Decoder], fallback: Optional[int] = None):
+        """
+        Parameters
+        ----------
+        decoders : dict of int to callable
+            Decoder per `schemaVersion`.
+        fallback : int, optional
+            Version whose decoder handles unknown versions; None
+            rejects them.
+
+        Raises
+        ------
+        ValueError
+            If `fallback` has no decoder.
+        """
+        if fallback is not None and fallback not in decoders:
+            raise ValueError(f"No decoder for fallback schema version {fallback}")
+        self._decoders = dict(decoders)
+        self._fallback = decoders[fallback] if fallback is not None else None
+
+    @classmethod
+    def from_settings(cls) -> "DecoderRegistry":
+        """
+        Build the decoders of all registered versions.
+
+        Uses `settings.STRICT_VALIDATION` and
+        `settings.SCHEMA_FALLBACK_VERSION`.
+        """
+        strict = settings.STRICT_VALIDATION
+        fallback = settings.SCHEMA_FALLBACK_VERSION or None
+        registry = cls(
+            {version: factory(strict) for version, factory in _FACTORIES.items()},
+            fallback=fallback,
+        )
+        logger.info(
+            "Schema decoders: versions %s, fallback %s",
+            ", ".join(str(version) for version in sorted(registry.versions)),
+            fallback,
+        )
+        return registry
+
+    @property
+    def versions(self):
+        """
+        Schema versions with their own decoder.
+        """
+        return self._decoders.keys()
+
+    def decode(self, raw: Any, version: Optional[int]) -> CompactEvent:
+        """
+        Decode a payload with the decoder of its schema version.
+
+        Parameters
+        ----------
+        raw : Any
+            Decoded JSON payload.
+        version : int or None
+            Its `schemaVersion`; None when missing or not an integer.
+
+        Returns
+        -------
+        CompactEvent
+            Decoded event.
+
+        Raises
+        ------
+        UnsupportedSchemaVersion
+            If the version is unknown and there is no fallback.
+        pydantic.ValidationError
+            If the payload does not match the version's schema.
+        """
+        decoder = self._decoders.get(version)
+        if decoder is None:
+            if self._fallback is None:
+                raise UnsupportedSchemaVersion(f"Unsupported schemaVersion {version!r}")
+            SCHEMA_FALLBACK.inc()
+            decoder = self._fallback
+        return decoder(raw)
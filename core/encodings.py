@@ -0,0 +1,338 @@
+"""
+core.encodings
+==============
+
+Output encodings for published payloads.
+
+By default payloads are published as JSON exactly as before. Each
+route can select another encoding to reduce message size on the
+broker (memory, KahaDB store) and on the network:
+
+- `json`: JSON including null fields (default)
+- `json-compact`: compact JSON (no whitespace) without null-valued fields
+- `msgpack`: MessagePack with null fields dropped (requires the
+  optional `msgpack` package)
+
+and optionally append a compression suffix:
+
+- `+gzip`: gzip (standard library)
+- `+zstd`: Zstandard (requires the optional `zstandard` package)
+
+e.g. `json-compact+gzip` or `msgpack+zstd`.
+
+Consumers detect the format from the message headers: `content-type`
+is `application/json` or `application/msgpack`, and compressed bodies
+carry `content-encoding: gzip` or `zstd`. Bodies smaller than
+`settings.PAYLOAD_COMPRESS_MIN_BYTES` are sent uncompressed, without a
+`content-encoding` header.
+
+The encoding of a route is taken from, in order of precedence,
+`settings.ROUTE_ENCODINGS`, the route's `encoding` attribute (or the
+`encoding` key of a declarative rule) and `settings.PAYLOAD_ENCODING`.
+Unknown encodings and missing optional packages fail fast at startup.
+"""
+
+import gzip
+import logging
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from settings import settings
+from core.codec import Encoded, dumps, dumps_payload, extend
+
+logger = logging.getLogger("router.encodings")
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+
+
+def drop_none(value: Any) -> Any:
+    """
+    Remove null-valued fields from nested objects.
+
+    Parameters
+    ----------
+    value : Any
+        Decoded JSON value.
+
+    Returns
+    -------
+    Any
+        The value without None-valued dict entries; lists keep their
+        None elements.
+    """
+    if isinstance(value, dict):
+        return {k: drop_none(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [drop_none(v) for v in value]
+    return value
+
+
+class PayloadEncoding:
+    """
+    A payload serialization with optional compression.
+    """
+
+    __slots__ = (
+        "name",
+        "content_type",
+        "compression",
+        "min_compress_bytes",
+        "_serialize",
+        "_compress",
+        "_compact",
+        "_separator",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        content_type: str,
+        serialize: Callable[[Any], Any],
+        compact: bool = False,
+        compression: Optional[str] = None,
+        compress: Optional[Callable[[bytes], bytes]] = None,
+        min_compress_bytes: int = 0,
+        separator: str = ",",
+    ):
+        """
+        Parameters
+        ----------
+        name : str
+            Encoding spec, e.g. "json-compact+gzip".
+        content_type : str
+            MIME type of the serialized payload.
+        serialize : callable
+            Serializes a payload to str (JSON) or bytes.
+        compact : bool, optional
+            Drop null-valued fields before serializing.
+        compression : str, optional
+            `content-encoding` value of compressed bodies.
+        compress : callable, optional
+            Compresses serialized bytes.
+        min_compress_bytes : int, optional
+            Bodies smaller than this are not compressed.
+        separator : str, optional
+            Item separator of serialized JSON, used when splicing.
+        """
+        self.name = name
+        self.content_type = content_type
+        self.compression = compression
+        self.min_compress_bytes = min_compress_bytes
+        self._serialize = serialize
+        self._compress = compress
+        self._compact = compact
+        self._separator = separator
+
+    @property
+    def splices(self) -> bool:
+        """
+        Whether fields can be appended to an encoded payload as JSON
+        text (see `core.codec.extend`).
+        """
+        return self.content_type == JSON and self._compress is None
+
+    def extend(self, encoded: Encoded, fields: Dict) -> Encoded:
+        """
+        Append prepared fields to a payload of this encoding.
+
+        Only valid if `splices`; the spliced body is identical to
+        encoding the merged payload.
+
+        Parameters
+        ----------
+        encoded : Encoded
+            Payload returned by `encode`.
+        fields : dict
+            Fields not present in the payload.
+
+        Returns
+        -------
+        Encoded
+            Payload with the fields appended.
+        """
+        return extend(encoded, fields, self._serialize, self._separator)
+
+    def prepare(self, payload: Dict) -> Dict:
+        """
+        Apply the encoding's field filtering to a payload.
+
+        Parameters
+        ----------
+        payload : dict
+            Payload or fields to be appended to one.
+
+        Returns
+        -------
+        dict
+            The payload as it will be serialized.
+        """
+        return drop_none(payload) if self._compact else payload
+
+    def encode(self, payload: Dict) -> Encoded:
+        """
+        Serialize and, if configured, compress a payload.
+
+        Parameters
+        ----------
+        payload : dict
+            JSON-serializable payload.
+
+        Returns
+        -------
+        Encoded
+            Body with its content headers.
+
+        Raises
+        ------
+        TypeError
+            If the payload cannot be serialized.
+        """
+        body = self._serialize(self.prepare(payload))
+        if self._compress is None:
+            return Encoded(body, self.content_type)
+
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        if len(body) < self.min_compress_bytes:
+            return Encoded(body, self.content_type)
+        return Encoded(self._compress(body), self.content_type, self.compression)
+
+    def __repr__(self) -> str:
+        return f"PayloadEncoding({self.name!r})"
+
+
+def _msgpack_serialize(payload: Any) -> bytes:
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def _zstd_compress(body: bytes) -> bytes:
+    # ZstdCompressor is not thread-safe; it is cheap to create
+    return zstandard.ZstdCompressor(level=3).compress(body)
+
+
+def _gzip_compress(body: bytes) -> bytes:
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+def get_encoding(spec: str) -> PayloadEncoding:
+    """
+    Build an encoding from its spec.
+
+    Parameters
+    ----------
+    spec : str
+        Format, optionally followed by `+gzip` or `+zstd`, e.g.
+        "msgpack+zstd".
+
+    Returns
+    -------
+    PayloadEncoding
+        Encoding for the spec.
+
+    Raises
+    ------
+    ValueError
+        If the format or compression is unknown.
+    RuntimeError
+        If a required optional package is not installed.
+    """
+    name = spec.strip().lower()
+    fmt, _, compression = name.partition("+")
+
+    separator = ","
+    if fmt == "json":
+        content_type, serialize, compact = JSON, dumps_payload, False
+        separator = ", "
+    elif fmt == "json-compact":
+        content_type, serialize, compact = JSON, dumps, True
+    elif fmt == "msgpack":
+        if msgpack is None:
+            raise RuntimeError(f"Payload encoding {spec!r} requires the msgpack package")
+        content_type, serialize, compact = MSGPACK, _msgpack_serialize, True
+    else:
+        raise ValueError(f"Unknown payload encoding: {spec!r}")
+
+    if not compression:
+        compress = None
+    elif compression == "gzip":
+        compress = _gzip_compress
+    elif compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError(f"Payload encoding {spec!r} requires the zstandard package")
+        compress = _zstd_compress
+    else:
+        raise ValueError(f"Unknown payload compression in {spec!r}")
+
+    return PayloadEncoding(
+        name,
+        content_type,
+        serialize,
+        compact=compact,
+        compression=compression or None,
+        compress=compress,
+        min_compress_bytes=settings.PAYLOAD_COMPRESS_MIN_BYTES,
+        separator=separator,
+    )
+
+
+def route_encodings(routes: Iterable) -> Dict[str, PayloadEncoding]:
+    """
+    Resolve the encoding of every route.
+
+    Parameters
+    ----------
+    routes : iterable of BaseRoute
+        Loaded routes.
+
+    Returns
+    -------
+    dict
+        Route name to encoding. Routes with the same spec share one
+        `PayloadEncoding` instance.
+
+    Raises
+    ------
+    ValueError
+        If `settings.ROUTE_ENCODINGS` is malformed or an encoding is
+        unknown.
+    RuntimeError
+        If a required optional package is not installed.
+    """
+    overrides = {}
+    for part in settings.ROUTE_ENCODINGS.split(","):
+        if not part.strip():
+            continue
+        name, sep, spec = part.partition("=")
+        if not sep or not name.strip() or not spec.strip():
+            raise ValueError(f"Invalid ROUTE_ENCODINGS entry: {part.strip()!r}")
+        overrides[name.strip()] = spec.strip()
+
+    by_spec: Dict[str, PayloadEncoding] = {}
+    encodings = {}
+    for route in routes:
+        spec = (
+            overrides.get(route.name)
+            or route.encoding
+            or settings.PAYLOAD_ENCODING
+        ).strip().lower()
+        if spec not in by_spec:
+            by_spec[spec] = get_encoding(spec)
+        encodings[route.name] = by_spec[spec]
+
+    custom = {n: e.name for n, e in encodings.items() if e.name != "json"}
+    if custom:
+        logger.info(
+            "Payload encodings: %s",
+            ", ".join(f"{n}={s}" for n, s in sorted(custom.items())),
+        )
+    return encodings
@@ -0,0 +1,422 @@
+"""
+core.enrichment
+===============
+
+Optional enrichment of routed events with repository metadata.
+
+Downstream workers typically need node properties, aspects and the
+parent folder, which are not part of the event. Rather than every
+worker calling the Alfresco REST API for the same node, the router can
+look the metadata up once per event and add it to the payload of every
+matching route that asks for it (`BaseRoute.enrich`, the `enrich` rule
+flag or `settings.ENRICH_ROUTES`).
+
+Lookups go through a TTL/LRU cache:
+- nodes are keyed by `(nodeRef, modifiedAt)` (or the event timestamp),
+  so a cached entry is only reused for the same version of the node
+  (e.g. by duplicates or redeliveries)
+- parent folders are keyed by `parentNodeRef`, so documents uploaded
+  into the same folder share one lookup
+
+Lookups are fetched by a single loader thread. Lookups queued while a
+request is in flight (e.g. by several worker threads or asyncio tasks),
+optionally extended by `ENRICH_BATCH_WAIT_MS`, are fetched together
+with one search API call; nodes the search index does not know yet
+are fetched individually. Concurrent requests for the same key share
+one lookup.
+
+The published payload gains an `enrichment` key:
+
+    {"node": {...} | null, "parent": {...} | null}
+
+where each entry holds `id`, `name`, `nodeType`, `aspectNames`,
+`properties` and `path`, and null means the node was not found.
+"""
+
+import base64
+import logging
+import queue
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import Future
+from typing import Dict, FrozenSet, Hashable, Iterable, List, Optional, Tuple
+
+from settings import settings
+from core.cache import TTLCache
+from core.codec import dumps, loads
+from core.metrics import ENRICH_LOOKUPS
+
+logger = logging.getLogger("router.enrichment")
+
+_NODES_API = "/alfresco/api/-default-/public/alfresco/versions/1/nodes/"
+_SEARCH_API = "/alfresco/api/-default-/public/search/versions/1/search"
+_INCLUDE = ("properties", "aspectNames", "path")
+
+# Sentinel placed on the queue to stop the loader thread
+_STOP = object()
+
+
+class EnrichmentError(Exception):
+    """
+    Raised when repository metadata cannot be fetched in time.
+    """
+
+
+class AlfrescoClient:
+    """
+    Minimal Alfresco REST API client for node metadata.
+    """
+
+    def __init__(self, base_url: str, user: str, password: str, timeout: float):
+        """
+        Parameters
+        ----------
+        base_url : str
+            Repository URL, e.g. `http://alfresco:8080`.
+        user : str
+            Username.
+        password : str
+            Password.
+        timeout : float
+            Socket timeout per request in seconds.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        token = base64.b64encode(f"{user}:{password}".encode("utf-8")).decode("ascii")
+        self._headers = {
+            "Authorization": f"Basic {token}",
+            "Accept": "application/json",
+        }
+
+    def get_nodes(self, node_refs: List[str]) -> Dict[str, Optional[dict]]:
+        """
+        Fetch metadata for several nodes.
+
+        Parameters
+        ----------
+        node_refs : list of str
+            Node references (`workspace://SpacesStore/<id>`).
+
+        Returns
+        -------
+        dict
+            Node reference to summary, or None if the node does not
+            exist.
+        """
+        found: Dict[str, Optional[dict]] = {}
+        if len(node_refs) > 1:
+            found.update(self._search(node_refs))
+
+        # Search is eventually consistent; fetch anything not yet indexed
+        for node_ref in node_refs:
+            if node_ref not in found:
+                found[node_ref] = self._get(node_ref)
+        return found
+
+    def _get(self, node_ref: str) -> Optional[dict]:
+        node_id = node_ref.rsplit("/", 1)[-1]
+        query = urllib.parse.urlencode({"include": ",".join(_INCLUDE)})
+        url = f"{self.base_url}{_NODES_API}{urllib.parse.quote(node_id)}?{query}"
+        try:
+            response = self._request(urllib.request.Request(url, headers=self._headers))
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+        return _summarize(response["entry"])
+
+    def _search(self, node_refs: List[str]) -> Dict[str, dict]:
+        body = {
+            "query": {
+                "query": " OR ".join(f'ID:"{ref}"' for ref in node_refs),
+                "language": "afts",
+            },
+            "include": list(_INCLUDE),
+            "paging": {"maxItems": len(node_refs), "skipCount": 0},
+        }
+        request = urllib.request.Request(
+            self.base_url + _SEARCH_API,
+            data=dumps(body).encode("utf-8"),
+            headers={**self._headers, "Content-Type": "application/json"},
+            method="POST",
+        )
+        response = self._request(request)
+
+        found = {}
+        store = node_refs[0].rsplit("/", 1)[0]
+        for item in response.get("list", {}).get("entries", []):
+            entry = item["entry"]
+            found[f"{store}/{entry['id']}"] = _summarize(entry)
+        return found
+
+    def _request(self, request: urllib.request.Request) -> dict:
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return loads(response.read())
+
+
+def _summarize(entry: dict) -> dict:
+    """
+    Keep the node fields published to downstream workers.
+    """
+    return {
+        "id": entry.get("id"),
+        "name": entry.get("name"),
+        "nodeType": entry.get("nodeType"),
+        "aspectNames": entry.get("aspectNames", []),
+        "properties": entry.get("properties", {}),
+        "path": (entry.get("path") or {}).get("name"),
+    }
+
+
+class Enricher:
+    """
+    Cached, batching metadata lookups for routed events.
+    """
+
+    def __init__(
+        self,
+        client: AlfrescoClient,
+        ttl: float,
+        max_entries: int,
+        batch_size: int,
+        batch_wait_ms: int,
+        timeout_ms: int,
+    ):
+        """
+        Initialize the enricher and start its loader thread.
+
+        Parameters
+        ----------
+        client : AlfrescoClient
+            Repository client.
+        ttl : float
+            Cache entry lifetime in seconds.
+        max_entries : int
+            Maximum cached nodes.
+        batch_size : int
+            Maximum nodes fetched per request.
+        batch_wait_ms : int
+            Time a lookup may wait for others to share its request.
+        timeout_ms : int
+            Time an event may wait for its metadata.
+        """
+        self.client = client
+        self.cache = TTLCache(ttl, max_entries)
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait_ms / 1000.0
+        self.timeout = timeout_ms / 1000.0
+        # Names of routes whose payloads are enriched
+        self.routes: FrozenSet[str] = frozenset()
+
+        self._pending: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="router-enricher",
+            daemon=True,
+        )
+        self._thread.start()
+
+    @classmethod
+    def from_settings(cls, routes) -> Optional["Enricher"]:
+        """
+        Build an enricher for the routes that request enrichment.
+
+        Parameters
+        ----------
+        routes : list of BaseRoute
+            Loaded routes.
+
+        Returns
+        -------
+        Enricher or None
+            Enricher with `routes` set to the enriched route names, or
+            None when no route is enriched or `ALFRESCO_URL` is unset.
+        """
+        names = {
+            name.strip()
+            for name in settings.ENRICH_ROUTES.split(",")
+            if name.strip()
+        }
+        enriched = frozenset(
+            route.name for route in routes if route.enrich or route.name in names
+        )
+        if not enriched:
+            return None
+        if not settings.ALFRESCO_URL:
+            logger.warning(
+                "Enrichment requested for %s but ALFRESCO_URL is not set",
+                ", ".join(sorted(enriched)),
+            )
+            return None
+
+        enricher = cls(
+            AlfrescoClient(
+                settings.ALFRESCO_URL,
+                settings.ALFRESCO_USER,
+                settings.ALFRESCO_PASSWORD,
+                timeout=settings.ENRICH_TIMEOUT_MS / 1000.0,
+            ),
+            ttl=settings.ENRICH_CACHE_TTL_SECONDS,
+            max_entries=settings.ENRICH_CACHE_MAX_ENTRIES,
+            batch_size=settings.ENRICH_BATCH_SIZE,
+            batch_wait_ms=settings.ENRICH_BATCH_WAIT_MS,
+            timeout_ms=settings.ENRICH_TIMEOUT_MS,
+        )
+        enricher.routes = enriched
+        logger.info("Enrichment enabled", extra={"routes": ",".join(sorted(enriched))})
+        return enricher
+
+    def submit(self, event) -> Future:
+        """
+        Start the lookups for an event.
+
+        Parameters
+        ----------
+        event : CompactEvent
+            Validated event.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Resolves to the enrichment dict, or fails with the lookup
+            error.
+        """
+        parts: List[Tuple[str, Future]] = [
+            (
+                "node",
+                self._lookup((event.nodeRef, event.modifiedAt or event.timestamp), event.nodeRef),
+            ),
+        ]
+        if event.parentNodeRef:
+            parts.append(("parent", self._lookup(event.parentNodeRef, event.parentNodeRef)))
+
+        result: Future = Future()
+        remaining = [len(parts)]
+        lock = threading.Lock()
+
+        def part_done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            for _, future in parts:
+                if future.exception() is not None:
+                    result.set_exception(future.exception())
+                    return
+            enrichment = {"node": None, "parent": None}
+            enrichment.update((name, future.result()) for name, future in parts)
+            result.set_result(enrichment)
+
+        for _, future in parts:
+            future.add_done_callback(part_done)
+        return result
+
+    def enrich(self, event) -> dict:
+        """
+        Look up metadata for an event, waiting up to the timeout.
+
+        Parameters
+        ----------
+        event : CompactEvent
+            Validated event.
+
+        Returns
+        -------
+        dict
+            Enrichment dict.
+
+        Raises
+        ------
+        EnrichmentError
+            If the lookup fails or times out.
+        """
+        try:
+            return self.submit(event).result(timeout=self.timeout)
+        except Exception as e:
+            raise EnrichmentError(str(e) or type(e).__name__) from e
+
+    def close(self) -> None:
+        """
+        Stop the loader thread after pending lookups complete.
+        """
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _lookup(self, key: Hashable, node_ref: str) -> Future:
+        """
+        Cached, single-flight lookup of one node.
+        """
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                ENRICH_LOOKUPS.inc(result="shared")
+                return future
+
+            future = Future()
+            cached = self.cache.get(key, _MISSING)
+            if cached is not _MISSING:
+                ENRICH_LOOKUPS.inc(result="cached")
+                future.set_result(cached)
+                return future
+
+            self._pending[key] = future
+
+        self._queue.put((key, node_ref, future))
+        return future
+
+    def _run(self) -> None:
+        """
+        Loader thread: collect lookups into batches and fetch them.
+        """
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+
+            batch = [item]
+            deadline = time.monotonic() + self.batch_wait
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._fetch(batch)
+            if stop:
+                return
+
+    def _fetch(self, batch: Iterable[Tuple[Hashable, str, Future]]) -> None:
+        batch = list(batch)
+        refs = list(dict.fromkeys(node_ref for _, node_ref, _ in batch))
+        try:
+            found = self.client.get_nodes(refs)
+            error = None
+            ENRICH_LOOKUPS.inc(len(batch), result="fetched")
+        except Exception as e:
+            logger.warning("Metadata lookup failed: %s", e, extra={"nodes": len(refs)})
+            found, error = {}, e
+            ENRICH_LOOKUPS.inc(len(batch), result="failed")
+
+        for key, node_ref, future in batch:
+            with self._lock:
+                self._pending.pop(key, None)
+                if error is None:
+                    self.cache.put(key, found.get(node_ref))
+            if error is None:
+                future.set_result(found.get(node_ref))
+            else:
+                future.set_exception(error)
+
+
+_MISSING = object()
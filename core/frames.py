@@ -0,0 +1,142 @@
+"""
+core.frames
+===========
+
+STOMP 1.2 frame encoding and incremental parsing.
+
+Used by the asyncio runtime's STOMP client (`core.aiostomp`) and by
+the benchmark broker. Header values are escaped as required by
+STOMP 1.2, except in CONNECT / CONNECTED frames; bodies are delimited
+by `content-length` when present and by a NUL byte otherwise.
+"""
+
+from typing import Dict, List, Optional
+
+_ESCAPES = {"\\": "\\\\", "\n": "\\n", "\r": "\\r", ":": "\\c"}
+_UNESCAPES = {"\\\\": "\\", "\\n": "\n", "\\r": "\r", "\\c": ":"}
+
+
+class Frame:
+    """
+    A STOMP frame.
+    """
+
+    __slots__ = ("command", "headers", "body")
+
+    def __init__(self, command: str, headers: Optional[Dict[str, str]] = None, body: bytes = b""):
+        self.command = command
+        self.headers = headers or {}
+        self.body = body
+
+    def __repr__(self) -> str:
+        return f"Frame({self.command!r}, {self.headers!r}, {len(self.body)} bytes)"
+
+
+def encode_frame(frame: Frame) -> bytes:
+    """
+    Serialize a frame, adding `content-length` for non-empty bodies.
+
+    Parameters
+    ----------
+    frame : Frame
+        Frame to encode.
+
+    Returns
+    -------
+    bytes
+        Wire representation.
+    """
+    lines = [frame.command]
+    escape = frame.command not in ("CONNECT", "CONNECTED")
+    headers = dict(frame.headers)
+    if frame.body:
+        headers["content-length"] = str(len(frame.body))
+    for key, value in headers.items():
+        if escape:
+            key, value = _escape(key), _escape(str(value))
+        lines.append(f"{key}:{value}")
+    head = ("\n".join(lines) + "\n\n").encode("utf-8")
+    return head + frame.body + b"\x00"
+
+
+class FrameParser:
+    """
+    Incremental STOMP frame parser.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[Frame]:
+        """
+        Add received bytes and return the frames completed so far.
+
+        Parameters
+        ----------
+        data : bytes
+            Bytes read from the socket.
+
+        Returns
+        -------
+        list of Frame
+            Complete frames, in order. Heart-beats are skipped.
+        """
+        self._buffer.extend(data)
+        frames = []
+
+        while True:
+            buf = self._buffer
+            start = 0
+            while start < len(buf) and buf[start] in (0x0A, 0x0D):
+                start += 1
+            if start:
+                del buf[:start]
+
+            end_of_headers = buf.find(b"\n\n")
+            if end_of_headers < 0:
+                return frames
+
+            head = bytes(buf[:end_of_headers]).decode("utf-8").replace("\r", "")
+            command, *header_lines = head.split("\n")
+            headers: Dict[str, str] = {}
+            escaped = command not in ("CONNECT", "CONNECTED")
+            for line in header_lines:
+                key, _, value = line.partition(":")
+                if escaped:
+                    key, value = _unescape(key), _unescape(value)
+                # STOMP 1.2: the first occurrence of a repeated header wins
+                headers.setdefault(key, value)
+
+            body_start = end_of_headers + 2
+            length = headers.get("content-length")
+            if length is not None:
+                body_end = body_start + int(length)
+                if len(buf) < body_end + 1:
+                    return frames
+            else:
+                body_end = buf.find(b"\x00", body_start)
+                if body_end < 0:
+                    return frames
+
+            frames.append(Frame(command, headers, bytes(buf[body_start:body_end])))
+            del buf[: body_end + 1]
+
+
+def _escape(value: str) -> str:
+    return "".join(_ESCAPES.get(ch, ch) for ch in value)
+
+
+def _unescape(value: str) -> str:
+    if "\\" not in value:
+        return value
+    out = []
+    i = 0
+    while i < len(value):
+        pair = value[i : i + 2]
+        if pair in _UNESCAPES:
+            out.append(_UNESCAPES[pair])
+            i += 2
+        else:
+            out.append(value[i])
+            i += 1
+    return "".join(out)
@@ -0,0 +1,194 @@
+"""
+core.lanes
+==========
+
+Priority lanes for routed events.
+
+Without lanes a 2 GB video upload and a 3 KB text file queue equally
+for the workers behind a route. For routes with lanes enabled
+(`BaseRoute.lanes`, the `lanes` rule flag or `settings.LANE_ROUTES`)
+each event is classified into one of two lanes:
+
+- `large`: size of at least `LANE_LARGE_MIN_BYTES`, a MIME type in
+  `LANE_LARGE_MIME_TYPES` (`major/*` wildcards allowed) or a path under
+  one of `LANE_LARGE_PATH_PREFIXES` (e.g. bulk-import folders)
+- `small`: everything else, including events without a size
+
+Depending on `LANE_MODE` the lane then:
+- `priority`: sets the JMS `priority` header (`LANE_SMALL_PRIORITY` /
+  `LANE_LARGE_PRIORITY`) on the route's queue. ActiveMQ only honours
+  it for destinations with `prioritizedMessages="true"` in their
+  policy entry.
+- `queue`: publishes to `<queue>.small` or `<queue>.large`, so each
+  lane can have its own pool of workers
+- `both`: does both
+"""
+
+import logging
+from typing import FrozenSet, Iterable, Optional, Tuple
+
+from settings import settings
+from core.base import BaseRoute
+from core.codec import Encoded
+from core.metrics import LANE_EVENTS
+from core.prefix import PrefixIndex
+from core.rules import mime_type_matches
+from core.schema import CompactEvent
+
+logger = logging.getLogger("router.lanes")
+
+SMALL = "small"
+LARGE = "large"
+
+
+def _split(value: str) -> Tuple[str, ...]:
+    return tuple(part.strip() for part in value.split(",") if part.strip())
+
+
+class LanePolicy:
+    """
+    Lane classification and publishing for lane routes.
+    """
+
+    def __init__(
+        self,
+        routes: FrozenSet[str],
+        mode: str = "priority",
+        large_min_bytes: int = 50 * 1024 * 1024,
+        large_mime_types: Iterable[str] = (),
+        large_path_prefixes: Iterable[str] = (),
+        small_priority: int = 7,
+        large_priority: int = 2,
+    ):
+        """
+        Parameters
+        ----------
+        routes : frozenset of str
+            Names of routes using lanes.
+        mode : str, optional
+            "priority", "queue" or "both".
+        large_min_bytes : int, optional
+            Events at least this large use the large lane.
+        large_mime_types : iterable of str, optional
+            MIME types (or `major/*`) that always use the large lane.
+        large_path_prefixes : iterable of str, optional
+            Path prefixes that always use the large lane.
+        small_priority : int, optional
+            JMS priority of the small lane.
+        large_priority : int, optional
+            JMS priority of the large lane.
+        """
+        self.routes = routes
+        self.mode = mode
+        self.large_min_bytes = large_min_bytes
+        self.large_mime_types = frozenset(large_mime_types)
+        self.large_paths = PrefixIndex.of(large_path_prefixes)
+        self._priorities = (
+            {SMALL: small_priority, LARGE: large_priority}
+            if mode in ("priority", "both")
+            else None
+        )
+        self._suffixed = mode in ("queue", "both")
+
+    @classmethod
+    def from_settings(cls, routes: Iterable[BaseRoute]) -> Optional["LanePolicy"]:
+        """
+        Build the lane policy for the routes that use lanes.
+
+        Parameters
+        ----------
+        routes : iterable of BaseRoute
+            Loaded routes.
+
+        Returns
+        -------
+        LanePolicy or None
+            Policy, or None when no route uses lanes.
+        """
+        names = set(_split(settings.LANE_ROUTES))
+        laned = frozenset(r.name for r in routes if r.lanes or r.name in names)
+        if not laned:
+            return None
+
+        logger.info(
+            "Priority lanes enabled",
+            extra={"routes": ",".join(sorted(laned)), "mode": settings.LANE_MODE},
+        )
+        return cls(
+            laned,
+            mode=settings.LANE_MODE,
+            large_min_bytes=settings.LANE_LARGE_MIN_BYTES,
+            large_mime_types=_split(settings.LANE_LARGE_MIME_TYPES),
+            large_path_prefixes=_split(settings.LANE_LARGE_PATH_PREFIXES),
+            small_priority=settings.LANE_SMALL_PRIORITY,
+            large_priority=settings.LANE_LARGE_PRIORITY,
+        )
+
+    def classify(self, event: CompactEvent) -> str:
+        """
+        Pick the lane of an event.
+
+        Parameters
+        ----------
+        event : CompactEvent
+            Validated event.
+
+        Returns
+        -------
+        str
+            "small" or "large".
+        """
+        if (
+            (event.size is not None and event.size >= self.large_min_bytes)
+            or (self.large_mime_types and mime_type_matches(self.large_mime_types, event.mimeType))
+            or (event.path and self.large_paths.matches(event.path))
+        ):
+            lane = LARGE
+        else:
+            lane = SMALL
+        LANE_EVENTS.inc(lane=lane)
+        return lane
+
+    def apply(self, queue: str, payload: Encoded, lane: str) -> Tuple[str, Encoded]:
+        """
+        Direct a payload to its lane.
+
+        Parameters
+        ----------
+        queue : str
+            Route queue.
+        payload : Encoded
+            Encoded payload; may be shared with other routes and is
+            not modified.
+        lane : str
+            Lane from `classify`.
+
+        Returns
+        -------
+        tuple of (str, Encoded)
+            Destination queue and payload.
+        """
+        if self._suffixed:
+            queue = f"{queue}.{lane}"
+        if self._priorities is not None:
+            payload = payload.with_priority(self._priorities[lane])
+        return queue, payload
+
+    def queues(self, route: BaseRoute) -> Tuple[str, ...]:
+        """
+        Every queue a route can publish to.
+
+        Parameters
+        ----------
+        route : BaseRoute
+            Loaded route.
+
+        Returns
+        -------
+        tuple of str
+            Lane queues for lane routes in queue mode, otherwise the
+            route queue.
+        """
+        if self._suffixed and route.name in self.routes:
+            return (f"{route.queue}.{SMALL}", f"{route.queue}.{LARGE}")
+        return (route.queue,)
@@ -9,15 +9,59 @@ This listener implements a fail-safe message handling strategy:
 - Invalid or unprocessable messages are ACKed and dropped
 - Transient failures are NOT ACKed to allow redelivery
 - Routing decisions are delegated to registered routes
+
+With a dead-letter queue (`core.deadletter`), invalid messages and
+messages that keep failing are forwarded there instead.
+
+Frames can optionally be handed to a bounded worker pool so routing
+runs in parallel instead of on the stomp.py receiver thread, and
+publishes plus ACKs can optionally be grouped into STOMP transactions.
+With a local spool (`core.spool`), payloads whose publish fails are
+written to disk and republished later instead of leaving the frame
+for redelivery.
+
+After a reconnect (`core.reconnect`) the listener is rebound to the
+new connection. Frames received on the lost connection can no longer
+be ACKed: they are skipped, or their late ACKs dropped, and the broker
+redelivers them.
 """
 
 import json
 import logging
+import time
+from functools import partial
+from typing import Optional
+
 from pydantic import ValidationError
 
-from core.schema import RepoEvent
-from core.registry import load_routes
+from settings import settings
+from core.pipeline import match_routes, needs_enrichment, prepare, route_messages
+from core.registry import RouteTable, load_routes
 from core.publisher import QueuePublisher
+from core.batcher import TransactionBatcher
+from core.cache import TTLCache
+from core.capture import FrameRecorder
+from core.metrics import (
+    DEAD_LETTERED,
+    FRAMES_ACKED,
+    FRAMES_DROPPED,
+    FRAMES_FAILED,
+    FRAMES_NACKED,
+    FRAMES_RECEIVED,
+    FRAMES_REDELIVERED,
+    ROUTE_PUBLISHED,
+    STAGE_SECONDS,
+)
+from core.coalesce import Coalescer, FrameTracker
+from core.deadletter import DeadLetterQueue
+from core.decoders import DecoderRegistry, UnsupportedSchemaVersion
+from core.encodings import route_encodings
+from core.lanes import LanePolicy
+from core.ratelimit import RateLimiter
+from core.enrichment import Enricher, EnrichmentError
+from core.senders import RouteSenders
+from core.spool import Spool
+from core.workers import WorkerPool
 
 logger = logging.getLogger("router.listener")
 
@@ -35,88 +79,684 @@ class TopicRouterListener:
     """
 
 
-    def __init__(self, conn):
+    def __init__(
+        self,
+        conn,
+        workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        publisher: Optional[QueuePublisher] = None,
+    ):
+        """
+        Initialize the listener.
+
+        Parameters
+        ----------
+        conn : Any
+            Active STOMP connection instance.
+        workers : int, optional
+            Number of routing worker threads. Defaults to
+            `settings.ROUTER_WORKERS`; 0 processes frames inline on
+            the receiver thread.
+        queue_size : int, optional
+            Worker queue capacity. Defaults to
+            `settings.ROUTER_WORK_QUEUE_SIZE`.
+        publisher : QueuePublisher, optional
+            Publisher for routed payloads. Defaults to publishing on
+            `conn`. The caller owns and closes a supplied publisher.
+        """
         self.conn = conn
-        self.publisher = QueuePublisher(conn)
+        self.publisher = publisher or QueuePublisher(conn)
+        # Ack ids of frames received on the current connection and not
+        # yet ACKed or NACKed
+        self._inflight = set()
+        self.recorder = (
+            FrameRecorder(settings.CAPTURE_FILE) if settings.CAPTURE_FILE else None
+        )
         self.routes = load_routes()
+        self.table = RouteTable(self.routes)
         logger.info("Loaded %d routes", len(self.routes))
+        # After loading routes, which may register schema decoders
+        self.decoders = DecoderRegistry.from_settings()
+
+        self.batcher = (
+            TransactionBatcher(
+                conn,
+                self.publisher,
+                max_events=settings.BATCH_MAX_EVENTS,
+                max_delay_ms=settings.BATCH_MAX_DELAY_MS,
+            )
+            if settings.BATCH_MAX_EVENTS > 0
+            else None
+        )
+
+        self.senders = None
+        if settings.ROUTE_ISOLATION:
+            if self.batcher is not None:
+                logger.warning("ROUTE_ISOLATION is ignored when batching is enabled")
+            else:
+                self.senders = RouteSenders(
+                    self.publisher,
+                    queue_size=settings.ROUTE_SEND_QUEUE_SIZE,
+                )
+
+        # Recently published events, for duplicate suppression
+        self.dedup = (
+            TTLCache(settings.DEDUP_WINDOW_SECONDS, settings.DEDUP_MAX_ENTRIES)
+            if settings.DEDUP_WINDOW_SECONDS > 0
+            else None
+        )
+
+        # Small / large lanes for lane routes
+        self.lanes = LanePolicy.from_settings(self.routes)
+
+        # Destinations of routes whose events are coalesced per node
+        coalesce_names = {
+            name.strip()
+            for name in settings.COALESCE_ROUTES.split(",")
+            if name.strip()
+        }
+        self._coalesced = frozenset(
+            queue
+            for route in self.routes
+            if route.coalesce or route.name in coalesce_names
+            for queue in self._queues(route)
+        )
+        self.coalescer = (
+            Coalescer(
+                self.publisher,
+                quiet_ms=settings.COALESCE_QUIET_MS,
+                max_pending=settings.COALESCE_MAX_PENDING,
+            )
+            if self._coalesced and settings.COALESCE_QUIET_MS > 0
+            else None
+        )
+
+        # Output encoding per route name
+        self.encodings = route_encodings(self.routes)
+
+        # Repository metadata lookups for enriched routes
+        self.enricher = Enricher.from_settings(self.routes)
+
+        # Token buckets for rate-limited routes
+        self.limiter = RateLimiter.from_settings(self.routes, self._queues)
+
+        # Per-destination publish timeouts (seconds) for isolation mode
+        self._timeouts = {
+            queue: (
+                route.publish_timeout_ms or settings.ROUTE_PUBLISH_TIMEOUT_MS
+            ) / 1000.0
+            for route in self.routes
+            for queue in self._queues(route)
+        }
+
+        # On-disk spool for payloads that failed to publish
+        self.spool = None
+        if settings.SPOOL_DIR:
+            if self.batcher is not None:
+                logger.warning("SPOOL_DIR is ignored when batching is enabled")
+            else:
+                self.spool = Spool.from_settings(self.publisher.publish)
+
+        # Destination of poison and crash-looping events
+        self.deadletters = DeadLetterQueue.from_settings()
+
+        if workers is None:
+            workers = settings.ROUTER_WORKERS
+        if queue_size is None:
+            queue_size = settings.ROUTER_WORK_QUEUE_SIZE
+
+        self.pool = (
+            WorkerPool(self._handle, workers=workers, queue_size=queue_size)
+            if workers > 0
+            else None
+        )
+
 
-    
     def on_message(self, frame):
         """
         Handle an incoming STOMP message.
 
+        When a worker pool is configured the frame is queued for a
+        worker thread; this call blocks while the pool is full, which
+        stops the receiver thread from reading further frames.
+        Otherwise the frame is processed inline.
+
+        Parameters
+        ----------
+        frame : Any
+            STOMP frame containing headers and message body.
+        """
+        FRAMES_RECEIVED.inc()
+        if frame.headers.get("redelivered") == "true":
+            FRAMES_REDELIVERED.inc()
+        self._inflight.add(frame.headers.get("ack"))
+        if self.recorder is not None:
+            self.recorder.record(frame)
+
+        if self.pool is not None:
+            self.pool.submit(frame)
+        else:
+            self._handle(frame)
+
+    def _handle(self, frame):
+        """
+        Process a single STOMP message.
+
         Processing flow:
         1. Parse JSON payload
-        2. Validate schema
-        3. Apply routing rules
-        4. Publish to queues
-        5. ACK on success or safe discard
+        2. Resolve candidate routes from envelope fields
+        3. Validate schema (only if any route may match)
+        4. Suppress recently published duplicates
+        5. Apply routing rules to candidate routes, enriching the
+           payloads of enriched routes with repository metadata;
+           routes with the default payload share one encoding;
+           lane routes are directed to the event's lane
+        6. Wait for rate-limited routes; the frame stays un-ACKed
+           meanwhile, which holds back further deliveries
+        7. Publish to queues (or hold for coalescing)
+        8. ACK on success or safe discard (or after forwarding the
+           event to the dead-letter queue)
+
+        Steps 1-5 are shared with the asyncio runtime; see
+        `core.pipeline`.
 
         Parameters
         ----------
         frame : Any
             STOMP frame containing headers and message body.
         """
-        ack_id = frame.headers.get("ack")
-        sub_id = frame.headers.get("subscription")
+        if frame.headers.get("ack") not in self._inflight:
+            # Received before a reconnect; the broker redelivers it
+            FRAMES_DROPPED.inc(reason="stale")
+            return
 
-        try:
-            raw_data = json.loads(frame.body)
+        if self.deadletters is not None:
+            message = self.deadletters.exhausted(frame)
+            if message is not None:
+                self._forward(frame, message)
+                return
 
-            event = RepoEvent.model_validate(raw_data)
+        try:
+            prepared = prepare(frame.body, self.table, self.decoders, self.dedup)
+            if prepared is None:
+                self._complete(frame, [])
+                return
+            event, candidates, dedup_key = prepared
 
-            logger.info(
-                "Event received",
-                extra={
-                    "eventType": event.eventType,
-                    "nodeRef": event.nodeRef,
-                    "path": event.path,
-                },
-            )
-            
-            if event.eventType != "BINARY_CHANGED":
-                logger.info("Ignoring eventType=%s", event.eventType)
-
-                # ignoring other events as of now (please make changes as needed based on future extensions)
-                self.conn.send_frame(
-                    "ACK",
-                    headers={"id": ack_id, "subscription": sub_id},
+            with STAGE_SECONDS.time(stage="route"):
+                matches = match_routes(event, candidates)
+                # Looked up once and shared by all enriched routes
+                enrichment = (
+                    self._enrich(event)
+                    if needs_enrichment(matches, self.enricher)
+                    else None
                 )
-                return
-            
-            for route in self.routes:
-                if route.should_route(event):
-                    payload = route.transform(event)
-                    self.publisher.publish(route.queue, payload)
-                else:
-                    logger.info("Ignoring eventType=%s path=%s" , event.eventType, event.path)
-
-            # ACK only after full success
-            self.conn.send_frame(
-                "ACK",
-                headers={"id": ack_id, "subscription": sub_id},
+                messages, limited = route_messages(
+                    event,
+                    matches,
+                    self.encodings,
+                    self.enricher,
+                    enrichment,
+                    self.lanes,
+                    self.limiter,
+                )
+
+            if not messages:
+                FRAMES_DROPPED.inc(reason="unmatched")
+
+            for name in limited:
+                self.limiter.wait(name)
+
+            # ACK only after full success; remember the event only once published
+            on_success = (
+                partial(self.dedup.put, dedup_key)
+                if dedup_key is not None and messages
+                else None
             )
 
+            # One message per match, in order
+            routes = [match.route.name for match in matches]
+            if self.coalescer is not None and any(
+                destination in self._coalesced for destination, _ in messages
+            ):
+                self._hold(frame, event.nodeRef, messages, routes, on_success)
+            else:
+                self._complete(frame, messages, on_success, routes)
+
+        except EnrichmentError as e:
+            if not self._dead_letter(frame, e):
+                logger.error("Enrichment failed, NACK (redelivery): %s", e)
+                self._acknowledge("NACK", self._ack_headers(frame))
+
         except json.JSONDecodeError as e:
-            logger.error("Invalid JSON payload, ACK & drop", exc_info=e)
-            self.conn.send_frame(
-                "ACK",
-                headers={"id": ack_id, "subscription": sub_id},
-            )
+            if not self._dead_letter(frame, e):
+                logger.error("Invalid JSON payload, ACK & drop", exc_info=e)
+                FRAMES_DROPPED.inc(reason="invalid_json")
+                self._complete(frame, [])
 
         except ValidationError as e:
-            logger.error("Invalid event schema, ACK & drop", exc_info=e)
-            self.conn.send_frame(
-                "ACK",
-                headers={"id": ack_id, "subscription": sub_id},
-            )
+            if not self._dead_letter(frame, e):
+                logger.error("Invalid event schema, ACK & drop", exc_info=e)
+                FRAMES_DROPPED.inc(reason="invalid_schema")
+                self._complete(frame, [])
+
+        except UnsupportedSchemaVersion as e:
+            if not self._dead_letter(frame, e):
+                logger.error("%s, ACK & drop", e)
+                FRAMES_DROPPED.inc(reason="unsupported_version")
+                self._complete(frame, [])
 
+        except Exception as e:
+            FRAMES_FAILED.inc()
+            if self.deadletters is None:
+                logger.exception("Router failure, NO ACK (redelivery)")
+            elif not self._dead_letter(frame, e):
+                # Redeliver now so that the delivery budget is used up
+                logger.exception("Router failure, NACK (redelivery)")
+                self._acknowledge("NACK", self._ack_headers(frame))
+
+    def _dead_letter(self, frame, error) -> bool:
+        """
+        Forward a failed frame to the dead-letter queue if it is
+        poison or has used up its delivery budget.
+
+        Parameters
+        ----------
+        frame : Any
+            Source STOMP frame.
+        error : Exception
+            Processing error.
+
+        Returns
+        -------
+        bool
+            True if the frame was handed to the dead-letter queue;
+            False if there is none or the frame should be redelivered.
+        """
+        if self.deadletters is None:
+            return False
+        message = self.deadletters.failed(frame, error)
+        if message is None:
+            return False
+        self._forward(frame, message)
+        return True
+
+    def _forward(self, frame, message):
+        """
+        Publish a dead-letter message and ACK its source frame.
+
+        If the publish fails the frame is left un-ACKed; on
+        redelivery it is forwarded again without being processed.
+        """
+        try:
+            self._complete(
+                frame,
+                [(self.deadletters.queue, message)],
+                partial(DEAD_LETTERED.inc, reason=message.headers["dlq-reason"]),
+            )
         except Exception:
-            logger.exception("Router failure, NO ACK (redelivery)")
+            logger.exception("Dead-lettering failed, NO ACK (redelivery)")
+
+    def _complete(self, frame, messages, on_success=None, routes=()):
+        """
+        Publish routed payloads and ACK the source frame.
+
+        In batching mode both are deferred to the transaction batcher,
+        which publishes and ACKs atomically. In isolation mode payloads
+        are handed to per-destination senders; the frame is ACKed once
+        all of them confirm, or NACKed if any fails or times out.
+        Otherwise payloads are published immediately and the frame is
+        ACKed once all of them have been sent; a publish failure
+        propagates and leaves the frame un-ACKed.
+
+        Parameters
+        ----------
+        frame : Any
+            Source STOMP frame.
+        messages : list of (str, dict)
+            Destination queue and payload pairs.
+        on_success : callable, optional
+            Invoked once the payloads are published and the frame ACKed.
+        routes : sequence of str, optional
+            Names of the routes the payloads belong to, counted in
+            `ROUTE_PUBLISHED`; empty for dead-letter messages.
+        """
+        ack_headers = self._ack_headers(frame)
+
+        if self.batcher is not None:
+            if not self._claim(ack_headers, "ACK"):
+                return
+            self.batcher.add(
+                messages,
+                ack_headers,
+                on_commit=partial(self._published, routes, on_success),
+            )
+            return
+
+        if self.senders is not None and messages:
+            with STAGE_SECONDS.time(stage="publish"):
+                sent = self._send_isolated(messages)
+            if not sent:
+                self._acknowledge("NACK", ack_headers)
+                return
+        elif messages:
+            with STAGE_SECONDS.time(stage="publish"):
+                for destination, payload in messages:
+                    self._publish(destination, payload)
+
+        self._acknowledge("ACK", ack_headers)
+        self._published(routes, on_success)
+
+    def _publish(self, destination, payload):
+        """
+        Publish a payload, falling back to the spool.
+
+        With a spool, a payload is spooled instead of published while
+        its destination has a spooled backlog (to keep the order), or
+        when the publish fails.
+
+        Parameters
+        ----------
+        destination : str
+            Destination queue.
+        payload : dict or Encoded
+            Payload to publish.
+
+        Raises
+        ------
+        Exception
+            If the publish fails and the payload cannot be spooled;
+            the frame is then left for redelivery.
+        """
+        if self.spool is None:
+            self.publisher.publish(destination, payload)
+            return
+
+        if not self.spool.holds(destination):
+            try:
+                self.publisher.publish(destination, payload)
+                return
+            except TypeError:
+                raise
+            except Exception as e:
+                logger.warning(
+                    "Publish to %s failed, spooling: %s",
+                    destination,
+                    str(e) or type(e).__name__,
+                )
+        self.spool.append(destination, payload)
+
+    def _queues(self, route):
+        """
+        Every destination queue a route can publish to.
+        """
+        return self.lanes.queues(route) if self.lanes is not None else (route.queue,)
+
+    def _enrich(self, event):
+        """
+        Look up repository metadata for an event.
+
+        Parameters
+        ----------
+        event : CompactEvent
+            Validated event.
+
+        Returns
+        -------
+        dict or None
+            Enrichment dict, or None if the lookup failed and
+            enrichment is optional.
+
+        Raises
+        ------
+        EnrichmentError
+            If the lookup failed and `settings.ENRICH_REQUIRED` is set.
+        """
+        with STAGE_SECONDS.time(stage="enrich"):
+            try:
+                return self.enricher.enrich(event)
+            except EnrichmentError as e:
+                if settings.ENRICH_REQUIRED:
+                    raise
+                logger.warning(
+                    "Enrichment failed, publishing without metadata: %s",
+                    e,
+                    extra={"nodeRef": event.nodeRef},
+                )
+                return None
+
+    @staticmethod
+    def _published(routes, on_success=None):
+        """
+        Record confirmed publishes and run the success callback.
+
+        Parameters
+        ----------
+        routes : sequence of str
+            Names of the routes whose payloads were published.
+        on_success : callable, optional
+            Callback to invoke.
+        """
+        for route in routes:
+            ROUTE_PUBLISHED.inc(route=route)
+        if on_success is not None:
+            on_success()
+
+    def _hold(self, frame, node_ref, messages, routes, on_success=None):
+        """
+        Publish non-coalesced payloads and hold the coalesced ones.
+
+        Payloads for routes without coalescing are published
+        immediately (bypassing batching and isolation). The frame is
+        ACKed once every held payload has been published by the
+        coalescer, or NACKed if any of those publishes fails.
+
+        Parameters
+        ----------
+        frame : Any
+            Source STOMP frame.
+        node_ref : str
+            Node the event refers to.
+        messages : list of (str, dict)
+            Destination queue and payload pairs.
+        routes : list of str
+            Route name of each message.
+        on_success : callable, optional
+            Invoked once the frame has been ACKed.
+        """
+        held = []
+        immediate = []
+        for route, (destination, payload) in zip(routes, messages):
+            part = held if destination in self._coalesced else immediate
+            part.append((route, destination, payload))
+
+        with STAGE_SECONDS.time(stage="publish"):
+            for _, destination, payload in immediate:
+                self._publish(destination, payload)
+        self._published([route for route, _, _ in immediate])
+
+        tracker = FrameTracker(
+            self._acknowledge,
+            self._ack_headers(frame),
+            parts=len(held),
+            on_success=on_success,
+        )
+        for route, destination, payload in held:
+            self.coalescer.add(route, destination, node_ref, payload, tracker)
+
+    @staticmethod
+    def _ack_headers(frame) -> dict:
+        """
+        Build ACK/NACK headers for a frame.
+
+        Parameters
+        ----------
+        frame : Any
+            Source STOMP frame.
+
+        Returns
+        -------
+        dict
+            `id` and `subscription` headers.
+        """
+        return {
+            "id": frame.headers.get("ack"),
+            "subscription": frame.headers.get("subscription"),
+        }
+
+    def _acknowledge(self, command: str, headers: dict) -> None:
+        """
+        Send an ACK or NACK frame.
+
+        Parameters
+        ----------
+        command : str
+            "ACK" or "NACK".
+        headers : dict
+            Frame headers.
+        """
+        if not self._claim(headers, command):
+            return
+        with STAGE_SECONDS.time(stage="ack"):
+            self.conn.send_frame(command, headers=headers)
+        (FRAMES_ACKED if command == "ACK" else FRAMES_NACKED).inc()
+
+    def _claim(self, headers: dict, command: str) -> bool:
+        """
+        Take a frame out of the in-flight set before settling it.
+
+        Parameters
+        ----------
+        headers : dict
+            ACK/NACK headers of the frame.
+        command : str
+            "ACK" or "NACK", for logging.
+
+        Returns
+        -------
+        bool
+            False if the frame was received on a lost connection and
+            must not be settled on the current one.
+        """
+        try:
+            self._inflight.remove(headers["id"])
+        except KeyError:
+            # The broker redelivers it on the new subscription
+            logger.debug("Dropping %s for a frame of a lost connection", command)
+            return False
+        return True
+
+    def _send_isolated(self, messages) -> bool:
+        """
+        Publish through per-destination senders and await confirmation.
+
+        With a spool, payloads of failed or timed-out destinations are
+        spooled instead of failing the frame.
+
+        Parameters
+        ----------
+        messages : list of (str, dict)
+            Destination queue and payload pairs.
+
+        Returns
+        -------
+        bool
+            True if every destination confirmed within its timeout
+            (or its payload was spooled).
+        """
+        pending = []
+        for destination, payload in messages:
+            if self.spool is not None and self.spool.holds(destination):
+                self.spool.append(destination, payload)
+                continue
+            timeout = self._timeouts.get(
+                destination, settings.ROUTE_PUBLISH_TIMEOUT_MS / 1000.0
+            )
+            future = self.senders.submit(destination, payload, timeout)
+            pending.append((destination, payload, future, time.monotonic() + timeout))
+
+        ok = True
+        for destination, payload, future, deadline in pending:
+            try:
+                future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except Exception as e:
+                # Skip the send if it is still buffered; the frame is redelivered
+                future.cancel()
+                if self.spool is not None:
+                    logger.warning(
+                        "Publish to %s failed, spooling: %s",
+                        destination,
+                        str(e) or type(e).__name__,
+                    )
+                    self.spool.append(destination, payload)
+                    continue
+                logger.error(
+                    "Publish to %s failed, NACK (redelivery): %s",
+                    destination,
+                    str(e) or type(e).__name__,
+                )
+                ok = False
+        return ok
+
+    def rebind(self, conn):
+        """
+        Switch to a new connection after a reconnect.
+
+        Must be called before the new connection subscribes. Frames
+        still in flight from the lost connection are abandoned: they
+        are skipped if not yet handled, their ACKs and NACKs are
+        dropped, and batched events awaiting commit are discarded. The
+        broker redelivers all of them.
+
+        Parameters
+        ----------
+        conn : Any
+            Newly connected STOMP connection.
+        """
+        abandoned = len(self._inflight)
+        self._inflight = set()
+        self.conn = conn
+        self.publisher.rebind(conn)
+        if self.senders is not None:
+            self.senders.rebind(conn)
+        if self.batcher is not None:
+            self.batcher.rebind(conn)
+        logger.warning(
+            "Listener rebound to new connection",
+            extra={"abandoned_frames": abandoned},
+        )
+
+    def close(self):
+        """
+        Release events waiting for a rate limit, stop the worker
+        pool, flush held, batched and buffered payloads, and close the
+        capture file.
+
+        Must be called before the connection is closed so that
+        in-flight frames can still be ACKed.
+        """
+        if self.limiter is not None:
+            self.limiter.close()
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+        if self.coalescer is not None:
+            self.coalescer.close()
+        if self.batcher is not None:
+            self.batcher.close()
+        if self.senders is not None:
+            self.senders.close()
+        if self.spool is not None:
+            self.spool.close()
+        if self.enricher is not None:
+            self.enricher.close()
+        if self.recorder is not None:
+            self.recorder.close()
 
     def on_heartbeat_timeout(self):
         logger.warning("STOMP heartbeat timeout detected")
 
     def on_disconnected(self):
-        logger.warning("Disconnected from ActiveMQ broker")
+        logger.warning(
+            "Disconnected from ActiveMQ broker",
+            extra={"inflight_frames": len(self._inflight)},
+        )
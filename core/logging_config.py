@@ -10,10 +10,43 @@ This module configures structured, stdout-based logging suitable for:
 - Log aggregation systems (ELK, Loki, CloudWatch)
 
 It supports structured metadata via the `extra` argument on log calls.
+
+Two output formats are available: human-readable text lines with
+`key=value` extras, and one JSON object per line (`LOG_FORMAT=json`).
+
+On the hot path logging should cost as little as possible:
+- With `LOG_ASYNC` the routing threads only enqueue records; a
+  background thread formats and writes them, and records are dropped
+  rather than blocking when the queue is full.
+- `LOG_RATE_LIMITS` caps the records per second of chatty loggers
+  (below WARNING); the number of suppressed records is attached to the
+  next record that passes.
 """
 
+import atexit
 import logging
+import queue
 import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from core.codec import dumps
+from core.metrics import LOG_RECORDS_DROPPED
+from core.ratelimit import TokenBucket, parse_rate_limits
+
+# Attributes every LogRecord has; anything else was passed via `extra`
+STANDARD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message",
+    "asctime",
+    "taskName",
+}
+
+_JSON_SCALARS = (str, int, float, bool, type(None))
+
+# Background writer of the asynchronous handler, if any
+_listener: Optional[QueueListener] = None
 
 
 class SafeExtraFormatter(logging.Formatter):
@@ -24,29 +57,7 @@ class SafeExtraFormatter(logging.Formatter):
     automatically appended to the log output as key=value pairs.
     """
 
-    STANDARD_ATTRS = {
-        "name",
-        "msg",
-        "args",
-        "levelname",
-        "levelno",
-        "pathname",
-        "filename",
-        "module",
-        "exc_info",
-        "exc_text",
-        "stack_info",
-        "lineno",
-        "funcName",
-        "created",
-        "msecs",
-        "relativeCreated",
-        "thread",
-        "threadName",
-        "processName",
-        "process",
-        "asctime",
-    }
+    STANDARD_ATTRS = STANDARD_ATTRS
 
     def format(self, record: logging.LogRecord) -> str:
         """
@@ -77,7 +88,165 @@ class SafeExtraFormatter(logging.Formatter):
         return f"{base_message} | {extra_str}"
 
 
-def setup_logging(log_level: str = "INFO") -> None:
+class JsonFormatter(logging.Formatter):
+    """
+    Logging formatter emitting one JSON object per record.
+
+    Each object has `time` (ISO 8601, UTC), `level`, `logger` and
+    `message`, followed by the `extra` fields and, if present,
+    `exception` and `stack`.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        """
+        Format a log record as a JSON line.
+
+        Parameters
+        ----------
+        record : logging.LogRecord
+            Log record instance.
+
+        Returns
+        -------
+        str
+            JSON object.
+        """
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in STANDARD_ATTRS:
+                entry.setdefault(key, value)
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+
+        try:
+            return dumps(entry)
+        except (TypeError, ValueError):
+            # Extras that are not JSON-serializable are logged as strings
+            return dumps(
+                {
+                    key: value if isinstance(value, _JSON_SCALARS) else str(value)
+                    for key, value in entry.items()
+                }
+            )
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Caps the records per second of selected loggers.
+
+    Each configured logger name (and its children, e.g. `router`
+    covers `router.pipeline`) gets a token bucket. Records at WARNING
+    and above are never dropped. When a record passes after some were
+    dropped, the count is attached to it as `suppressed`.
+    """
+
+    def __init__(self, limits: Dict[str, tuple]):
+        """
+        Parameters
+        ----------
+        limits : dict
+            Logger name to (records per second, burst).
+        """
+        super().__init__()
+        self._buckets = {
+            name: TokenBucket(rate, burst) for name, (rate, burst) in limits.items()
+        }
+        # Resolved bucket per logger name (None if not limited)
+        self._resolved: Dict[str, Optional[TokenBucket]] = {}
+        # Records dropped per bucket since the last one that passed
+        self._suppressed: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """
+        Decide whether a record is emitted.
+
+        Parameters
+        ----------
+        record : logging.LogRecord
+            Log record instance.
+
+        Returns
+        -------
+        bool
+            False if the record is dropped.
+        """
+        if record.levelno >= logging.WARNING:
+            return True
+        try:
+            bucket = self._resolved[record.name]
+        except KeyError:
+            bucket = self._resolved[record.name] = self._resolve(record.name)
+        if bucket is None:
+            return True
+
+        key = id(bucket)
+        if bucket.try_acquire() > 0:
+            with self._lock:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return False
+        if self._suppressed.get(key):
+            with self._lock:
+                suppressed = self._suppressed.pop(key, 0)
+            if suppressed:
+                # Counted in bulk to keep dropping records cheap
+                LOG_RECORDS_DROPPED.inc(suppressed, reason="rate_limited")
+                record.suppressed = suppressed
+        return True
+
+    def _resolve(self, name: str) -> Optional[TokenBucket]:
+        """
+        Bucket of the closest configured ancestor of a logger.
+        """
+        while name:
+            bucket = self._buckets.get(name)
+            if bucket is not None:
+                return bucket
+            name = name.rpartition(".")[0]
+        return None
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """
+    Queue handler that leaves formatting to the listener thread and
+    drops records instead of blocking when the queue is full.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Merge the message arguments, which may change after the call
+        returns; the record is formatted later on the listener thread.
+        """
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc(reason="queue_full")
+
+
+def setup_logging(
+    log_level: str = "INFO",
+    log_format: str = "text",
+    asynchronous: bool = False,
+    rate_limits: str = "",
+    queue_size: int = 10_000,
+) -> None:
     """
     Configure application-wide logging.
 
@@ -85,16 +254,62 @@ def setup_logging(log_level: str = "INFO") -> None:
     ----------
     log_level : str, optional
         Logging level (e.g. DEBUG, INFO, WARNING), by default "INFO".
+    log_format : str, optional
+        "text" or "json", by default "text".
+    asynchronous : bool, optional
+        Write records on a background thread, by default False.
+    rate_limits : str, optional
+        Comma-separated `logger=rate[:burst]` limits in records per
+        second, e.g. "router.pipeline=10"; empty by default.
+    queue_size : int, optional
+        Records buffered for the background thread, by default 10000.
     """
+    global _listener
+
     handler = logging.StreamHandler(sys.stdout)
-    handler.setFormatter(
-        SafeExtraFormatter(
-            fmt="%(asctime)s | %(levelname)-8s | %(name)s | %(message)s",
-            datefmt="%Y-%m-%d %H:%M:%S",
+    if log_format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(
+            SafeExtraFormatter(
+                fmt="%(asctime)s | %(levelname)-8s | %(name)s | %(message)s",
+                datefmt="%Y-%m-%d %H:%M:%S",
+            )
         )
-    )
+
+    _stop_listener()
+    if asynchronous:
+        records: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=queue_size)
+        _listener = QueueListener(records, handler)
+        _listener.start()
+        atexit.register(_stop_listener)
+        handler = _NonBlockingQueueHandler(records)
+
+    limits = parse_rate_limits(rate_limits, "LOG_RATE_LIMITS")
+    if limits:
+        # On the calling side, so dropped records are never queued
+        handler.addFilter(RateLimitFilter(limits))
+
+    # Skip collecting record attributes neither format uses; see
+    # "Optimization" in the logging HOWTO
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    logging.logAsyncioTasks = False
 
     root_logger = logging.getLogger()
     root_logger.setLevel(log_level.upper())
     root_logger.handlers.clear()
     root_logger.addHandler(handler)
+
+
+def _stop_listener() -> None:
+    """
+    Flush and stop the background writer, if running.
+    """
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
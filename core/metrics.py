@@ -0,0 +1,483 @@
+"""
+core.metrics
+============
+
+Lightweight in-process metrics with a Prometheus-compatible endpoint.
+
+The router exposes counters for frame handling and per-route
+publishing, plus latency histograms for every processing stage
+(parse, validate, route, enrich, publish, ack). Together they show
+whether broker I/O, schema validation or route logic dominates
+processing time.
+
+No third-party client library is required: metrics are kept in
+memory and rendered in the Prometheus text exposition format by a
+small HTTP server started from `main` when `settings.METRICS_PORT` is
+set.
+
+Design principles:
+- Cheap to record from any thread
+- Fixed metric set declared at import time
+- No dependency on the transport or routing layers
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("router.metrics")
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class _Metric:
+    """
+    Base class holding name, help text and label names.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        """
+        Convert keyword labels into an ordered key.
+        """
+        if len(labels) != len(self.labelnames):
+            raise ValueError(
+                f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        """
+        Render a label set in exposition format.
+        """
+        pairs = [
+            f'{name}="{_escape(value)}"'
+            for name, value in zip(self.labelnames, key)
+        ]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        """
+        Render the metric in exposition format.
+
+        Returns
+        -------
+        list of str
+            Exposition lines including HELP and TYPE.
+        """
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+
+class Counter(_Metric):
+    """
+    Monotonically increasing counter.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """
+        Increment the counter.
+
+        Parameters
+        ----------
+        amount : float, optional
+            Increment, by default 1.
+        **labels : str
+            Label values.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        """
+        Current value for a label set.
+
+        Returns
+        -------
+        float
+            Counter value (0 if never incremented).
+        """
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = list(self._values.items())
+        if not items and not self.labelnames:
+            items = [((), 0)]
+        for key, value in items:
+            lines.append(f"{self.name}{self._format_labels(key)} {value:g}")
+        return lines
+
+
+class Gauge(Counter):
+    """
+    Value that can go up and down.
+    """
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        """
+        Set the gauge.
+
+        Parameters
+        ----------
+        value : float
+            New value.
+        **labels : str
+            Label values.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """
+    Cumulative histogram of observed values (typically seconds).
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [bucket counts..., count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """
+        Record an observation.
+
+        Parameters
+        ----------
+        value : float
+            Observed value.
+        **labels : str
+            Label values.
+        """
+        key = self._key(labels)
+        buckets = self.buckets
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(buckets) + 2)
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    state[index] += 1
+                    break
+            state[-2] += 1
+            state[-1] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """
+        Observe the duration of a block in seconds.
+
+        Parameters
+        ----------
+        **labels : str
+            Label values.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        """
+        Number of observations for a label set.
+
+        Returns
+        -------
+        int
+            Observation count.
+        """
+        state = self._values.get(self._key(labels))
+        return int(state[-2]) if state else 0
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        for key, state in items:
+            cumulative = 0
+            for bound, hits in zip(self.buckets, state):
+                cumulative += hits
+                labels = self._format_labels(key, f'le="{bound:g}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative:g}")
+            labels = self._format_labels(key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {state[-2]:g}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {state[-2]:g}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {state[-1]:.6f}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Collection of metrics rendered together.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """
+        Create and register a counter.
+        """
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        """
+        Create and register a gauge.
+        """
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        """
+        Create and register a histogram.
+        """
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """
+        Render all metrics in Prometheus text exposition format.
+
+        Returns
+        -------
+        str
+            Exposition document.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    """
+    Escape a label value for the exposition format.
+    """
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# ----------------------------------------------------------------------
+# Router metrics
+# ----------------------------------------------------------------------
+registry = MetricsRegistry()
+
+FRAMES_RECEIVED = registry.counter(
+    "router_frames_received_total",
+    "Frames received from the event topic",
+)
+FRAMES_REDELIVERED = registry.counter(
+    "router_frames_redelivered_total",
+    "Received frames flagged as redelivered by the broker",
+)
+FRAMES_ACKED = registry.counter(
+    "router_frames_acked_total",
+    "Frames acknowledged to the broker",
+)
+FRAMES_NACKED = registry.counter(
+    "router_frames_nacked_total",
+    "Frames negatively acknowledged for redelivery",
+)
+FRAMES_DROPPED = registry.counter(
+    "router_frames_dropped_total",
+    "Frames ACKed without publishing, by reason",
+    ("reason",),
+)
+FRAMES_FAILED = registry.counter(
+    "router_frames_failed_total",
+    "Frames whose processing failed with an unexpected router error",
+)
+SCHEMA_FALLBACK = registry.counter(
+    "router_schema_fallback_total",
+    "Events with an unknown schemaVersion decoded by the fallback decoder",
+)
+DEAD_LETTERED = registry.counter(
+    "router_dead_lettered_total",
+    "Events forwarded to the dead-letter queue, by failure reason",
+    ("reason",),
+)
+ROUTE_MATCHED = registry.counter(
+    "router_route_matched_total",
+    "Events matched by a route",
+    ("route",),
+)
+ROUTE_PUBLISHED = registry.counter(
+    "router_route_published_total",
+    "Payloads of a route confirmed published",
+    ("route",),
+)
+EVENTS_COALESCED = registry.counter(
+    "router_events_coalesced_total",
+    "Events superseded by a newer event for the same node",
+    ("queue",),
+)
+ENRICH_LOOKUPS = registry.counter(
+    "router_enrich_lookups_total",
+    "Node metadata lookups by outcome (cached, shared, fetched, failed)",
+    ("result",),
+)
+LANE_EVENTS = registry.counter(
+    "router_lane_events_total",
+    "Events of lane routes by lane (small, large)",
+    ("lane",),
+)
+RATE_LIMITED = registry.counter(
+    "router_rate_limited_total",
+    "Events that waited for a rate-limit token, by route",
+    ("route",),
+)
+RATE_LIMIT_SCALE = registry.gauge(
+    "router_rate_limit_scale",
+    "Fraction of the configured rate currently granted, by route",
+    ("route",),
+)
+FLOW_QUEUE_DEPTH = registry.gauge(
+    "router_flow_queue_depth",
+    "Destination queue depth reported by the broker statistics plugin",
+    ("queue",),
+)
+RECONNECT_ATTEMPTS = registry.counter(
+    "router_reconnect_attempts_total",
+    "Broker reconnect attempts by result (ok, failed)",
+    ("result",),
+)
+RECOVERY_SECONDS = registry.histogram(
+    "router_reconnect_recovery_seconds",
+    "Time from losing the broker connection until consuming again",
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+SPOOLED = registry.counter(
+    "router_spooled_total",
+    "Payloads written to the local spool, by queue",
+    ("queue",),
+)
+SPOOL_DRAINED = registry.counter(
+    "router_spool_drained_total",
+    "Spooled payloads republished by the drainer, by queue",
+    ("queue",),
+)
+SPOOL_PENDING = registry.gauge(
+    "router_spool_pending",
+    "Payloads in the spool awaiting republishing",
+)
+SPOOL_BYTES = registry.gauge(
+    "router_spool_bytes",
+    "Size of the spool segment files",
+)
+LOG_RECORDS_DROPPED = registry.counter(
+    "router_log_records_dropped_total",
+    "Log records dropped by rate limits or a full log queue, by reason",
+    ("reason",),
+)
+STAGE_SECONDS = registry.histogram(
+    "router_stage_seconds",
+    "Time spent per processing stage",
+    ("stage",),
+)
+
+
+# ----------------------------------------------------------------------
+# HTTP exposition
+# ----------------------------------------------------------------------
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Serves the registry at /metrics.
+    """
+
+    def do_GET(self):  # noqa: N802 - http.server naming
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # noqa: A002 - signature from base
+        logger.debug("metrics request: " + format, *args)
+
+
+def start_metrics_server(host: str, port: int) -> Optional[ThreadingHTTPServer]:
+    """
+    Serve metrics over HTTP on a daemon thread.
+
+    Parameters
+    ----------
+    host : str
+        Bind address.
+    port : int
+        TCP port; 0 disables the endpoint.
+
+    Returns
+    -------
+    ThreadingHTTPServer or None
+        Running server, or None when disabled.
+    """
+    if port <= 0:
+        return None
+
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever,
+        name="router-metrics",
+        daemon=True,
+    ).start()
+
+    logger.info("Metrics endpoint started", extra={"host": host, "port": port})
+    return server
@@ -0,0 +1,371 @@
+"""
+core.pipeline
+=============
+
+Runtime-independent stages of event handling.
+
+The threaded listener and the asyncio router decode frames, discard
+events no route can match, validate the schema (with the decoder of
+the event's schema version, see `core.decoders`), suppress duplicates
+and build the payloads of the matched routes in exactly the same way.
+Those stages live here so the two runtimes cannot drift apart; only
+waiting (enrichment lookups, rate limits), publishing and
+acknowledgement stay with each runtime.
+
+Route evaluation runs in two steps: `match_routes` (or
+`match_routes_async` for the asynchronous route hooks) applies the
+routes' conditions and transforms, and `route_messages` turns the
+matches into destination / payload pairs, adding enrichment, output
+encodings and lanes.
+
+`EventPayloads` builds the payloads of one event for its matched
+routes. Routes that keep the default `transform` share one
+serialization of the event per output encoding, so an event fanned
+out to N queues is dumped and encoded once instead of N times.
+"""
+
+import logging
+from typing import Any, Dict, Hashable, List, NamedTuple, Optional, Tuple, Union
+
+from core.base import BaseRoute
+from core.cache import TTLCache
+from core.codec import Encoded, loads
+from core.decoders import DecoderRegistry
+from core.encodings import PayloadEncoding
+from core.enrichment import Enricher
+from core.lanes import LanePolicy
+from core.metrics import FRAMES_DROPPED, ROUTE_MATCHED, STAGE_SECONDS
+from core.ratelimit import RateLimiter
+from core.registry import RouteTable
+from core.schema import CompactEvent, EventEnvelope
+
+logger = logging.getLogger("router.pipeline")
+
+
+class PreparedEvent(NamedTuple):
+    """
+    A validated event ready for route evaluation.
+    """
+
+    event: CompactEvent
+    candidates: List[BaseRoute]
+    dedup_key: Optional[Hashable]
+
+
+def prepare(
+    body: Union[str, bytes],
+    table: RouteTable,
+    decoders: DecoderRegistry,
+    dedup: Optional[TTLCache] = None,
+) -> Optional[PreparedEvent]:
+    """
+    Decode and validate a frame body.
+
+    Parameters
+    ----------
+    body : str or bytes
+        Frame body.
+    table : RouteTable
+        Compiled route table.
+    decoders : DecoderRegistry
+        Event decoders per schema version.
+    dedup : TTLCache, optional
+        Keys of recently published events.
+
+    Returns
+    -------
+    PreparedEvent or None
+        Validated event with its candidate routes, or None when the
+        event is ignored or a duplicate and should be ACKed and
+        dropped.
+
+    Raises
+    ------
+    json.JSONDecodeError
+        If the body is not valid JSON.
+    pydantic.ValidationError
+        If the event does not match the schema.
+    core.decoders.UnsupportedSchemaVersion
+        If the schema version is unknown and there is no fallback.
+    """
+    with STAGE_SECONDS.time(stage="parse"):
+        raw_data = loads(body)
+
+    envelope = EventEnvelope.peek(raw_data)
+    if envelope is None:
+        # Not a JSON object: let schema validation reject it
+        candidates = table.routes
+    else:
+        candidates = table.candidates(
+            envelope.eventType, envelope.path, envelope.mimeType
+        )
+        if not candidates:
+            logger.info(
+                "Ignoring eventType=%s path=%s",
+                envelope.eventType,
+                envelope.path,
+            )
+            FRAMES_DROPPED.inc(reason="ignored")
+            return None
+
+    with STAGE_SECONDS.time(stage="validate"):
+        event = decoders.decode(
+            raw_data, envelope.schemaVersion if envelope is not None else None
+        )
+
+    # Checked first so the extra dict is only built when it is logged
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "Event received",
+            extra={
+                "eventType": event.eventType,
+                "nodeRef": event.nodeRef,
+                "path": event.path,
+            },
+        )
+
+    key = None
+    if dedup is not None:
+        key = dedup_key(event)
+        if key in dedup:
+            FRAMES_DROPPED.inc(reason="duplicate")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    "Duplicate event suppressed, ACK & drop",
+                    extra={"nodeRef": event.nodeRef, "versionLabel": event.versionLabel},
+                )
+            return None
+
+    return PreparedEvent(event, candidates, key)
+
+
+class Match(NamedTuple):
+    """
+    A route whose conditions matched an event.
+    """
+
+    route: BaseRoute
+    # Extra fields of a route with the default payload, else its payload
+    fields: Dict
+    # Whether the route publishes the default payload
+    shared: bool
+
+
+def match_routes(event: CompactEvent, candidates: List[BaseRoute]) -> List[Match]:
+    """
+    Apply the candidate routes' conditions and transforms to an event.
+
+    Parameters
+    ----------
+    event : CompactEvent
+        Validated event.
+    candidates : list of BaseRoute
+        Routes that may match, from `prepare`.
+
+    Returns
+    -------
+    list of Match
+        Matched routes, in candidate order.
+    """
+    matches = []
+    for route in candidates:
+        if route.should_route(event):
+            ROUTE_MATCHED.inc(route=route.name)
+            shared = shares_encoding(route)
+            fields = route.extra_fields(event) if shared else route.transform(event)
+            matches.append(Match(route, fields, shared))
+        else:
+            logger.info("Ignoring eventType=%s path=%s", event.eventType, event.path)
+    return matches
+
+
+async def match_routes_async(
+    event: CompactEvent, candidates: List[BaseRoute]
+) -> List[Match]:
+    """
+    `match_routes` with the asynchronous route hooks.
+    """
+    matches = []
+    for route in candidates:
+        if await route.should_route_async(event):
+            ROUTE_MATCHED.inc(route=route.name)
+            shared = shares_encoding(route)
+            fields = (
+                route.extra_fields(event)
+                if shared
+                else await route.transform_async(event)
+            )
+            matches.append(Match(route, fields, shared))
+        else:
+            logger.info("Ignoring eventType=%s path=%s", event.eventType, event.path)
+    return matches
+
+
+def needs_enrichment(matches: List[Match], enricher: Optional[Enricher]) -> bool:
+    """
+    Whether any matched route is enriched, so the runtime has to look
+    up the event's repository metadata before `route_messages`.
+    """
+    return enricher is not None and any(
+        match.route.name in enricher.routes for match in matches
+    )
+
+
+def route_messages(
+    event: CompactEvent,
+    matches: List[Match],
+    encodings: Dict[str, PayloadEncoding],
+    enricher: Optional[Enricher] = None,
+    enrichment: Optional[Dict] = None,
+    lanes: Optional[LanePolicy] = None,
+    limiter: Optional[RateLimiter] = None,
+) -> Tuple[List[Tuple[str, Any]], List[str]]:
+    """
+    Build the messages of the matched routes.
+
+    Routes with the default payload share one encoding of the event;
+    enriched routes get the `enrichment` field and lane routes are
+    directed to the event's lane.
+
+    Parameters
+    ----------
+    event : CompactEvent
+        Validated event.
+    matches : list of Match
+        Matched routes, from `match_routes`.
+    encodings : dict of str to PayloadEncoding
+        Output encoding per route name.
+    enricher : Enricher, optional
+        Enricher, whose `routes` are the enriched route names.
+    enrichment : dict, optional
+        Repository metadata looked up by the runtime, if
+        `needs_enrichment`; None when the lookup failed.
+    lanes : LanePolicy, optional
+        Lane policy.
+    limiter : RateLimiter, optional
+        Rate limiter.
+
+    Returns
+    -------
+    tuple
+        Destination queue and payload pairs, one per match in the
+        order of `matches`, and the names of the rate-limited routes
+        the runtime has to wait for.
+    """
+    messages = []
+    limited = []
+    payloads = EventPayloads(event)
+    lane = None
+    for route, fields, shared in matches:
+        if enricher is not None and route.name in enricher.routes:
+            fields = {**fields, "enrichment": enrichment}
+        encoding = encodings[route.name]
+        payload = payloads.encoded(encoding, fields) if shared else encoding.encode(fields)
+        destination = route.queue
+        if lanes is not None and route.name in lanes.routes:
+            if lane is None:
+                lane = lanes.classify(event)
+            destination, payload = lanes.apply(destination, payload, lane)
+        messages.append((destination, payload))
+        if limiter is not None and route.name in limiter.buckets:
+            limited.append(route.name)
+    return messages, limited
+
+
+def dedup_key(event: CompactEvent) -> Hashable:
+    """
+    Identity of an event for duplicate suppression.
+
+    Parameters
+    ----------
+    event : CompactEvent
+        Validated event.
+
+    Returns
+    -------
+    tuple
+        Node, event type, version and size.
+    """
+    return (event.nodeRef, event.eventType, event.versionLabel, event.size)
+
+
+def shares_encoding(route: BaseRoute) -> bool:
+    """
+    Whether a route publishes the default payload.
+
+    Parameters
+    ----------
+    route : BaseRoute
+        Route to inspect.
+
+    Returns
+    -------
+    bool
+        True if neither `transform` nor `transform_async` is
+        overridden, so the route's payload is the event plus its
+        `extra_fields`.
+    """
+    cls = type(route)
+    return (
+        cls.transform is BaseRoute.transform
+        and cls.transform_async is BaseRoute.transform_async
+    )
+
+
+class EventPayloads:
+    """
+    Shared serialization of one event for the default payload.
+
+    The event is dumped on first use and encoded once per output
+    encoding; fields added per route are appended to the encoded JSON
+    text where the encoding allows it.
+    """
+
+    __slots__ = ("event", "_data", "_encoded")
+
+    def __init__(self, event: CompactEvent):
+        """
+        Parameters
+        ----------
+        event : CompactEvent
+            Validated event.
+        """
+        self.event = event
+        self._data: Optional[Dict] = None
+        self._encoded: Dict[str, Encoded] = {}
+
+    def encoded(
+        self,
+        encoding: PayloadEncoding,
+        fields: Optional[Dict] = None,
+    ) -> Encoded:
+        """
+        Default payload with additional fields, encoded.
+
+        Parameters
+        ----------
+        encoding : PayloadEncoding
+            Output encoding of the route.
+        fields : dict, optional
+            Fields added to the event, e.g. from
+            `BaseRoute.extra_fields`.
+
+        Returns
+        -------
+        Encoded
+            Encoded payload, ready to publish.
+        """
+        if self._data is None:
+            self._data = self.event.model_dump()
+        base = self._encoded.get(encoding.name)
+        if base is None:
+            base = self._encoded[encoding.name] = encoding.encode(self._data)
+
+        if fields:
+            fields = encoding.prepare(fields)
+        if not fields:
+            return base
+        if encoding.splices and fields.keys().isdisjoint(self._data):
+            return encoding.extend(base, fields)
+        # Replaces event fields (splicing would repeat keys) or binary body
+        return encoding.encode({**self._data, **fields})
@@ -0,0 +1,123 @@
+"""
+core.prefix
+===========
+
+Precompiled path-prefix matching.
+
+Routes frequently need to include or exclude repository folders by
+path prefix. Checking every prefix with `str.startswith` costs
+O(prefixes) per event and grows with every exclusion list.
+
+`PrefixIndex` compiles a set of prefixes into a hash table bucketed by
+prefix length. Matching a path performs one dictionary lookup per
+distinct prefix length, independent of the number of prefixes, and
+reports every prefix the path starts with in a single pass.
+
+Matching uses plain string-prefix semantics, identical to
+`path.startswith(prefix)`.
+"""
+
+from typing import Dict, Generic, Iterable, Iterator, List, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class PrefixIndex(Generic[T]):
+    """
+    Immutable index from path prefixes to associated values.
+
+    Examples
+    --------
+    >>> index = PrefixIndex([("/Company Home/Sites", "sites")])
+    >>> list(index.match("/Company Home/Sites/hr/doc.pdf"))
+    ['sites']
+    """
+
+    __slots__ = ("_table", "_lengths")
+
+    def __init__(self, entries: Iterable[Tuple[str, T]] = ()):
+        """
+        Compile the index.
+
+        Parameters
+        ----------
+        entries : iterable of (str, Any)
+            Prefix and value pairs. A prefix may appear more than once;
+            all of its values are reported on a match.
+        """
+        table: Dict[str, List[T]] = {}
+        for prefix, value in entries:
+            table.setdefault(prefix, []).append(value)
+
+        self._table: Dict[str, Tuple[T, ...]] = {
+            prefix: tuple(values) for prefix, values in table.items()
+        }
+        self._lengths: Tuple[int, ...] = tuple(sorted({len(p) for p in table}))
+
+    @classmethod
+    def of(cls, prefixes: Iterable[str]) -> "PrefixIndex[str]":
+        """
+        Build an index whose values are the prefixes themselves.
+
+        Parameters
+        ----------
+        prefixes : iterable of str
+            Path prefixes.
+
+        Returns
+        -------
+        PrefixIndex
+            Compiled index.
+        """
+        return cls((prefix, prefix) for prefix in prefixes)
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def match(self, path: str) -> Iterator[T]:
+        """
+        Yield the values of every prefix `path` starts with.
+
+        Values are yielded from the shortest to the longest prefix.
+
+        Parameters
+        ----------
+        path : str
+            Repository path.
+
+        Yields
+        ------
+        Any
+            Values associated with matching prefixes.
+        """
+        table = self._table
+        size = len(path)
+        for length in self._lengths:
+            if length > size:
+                return
+            values = table.get(path[:length])
+            if values:
+                yield from values
+
+    def matches(self, path: str) -> bool:
+        """
+        Check whether `path` starts with any indexed prefix.
+
+        Parameters
+        ----------
+        path : str
+            Repository path.
+
+        Returns
+        -------
+        bool
+            True if at least one prefix matches.
+        """
+        table = self._table
+        size = len(path)
+        for length in self._lengths:
+            if length > size:
+                return False
+            if path[:length] in table:
+                return True
+        return False
@@ -8,13 +8,34 @@ This module provides a thin abstraction over the STOMP connection
 used by the router to publish transformed event payloads to
 ActiveMQ queues.
 
+Three publishers are available:
+- `QueuePublisher` sends on a single connection, typically the one
+  consuming the event topic
+- `PooledQueuePublisher` spreads sends across a pool of dedicated
+  producer connections, so slow destinations or broker flow control
+  cannot stall consumption of the durable subscription
+- `AsyncQueuePublisher` sends on an `AsyncStompConnection` for the
+  asyncio runtime
+
 Design principles:
 - Minimal logic at the transport layer
 - No business or routing decisions
-- Explicit, JSON-only payloads
+- Explicit payloads: dicts are sent as JSON; pre-encoded payloads
+  (`core.codec.Encoded`, see `core.encodings`) are sent as-is with
+  their content-type / content-encoding headers
 """
 
-import json
+import itertools
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from core.codec import Encoded, encode
+from core.receipts import ReceiptWaiter
+
+logger = logging.getLogger("router.publisher")
+
 
 class QueuePublisher:
     """
@@ -34,7 +55,12 @@ class QueuePublisher:
         """
         self.conn = conn
 
-    def publish(self, destination: str, payload: dict):
+    def publish(
+        self,
+        destination: str,
+        payload: dict,
+        transaction: Optional[str] = None,
+    ):
         """
         Publish a message to a queue.
 
@@ -42,19 +68,390 @@ class QueuePublisher:
         ----------
         destination : str
             Queue name.
-        payload : dict
-            Message payload to publish. Must be JSON-serializable.
+        payload : dict or Encoded
+            Message payload to publish. Must be JSON-serializable;
+            `Encoded` payloads are sent as-is.
+        transaction : str, optional
+            STOMP transaction id the send belongs to.
+
+        Raises
+        ------
+        TypeError
+            If the payload cannot be serialized to JSON.
+        """
+        _send(self.conn, destination, payload, transaction)
+
+    def publish_batch(
+        self,
+        messages: Sequence[Tuple[str, Dict]],
+        transaction: Optional[str] = None,
+    ):
+        """
+        Publish several messages.
+
+        Parameters
+        ----------
+        messages : sequence of (str, dict)
+            Destination queue and payload pairs.
+        transaction : str, optional
+            STOMP transaction id the sends belong to.
+        """
+        for destination, payload in messages:
+            _send(self.conn, destination, payload, transaction)
+
+    def dedicated(self) -> "QueuePublisher":
+        """
+        Publisher with a connection of its own, for a single sender.
+
+        Returns
+        -------
+        QueuePublisher
+            This publisher; the connection is owned by the caller and
+            cannot be duplicated.
+        """
+        return self
+
+    def rebind(self, conn):
+        """
+        Publish on a new connection after a reconnect.
+
+        Parameters
+        ----------
+        conn : Any
+            Newly connected STOMP connection.
+        """
+        self.conn = conn
+
+    def close(self):
+        """
+        Release publisher resources.
+
+        The connection is owned by the caller and left open.
+        """
+
+
+class PooledQueuePublisher(QueuePublisher):
+    """
+    Queue publisher backed by a pool of dedicated producer connections.
+
+    Connections are opened lazily on first use and health-checked each
+    time they are leased; a connection that is disconnected or fails a
+    send is discarded and transparently re-established on its next use.
+
+    Sends are spread round-robin across the pool. Each connection is
+    used by one thread at a time, so the pool size bounds the number
+    of concurrent in-flight sends.
+
+    The source frame is ACKed on the consumer connection, which does
+    not order it after frames written on a producer connection. Every
+    SEND (or the COMMIT of a batch) therefore carries a receipt, and a
+    publish only returns once the broker has confirmed it; a missing
+    or failed receipt raises, so the caller NACKs or spools the event
+    instead of ACKing it.
+    """
+
+    def __init__(self, connect: Callable, size: int):
+        """
+        Initialize the pool. No connection is opened yet.
+
+        Parameters
+        ----------
+        connect : callable
+            Zero-argument factory returning a connected STOMP
+            connection. Must not reuse the consumer's client-id.
+        size : int
+            Number of producer connections.
+        """
+        if size < 1:
+            raise ValueError("size must be >= 1")
+
+        super().__init__(conn=None)
+        self._connect = connect
+        self._conns: List = [None] * size
+        self._locks = [threading.Lock() for _ in range(size)]
+        self._receipts = [ReceiptWaiter(f"p{index}") for index in range(size)]
+        self._counter = itertools.count()
+
+        logger.info("Publisher pool configured", extra={"connections": size})
+
+    @property
+    def size(self) -> int:
+        """
+        Number of producer connections.
+
+        Returns
+        -------
+        int
+            Pool size.
+        """
+        return len(self._conns)
+
+    def publish(
+        self,
+        destination: str,
+        payload: dict,
+        transaction: Optional[str] = None,
+    ):
+        """
+        Publish a message on the next pooled connection and wait for
+        the broker to confirm it.
+
+        Parameters
+        ----------
+        destination : str
+            Queue name.
+        payload : dict or Encoded
+            Message payload to publish. Must be JSON-serializable;
+            `Encoded` payloads are sent as-is.
+        transaction : str, optional
+            Ignored. Transactions belong to a single connection and
+            cannot span the consumer and producer connections.
 
         Raises
         ------
         TypeError
             If the payload cannot be serialized to JSON.
+        TimeoutError
+            If the broker did not confirm the send in time.
+        RuntimeError
+            If the broker rejected the send or the connection was lost.
         """
-        self.conn.send(
+        with self._lease() as (conn, receipts):
+            receipts.confirm(
+                lambda receipt: _send(conn, destination, payload, None, receipt)
+            )
+
+    def publish_batch(
+        self,
+        messages: Sequence[Tuple[str, Dict]],
+        transaction: Optional[str] = None,
+    ):
+        """
+        Publish several messages in one producer-side transaction.
+
+        The producer transaction is committed, and the COMMIT confirmed
+        by the broker, before this method returns, so a caller ACKing in
+        its own consumer transaction afterwards still ACKs only after a
+        successful publish.
+
+        Parameters
+        ----------
+        messages : sequence of (str, dict)
+            Destination queue and payload pairs.
+        transaction : str, optional
+            Ignored; see `publish`.
+
+        Raises
+        ------
+        TimeoutError
+            If the broker did not confirm the commit in time.
+        RuntimeError
+            If the broker rejected the commit or the connection was lost.
+        """
+        if not messages:
+            return
+
+        with self._lease() as (conn, receipts):
+            tx = conn.begin()
+            try:
+                for destination, payload in messages:
+                    _send(conn, destination, payload, tx)
+                receipts.confirm(
+                    lambda receipt: conn.commit(tx, headers={"receipt": receipt})
+                )
+            except Exception:
+                try:
+                    conn.abort(tx)
+                except Exception:
+                    pass
+                raise
+
+    def dedicated(self) -> "PooledQueuePublisher":
+        """
+        Publisher with a producer connection of its own, for a single
+        sender.
+
+        The connection is not shared with this pool's round-robin
+        leases, so a send blocked on it (e.g. by producer flow control)
+        holds up no other sender.
+
+        Returns
+        -------
+        PooledQueuePublisher
+            Pool of one connection, opened on first use.
+        """
+        return PooledQueuePublisher(self._connect, size=1)
+
+    def rebind(self, conn):
+        """
+        Re-establish the producer connections after the consumer
+        reconnected.
+
+        The pool does not use the consumer connection, but whatever
+        dropped it (e.g. a broker restart) has most likely dropped
+        the producer connections too. They are closed and reopened
+        lazily on their next use.
+
+        Parameters
+        ----------
+        conn : Any
+            Newly connected consumer connection; unused.
+        """
+        self.close()
+
+    def close(self):
+        """
+        Disconnect every open producer connection.
+        """
+        for index, lock in enumerate(self._locks):
+            with lock:
+                self._discard(index)
+
+    @contextmanager
+    def _lease(self) -> Iterator:
+        """
+        Check out the next healthy connection from the pool.
+
+        Yields
+        ------
+        tuple
+            Connected STOMP connection, exclusively held by the caller,
+            and the `ReceiptWaiter` listening on it.
+        """
+        index = next(self._counter) % len(self._conns)
+
+        with self._locks[index]:
+            conn = self._conns[index]
+            if conn is None or not conn.is_connected():
+                if conn is not None:
+                    logger.warning("Producer connection %d lost, reconnecting", index)
+                    self._discard(index)
+                conn = self._conns[index] = self._connect()
+                conn.set_listener("receipts", self._receipts[index])
+                logger.info("Producer connection %d established", index)
+
+            try:
+                yield conn, self._receipts[index]
+            except TypeError:
+                # Serialization error; the connection is still healthy
+                raise
+            except Exception:
+                self._discard(index)
+                raise
+
+    def _discard(self, index: int) -> None:
+        """
+        Drop a pooled connection. Caller must hold its lock.
+        """
+        conn, self._conns[index] = self._conns[index], None
+        if conn is None:
+            return
+        try:
+            if conn.is_connected():
+                conn.disconnect()
+        except Exception:
+            logger.debug("Error closing producer connection %d", index)
+
+
+class AsyncQueuePublisher:
+    """
+    Queue message publisher for the asyncio runtime.
+    """
+
+    def __init__(self, conn):
+        """
+        Parameters
+        ----------
+        conn : AsyncStompConnection
+            Connected asyncio STOMP connection.
+        """
+        self.conn = conn
+
+    async def publish(
+        self,
+        destination: str,
+        payload: dict,
+        transaction: Optional[str] = None,
+    ):
+        """
+        Publish a message to a queue.
+
+        Parameters
+        ----------
+        destination : str
+            Queue name.
+        payload : dict or Encoded
+            Message payload to publish. Must be JSON-serializable;
+            `Encoded` payloads are sent as-is.
+        transaction : str, optional
+            STOMP transaction id the send belongs to.
+
+        Raises
+        ------
+        TypeError
+            If the payload cannot be serialized to JSON.
+        """
+        await self.conn.send(
             destination=destination,
-            body=json.dumps(payload),
-            headers={
-                "persistent": "true",
-                "content-type": "application/json",
-            },
+            body=encode(payload),
+            headers=_headers(payload, transaction),
         )
+
+    def rebind(self, conn):
+        """
+        Publish on a new connection after a reconnect.
+
+        Parameters
+        ----------
+        conn : AsyncStompConnection
+            Newly connected asyncio STOMP connection.
+        """
+        self.conn = conn
+
+    async def close(self):
+        """
+        Release publisher resources.
+
+        The connection is owned by the caller and left open.
+        """
+
+
+def _headers(payload, transaction: Optional[str]) -> Dict[str, str]:
+    """
+    Headers for a published message.
+    """
+    headers = {"persistent": "true"}
+    if isinstance(payload, Encoded):
+        if payload.headers:
+            headers.update(payload.headers)
+        headers["content-type"] = payload.content_type
+        if payload.content_encoding:
+            headers["content-encoding"] = payload.content_encoding
+        if payload.priority is not None:
+            headers["priority"] = str(payload.priority)
+    else:
+        headers["content-type"] = "application/json"
+    if transaction:
+        headers["transaction"] = transaction
+    return headers
+
+
+def _send(
+    conn,
+    destination: str,
+    payload: dict,
+    transaction: Optional[str],
+    receipt: Optional[str] = None,
+):
+    """
+    Serialize a payload (unless already encoded) and send it on a
+    connection, optionally requesting a receipt.
+    """
+    headers = _headers(payload, transaction)
+    if receipt:
+        headers["receipt"] = receipt
+    conn.send(
+        destination=destination,
+        body=encode(payload),
+        headers=headers,
+    )
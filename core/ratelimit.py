@@ -0,0 +1,460 @@
+"""
+core.ratelimit
+==============
+
+Per-route rate limiting with optional adaptive flow control.
+
+The router normally forwards events as fast as the topic delivers
+them. During bulk imports that floods slow workers (e.g. GPU-backed
+auto-tagging) and makes the broker page their queues to disk. Routes
+listed in `settings.ROUTE_RATE_LIMITS` are given a token bucket
+(`rate` events per second, up to `burst` at once).
+
+Waiting for a token happens on the thread (or asyncio task) handling
+the event, before anything is published, so the frame stays un-ACKed
+while it waits. Once worker threads or the asyncio concurrency limit
+are saturated no further frames are taken, the broker's prefetch
+window fills up and the broker stops delivering; nothing is buffered
+beyond the prefetch window.
+
+Adaptive flow control
+---------------------
+With `FLOW_PROBE_INTERVAL_SECONDS > 0`, `QueueDepthProbe` asks
+ActiveMQ's statistics plugin (`statisticsBrokerPlugin` in
+`activemq.xml`) for the depth of every rate-limited destination. A
+route's rate is scaled down linearly from full rate at
+`FLOW_QUEUE_LOW_WATERMARK` queued messages to zero (paused) at
+`FLOW_QUEUE_HIGH_WATERMARK`, so the router backs off while the
+workers catch up.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from settings import settings
+from core.codec import loads
+from core.metrics import FLOW_QUEUE_DEPTH, RATE_LIMIT_SCALE, RATE_LIMITED, STAGE_SECONDS
+
+logger = logging.getLogger("router.ratelimit")
+
+# Longest single sleep while waiting, so rate changes and close() are seen
+_MAX_SLEEP = 0.5
+
+_STATISTICS_PREFIX = "/queue/ActiveMQ.Statistics.Destination."
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+    """
+
+    __slots__ = ("rate", "burst", "scale", "_tokens", "_updated", "_lock")
+
+    def __init__(self, rate: float, burst: float):
+        """
+        Parameters
+        ----------
+        rate : float
+            Tokens added per second.
+        burst : float
+            Bucket capacity; the bucket starts full.
+        """
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be > 0 and burst >= 1")
+        self.rate = rate
+        self.burst = burst
+        # Fraction of `rate` currently granted (adaptive flow control)
+        self.scale = 1.0
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """
+        Take a token if one is available.
+
+        Returns
+        -------
+        float
+            0 if a token was taken, otherwise the seconds until one
+            is expected (infinity while the bucket is paused).
+        """
+        with self._lock:
+            now = time.monotonic()
+            rate = self.rate * self.scale
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            if rate <= 0:
+                return float("inf")
+            return (1 - self._tokens) / rate
+
+
+class RateLimiter:
+    """
+    Token buckets for rate-limited routes.
+    """
+
+    def __init__(
+        self,
+        buckets: Dict[str, TokenBucket],
+        queues: Optional[Dict[str, Tuple[str, ...]]] = None,
+        low_watermark: int = 1_000,
+        high_watermark: int = 10_000,
+    ):
+        """
+        Parameters
+        ----------
+        buckets : dict
+            Route name to bucket.
+        queues : dict, optional
+            Route name to the destination queues whose depth drives
+            the route's adaptive rate.
+        low_watermark : int, optional
+            Queue depth up to which the full rate applies.
+        high_watermark : int, optional
+            Queue depth at which the route is paused.
+        """
+        self.buckets = buckets
+        self.queues = queues or {}
+        self.low_watermark = low_watermark
+        self.high_watermark = max(high_watermark, low_watermark + 1)
+        self._depths: Dict[str, int] = {}
+        self._closed = threading.Event()
+
+    @classmethod
+    def from_settings(
+        cls,
+        routes: Iterable,
+        queues: Optional[Callable] = None,
+    ) -> Optional["RateLimiter"]:
+        """
+        Build buckets for the routes in `settings.ROUTE_RATE_LIMITS`.
+
+        Parameters
+        ----------
+        routes : iterable of BaseRoute
+            Loaded routes.
+        queues : callable, optional
+            Returns every destination queue of a route; defaults to
+            the route's `queue`.
+
+        Returns
+        -------
+        RateLimiter or None
+            Limiter, or None when no route is rate limited.
+
+        Raises
+        ------
+        ValueError
+            If `ROUTE_RATE_LIMITS` is malformed.
+        """
+        limits = parse_rate_limits(settings.ROUTE_RATE_LIMITS)
+        if not limits:
+            return None
+
+        routes = {route.name: route for route in routes}
+        unknown = set(limits) - set(routes)
+        if unknown:
+            logger.warning(
+                "ROUTE_RATE_LIMITS names unknown routes: %s",
+                ", ".join(sorted(unknown)),
+            )
+
+        buckets = {
+            name: TokenBucket(rate, burst)
+            for name, (rate, burst) in limits.items()
+            if name in routes
+        }
+        if not buckets:
+            return None
+
+        logger.info(
+            "Rate limits: %s",
+            ", ".join(f"{n}={b.rate:g}/s burst {b.burst:g}" for n, b in sorted(buckets.items())),
+        )
+        return cls(
+            buckets,
+            queues={
+                name: (queues(routes[name]) if queues else (routes[name].queue,))
+                for name in buckets
+            },
+            low_watermark=settings.FLOW_QUEUE_LOW_WATERMARK,
+            high_watermark=settings.FLOW_QUEUE_HIGH_WATERMARK,
+        )
+
+    def wait(self, route: str) -> None:
+        """
+        Block until the route may publish one more event.
+
+        Parameters
+        ----------
+        route : str
+            Route name; routes without a bucket return immediately.
+        """
+        bucket = self.buckets.get(route)
+        if bucket is None:
+            return
+        delay = bucket.try_acquire()
+        if not delay:
+            return
+
+        RATE_LIMITED.inc(route=route)
+        with STAGE_SECONDS.time(stage="throttle"):
+            while delay and not self._closed.is_set():
+                self._closed.wait(min(delay, _MAX_SLEEP))
+                delay = bucket.try_acquire()
+
+    async def wait_async(self, route: str) -> None:
+        """
+        Asynchronous variant of `wait`.
+        """
+        bucket = self.buckets.get(route)
+        if bucket is None:
+            return
+        delay = bucket.try_acquire()
+        if not delay:
+            return
+
+        RATE_LIMITED.inc(route=route)
+        with STAGE_SECONDS.time(stage="throttle"):
+            while delay and not self._closed.is_set():
+                await asyncio.sleep(min(delay, _MAX_SLEEP))
+                delay = bucket.try_acquire()
+
+    def monitored_queues(self) -> Tuple[str, ...]:
+        """
+        Destination queues whose depth drives adaptive rates.
+
+        Returns
+        -------
+        tuple of str
+            Queue names.
+        """
+        return tuple(sorted({q for queues in self.queues.values() for q in queues}))
+
+    def set_depth(self, queue: str, depth: int) -> None:
+        """
+        Record the depth of a destination and rescale its routes.
+
+        Parameters
+        ----------
+        queue : str
+            Destination queue.
+        depth : int
+            Messages waiting on the queue.
+        """
+        self._depths[queue] = depth
+        FLOW_QUEUE_DEPTH.set(depth, queue=queue)
+
+        span = self.high_watermark - self.low_watermark
+        for route, queues in self.queues.items():
+            if queue not in queues:
+                continue
+            deepest = max(self._depths.get(q, 0) for q in queues)
+            scale = min(1.0, max(0.0, (self.high_watermark - deepest) / span))
+            bucket = self.buckets[route]
+            if scale != bucket.scale:
+                if scale == 0.0:
+                    logger.warning(
+                        "Route %s paused, destination depth %d", route, deepest
+                    )
+                elif bucket.scale == 0.0:
+                    logger.info("Route %s resumed, destination depth %d", route, deepest)
+                bucket.scale = scale
+                RATE_LIMIT_SCALE.set(scale, route=route)
+
+    def close(self) -> None:
+        """
+        Release every waiting caller so shutdown is not blocked.
+        """
+        self._closed.set()
+
+
+def parse_rate_limits(
+    spec: str,
+    setting: str = "ROUTE_RATE_LIMITS",
+) -> Dict[str, Tuple[float, float]]:
+    """
+    Parse `ROUTE_RATE_LIMITS` (or `LOG_RATE_LIMITS`).
+
+    Parameters
+    ----------
+    spec : str
+        Comma-separated `name=rate[:burst]` entries, e.g.
+        "autotag=5:20,vector=50". The burst defaults to the rate
+        (at least 1).
+    setting : str, optional
+        Setting name reported in errors.
+
+    Returns
+    -------
+    dict
+        Name to (rate, burst).
+
+    Raises
+    ------
+    ValueError
+        If an entry is malformed or not positive.
+    """
+    limits = {}
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, sep, value = part.partition("=")
+        rate, _, burst = value.partition(":")
+        try:
+            rate_value = float(rate)
+            burst_value = float(burst) if burst else max(1.0, rate_value)
+        except ValueError:
+            rate_value = burst_value = 0.0
+        if not sep or not name.strip() or rate_value <= 0 or burst_value < 1:
+            raise ValueError(f"Invalid {setting} entry: {part!r}")
+        limits[name.strip()] = (rate_value, burst_value)
+    return limits
+
+
+def parse_statistics(body) -> Dict[str, object]:
+    """
+    Decode a statistics plugin reply sent with
+    `transformation: jms-map-json`.
+
+    Parameters
+    ----------
+    body : str or bytes
+        Reply body, e.g.
+        `{"map": {"entry": [{"string": "size", "long": 3}, ...]}}`.
+
+    Returns
+    -------
+    dict
+        Statistic name to value.
+    """
+    entries = loads(body).get("map", {}).get("entry", [])
+    if isinstance(entries, dict):
+        entries = [entries]
+
+    stats = {}
+    for entry in entries:
+        key = entry.get("string")
+        if isinstance(key, list):
+            # String values: {"string": ["name", "value"]}
+            stats[key[0]] = key[1]
+            continue
+        for kind, value in entry.items():
+            if kind != "string":
+                stats[key] = value
+    return stats
+
+
+class QueueDepthProbe:
+    """
+    Polls destination depths from ActiveMQ's statistics plugin.
+
+    Uses its own STOMP connection: every interval a request is sent to
+    `ActiveMQ.Statistics.Destination.<queue>` for each monitored queue,
+    and replies arrive on a temporary queue.
+    """
+
+    def __init__(self, connect: Callable, limiter: RateLimiter, interval: float):
+        """
+        Parameters
+        ----------
+        connect : callable
+            Zero-argument factory returning a connected stomp.py
+            connection. Must not reuse the consumer's client-id.
+        limiter : RateLimiter
+            Limiter receiving the depths.
+        interval : float
+            Seconds between polls.
+        """
+        self._connect = connect
+        self.limiter = limiter
+        self.interval = interval
+        self.queues = limiter.monitored_queues()
+        self._reply_to = f"/temp-queue/router-statistics-{id(self):x}"
+        self._conn = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="router-flow-probe",
+            daemon=True,
+        )
+
+    def start(self) -> None:
+        """
+        Start polling in a background thread.
+        """
+        logger.info(
+            "Queue depth probe started",
+            extra={"queues": ",".join(self.queues), "interval": self.interval},
+        )
+        self._thread.start()
+
+    def close(self) -> None:
+        """
+        Stop polling and disconnect.
+        """
+        self._stop.set()
+        self._thread.join()
+
+    def on_message(self, frame) -> None:
+        """
+        stomp.py listener callback receiving statistics replies.
+        """
+        try:
+            stats = parse_statistics(frame.body)
+            destination = str(stats["destinationName"])
+            depth = int(stats["size"])
+        except Exception as e:
+            logger.warning("Invalid statistics reply: %s", e)
+            return
+
+        # "queue://alfresco.autotag" -> "/queue/alfresco.autotag"
+        kind, _, name = destination.partition("://")
+        self.limiter.set_depth(f"/{kind}/{name}", depth)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self._conn is None or not self._conn.is_connected():
+                    self._open()
+                for queue in self.queues:
+                    self._conn.send(
+                        destination=_STATISTICS_PREFIX + queue[len("/queue/"):],
+                        body="",
+                        headers={"reply-to": self._reply_to},
+                    )
+            except Exception as e:
+                logger.warning("Queue depth probe failed: %s", e)
+                self._discard()
+            self._stop.wait(self.interval)
+        self._discard()
+
+    def _open(self) -> None:
+        self._discard()
+        conn = self._connect()
+        conn.set_listener("flow-probe", self)
+        conn.subscribe(
+            destination=self._reply_to,
+            id="flow-probe",
+            ack="auto",
+            headers={"transformation": "jms-map-json"},
+        )
+        self._conn = conn
+
+    def _discard(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        try:
+            if conn.is_connected():
+                conn.disconnect()
+        except Exception:
+            logger.debug("Error closing probe connection")
@@ -0,0 +1,159 @@
+"""
+core.receipts
+=============
+
+Waiting for broker receipts on stomp.py connections.
+
+stomp.py sends frames fire-and-forget: `send` and `commit` return as
+soon as the frame is written to the socket, before the broker has
+accepted it. Where the router must know that a frame was processed
+(a publish before the source frame is ACKed on another connection, a
+transaction COMMIT) the frame carries a `receipt` header and the
+caller waits for the matching RECEIPT.
+
+`ReceiptWaiter` is registered as a listener on the connection; RECEIPT
+and ERROR frames are delivered on stomp.py's receiver thread, which
+must therefore never be the thread waiting for them.
+"""
+
+import itertools
+import threading
+from typing import Callable, Dict, Optional
+
+# Seconds the broker has to confirm a frame
+RECEIPT_TIMEOUT = 30.0
+
+
+class ReceiptWaiter:
+    """
+    stomp.py listener matching RECEIPT and ERROR frames to the frames
+    awaiting them.
+
+    Thread-safe; one instance may serve several connections.
+    """
+
+    def __init__(self, prefix: str = "r"):
+        """
+        Parameters
+        ----------
+        prefix : str, optional
+            Prefix of generated receipt ids, by default "r".
+        """
+        self._prefix = prefix
+        self._ids = itertools.count(1)
+        # receipt id -> [event, error message]
+        self._pending: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def expect(self, receipt: Optional[str] = None) -> str:
+        """
+        Register a receipt before the frame requesting it is sent.
+
+        Parameters
+        ----------
+        receipt : str, optional
+            Receipt id; generated if omitted.
+
+        Returns
+        -------
+        str
+            Receipt id to send in the frame's `receipt` header.
+        """
+        if receipt is None:
+            receipt = f"{self._prefix}-{next(self._ids)}"
+        with self._lock:
+            self._pending[receipt] = [threading.Event(), None]
+        return receipt
+
+    def wait(self, receipt: str, timeout: float = RECEIPT_TIMEOUT) -> None:
+        """
+        Wait for a registered receipt.
+
+        Parameters
+        ----------
+        receipt : str
+            Receipt id returned by `expect`.
+        timeout : float, optional
+            Seconds to wait, by default `RECEIPT_TIMEOUT`.
+
+        Raises
+        ------
+        TimeoutError
+            If the receipt did not arrive in time.
+        RuntimeError
+            If the broker answered with an ERROR frame or the
+            connection was lost.
+        """
+        done, _ = entry = self._pending[receipt]
+        try:
+            if not done.wait(timeout):
+                raise TimeoutError(f"No receipt {receipt} within {timeout:g}s")
+            if entry[1] is not None:
+                raise RuntimeError(entry[1])
+        finally:
+            self.cancel(receipt)
+
+    def confirm(
+        self,
+        send: Callable[[str], None],
+        receipt: Optional[str] = None,
+        timeout: float = RECEIPT_TIMEOUT,
+    ) -> None:
+        """
+        Send a frame with a receipt and wait for the broker to confirm it.
+
+        Parameters
+        ----------
+        send : callable
+            Sends the frame; called with the receipt id to put in its
+            `receipt` header.
+        receipt : str, optional
+            Receipt id; generated if omitted.
+        timeout : float, optional
+            Seconds to wait, by default `RECEIPT_TIMEOUT`.
+
+        Raises
+        ------
+        TimeoutError
+            If the receipt did not arrive in time.
+        RuntimeError
+            If the broker answered with an ERROR frame or the
+            connection was lost.
+        """
+        receipt = self.expect(receipt)
+        try:
+            send(receipt)
+        except Exception:
+            self.cancel(receipt)
+            raise
+        self.wait(receipt, timeout)
+
+    def cancel(self, receipt: str) -> None:
+        """
+        Forget a registered receipt, e.g. when sending its frame failed.
+        """
+        with self._lock:
+            self._pending.pop(receipt, None)
+
+    def on_receipt(self, frame) -> None:
+        self._settle(frame.headers.get("receipt-id"), None)
+
+    def on_error(self, frame) -> None:
+        self._settle(
+            frame.headers.get("receipt-id"),
+            f"Broker error: {frame.headers.get('message') or frame.body}",
+        )
+
+    def on_disconnected(self) -> None:
+        with self._lock:
+            receipts = list(self._pending)
+        for receipt in receipts:
+            self._settle(receipt, "Connection lost before receipt")
+
+    def _settle(self, receipt: Optional[str], error: Optional[str]) -> None:
+        with self._lock:
+            entry = self._pending.get(receipt)
+            if entry is None:
+                return
+            entry[1] = error
+        entry[0].set()
@@ -0,0 +1,216 @@
+"""
+core.reconnect
+==============
+
+Automatic recovery of the consuming broker connection.
+
+When the broker restarts, fails over or drops the socket, both
+runtimes reconnect instead of idling on a dead connection until the
+container is restarted:
+
+1. The loss is noticed immediately: `ConnectionSupervisor` is
+   registered as a stomp.py listener (threaded runtime) or is told
+   when the frame stream ends (asyncio runtime).
+2. A new connection is established and the subscription re-created,
+   retrying with jittered exponential backoff so that a fleet of
+   routers does not hammer a recovering broker in lock-step.
+3. The router is rebound to the new connection (`rebind`). Frames
+   delivered on the lost connection can no longer be ACKed; they are
+   dropped and the broker redelivers them on the new subscription.
+
+The time from losing the connection until consuming again is exported
+as `router_reconnect_recovery_seconds`.
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from settings import settings
+from core.metrics import RECONNECT_ATTEMPTS, RECOVERY_SECONDS
+
+logger = logging.getLogger("router.reconnect")
+
+# Longest single sleep between stop checks while backing off
+_MAX_SLEEP = 0.5
+
+
+class Backoff:
+    """
+    Exponential backoff with full jitter.
+
+    The n-th delay is drawn uniformly from
+    `[0, min(maximum, initial * 2 ** n)]`.
+    """
+
+    def __init__(self, initial: float, maximum: float):
+        """
+        Parameters
+        ----------
+        initial : float
+            Upper bound of the first delay in seconds.
+        maximum : float
+            Cap of the delay in seconds.
+        """
+        self.initial = initial
+        self.maximum = max(initial, maximum)
+        self.attempts = 0
+
+    def next(self) -> float:
+        """
+        Delay before the next attempt.
+
+        Returns
+        -------
+        float
+            Seconds to wait.
+        """
+        ceiling = min(self.maximum, self.initial * 2 ** min(self.attempts, 32))
+        self.attempts += 1
+        return random.uniform(0, ceiling)
+
+    def reset(self) -> None:
+        """
+        Start again from the initial delay.
+        """
+        self.attempts = 0
+
+
+class ConnectionSupervisor:
+    """
+    Detects a lost connection and re-establishes it.
+    """
+
+    def __init__(self, backoff: Backoff, max_attempts: int = 0):
+        """
+        Parameters
+        ----------
+        backoff : Backoff
+            Delay policy between attempts.
+        max_attempts : int, optional
+            Attempts per outage before giving up; 0 retries forever.
+        """
+        self.backoff = backoff
+        self.max_attempts = max_attempts
+        # Set while the connection is down
+        self.lost = threading.Event()
+        self._lost_at = 0.0
+
+    @classmethod
+    def from_settings(cls) -> "ConnectionSupervisor":
+        """
+        Build a supervisor from the `RECONNECT_*` settings.
+        """
+        return cls(
+            Backoff(
+                settings.RECONNECT_INITIAL_DELAY_MS / 1000.0,
+                settings.RECONNECT_MAX_DELAY_MS / 1000.0,
+            ),
+            max_attempts=settings.RECONNECT_MAX_ATTEMPTS,
+        )
+
+    def on_disconnected(self) -> None:
+        """
+        Record a lost connection.
+
+        Also the stomp.py listener hook, so registering the supervisor
+        on a connection (`conn.set_listener("reconnect", supervisor)`)
+        reports losses as soon as the receiver thread notices them.
+        """
+        if not self.lost.is_set():
+            self._lost_at = time.monotonic()
+            self.lost.set()
+
+    def recover(
+        self,
+        establish: Callable[[], Any],
+        stopped: Callable[[], bool],
+    ) -> Optional[Any]:
+        """
+        Re-establish the connection, retrying with backoff.
+
+        Parameters
+        ----------
+        establish : callable
+            Opens a new connection and subscribes; raises on failure.
+        stopped : callable
+            Returns True once shutdown was requested.
+
+        Returns
+        -------
+        Any or None
+            The new connection, or None if shutdown was requested.
+
+        Raises
+        ------
+        ConnectionError
+            If `max_attempts` attempts failed.
+        """
+        while not stopped():
+            try:
+                conn = establish()
+            except Exception as e:
+                delay = self._failed(e)
+                deadline = time.monotonic() + delay
+                while not stopped() and time.monotonic() < deadline:
+                    time.sleep(min(_MAX_SLEEP, max(0.0, deadline - time.monotonic())))
+                continue
+            self._recovered()
+            return conn
+        return None
+
+    async def recover_async(
+        self,
+        establish: Callable[[], Awaitable[Any]],
+        stopped: Callable[[], bool],
+    ) -> Optional[Any]:
+        """
+        Asynchronous variant of `recover`.
+        """
+        while not stopped():
+            try:
+                conn = await establish()
+            except Exception as e:
+                delay = self._failed(e)
+                deadline = time.monotonic() + delay
+                while not stopped() and time.monotonic() < deadline:
+                    await asyncio.sleep(min(_MAX_SLEEP, max(0.0, deadline - time.monotonic())))
+                continue
+            self._recovered()
+            return conn
+        return None
+
+    def _failed(self, error: Exception) -> float:
+        """
+        Record a failed attempt and pick the delay before the next one.
+        """
+        RECONNECT_ATTEMPTS.inc(result="failed")
+        if self.max_attempts and self.backoff.attempts + 1 >= self.max_attempts:
+            raise ConnectionError(
+                f"Broker unreachable after {self.max_attempts} reconnect attempts"
+            ) from error
+        delay = self.backoff.next()
+        logger.warning(
+            "Reconnect failed, retrying in %.1fs: %s",
+            delay,
+            str(error) or type(error).__name__,
+            extra={"attempt": self.backoff.attempts},
+        )
+        return delay
+
+    def _recovered(self) -> None:
+        """
+        Record a successful reconnect.
+        """
+        RECONNECT_ATTEMPTS.inc(result="ok")
+        recovery = time.monotonic() - self._lost_at
+        RECOVERY_SECONDS.observe(recovery)
+        logger.warning(
+            "Reconnected to ActiveMQ",
+            extra={"attempts": self.backoff.attempts + 1, "recovery_seconds": round(recovery, 3)},
+        )
+        self.backoff.reset()
+        self.lost.clear()
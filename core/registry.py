@@ -8,6 +8,13 @@ This module is responsible for discovering all routing implementations
 under the `routes` package, instantiating them, and exposing them to
 the event listener.
 
+Declarative rules from `settings.ROUTE_RULES_FILE` are compiled into
+routes as well (see `core.rules`).
+
+Loaded routes are compiled into a `RouteTable`, a dispatch table keyed
+on event type and MIME type that also resolves path prefixes in a
+single pass.
+
 Routes are discovered dynamically to allow:
 - Plug-and-play extensions
 - Independent deployment of routing logic
@@ -16,18 +23,27 @@ Routes are discovered dynamically to allow:
 import importlib
 import pkgutil
 import logging
+from typing import Dict, List, Optional, Sequence, Tuple
 
+from settings import settings
 from core.base import BaseRoute
+from core.prefix import PrefixIndex
+from core.rules import load_rule_routes, mime_type_matches
 
 logger = logging.getLogger("router.registry")
 
+# Upper bound on memoized (eventType, mimeType) dispatch entries
+_MAX_DISPATCH_KEYS = 4096
+
 
 def load_routes():
     """
     Discover and load all route implementations.
 
     This function scans the `routes` package, imports each module,
-    and instantiates all classes that subclass `BaseRoute`.
+    and instantiates all classes that subclass `BaseRoute`. Routes
+    declared in `settings.ROUTE_RULES_FILE` are appended after the
+    code-based routes.
 
     Returns
     -------
@@ -38,7 +54,8 @@ def load_routes():
     -----
     - Route classes must have a no-argument constructor.
     - Routes are expected to be stateless.
-    - Import errors will propagate to fail fast during startup.
+    - Import errors and invalid rule files will propagate to fail
+      fast during startup.
     """
     route_instances = []
 
@@ -56,4 +73,152 @@ def load_routes():
                 route_instances.append(obj())
                 logger.info("Loaded route: %s", obj.__name__)
 
+    if settings.ROUTE_RULES_FILE:
+        route_instances.extend(load_rule_routes(settings.ROUTE_RULES_FILE))
+
     return route_instances
+
+
+class RouteTable:
+    """
+    Compiled lookup of candidate routes for an event.
+
+    Each route's `event_types`, `mime_types`, `include_prefixes` and
+    `exclude_prefixes` are compiled once:
+    - Event type and MIME type resolve through a dispatch table
+      memoized per (eventType, mimeType) pair
+    - The prefixes of all routes are matched against the event path
+      in a single pass
+
+    Lookup cost therefore does not grow with the number of routes or
+    prefixes that cannot match.
+
+    A candidate route still has its `should_route` predicate applied;
+    the table only removes routes that cannot match.
+    """
+
+    def __init__(self, routes: Sequence[BaseRoute]):
+        """
+        Compile the routing table.
+
+        Parameters
+        ----------
+        routes : sequence of BaseRoute
+            Loaded routes, in evaluation order.
+
+        Raises
+        ------
+        ValueError
+            If two routes share a name. Route names key per-route
+            settings (encodings, rate limits, enrichment, lanes,
+            coalescing) and metrics.
+        """
+        self.routes: Tuple[BaseRoute, ...] = tuple(routes)
+
+        names = [route.name for route in self.routes]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"Duplicate route names: {', '.join(duplicates)}")
+
+        entries = []
+        for index, route in enumerate(self.routes):
+            entries.extend((p, (index, True)) for p in route.include_prefixes)
+            entries.extend((p, (index, False)) for p in route.exclude_prefixes)
+        self._prefixes = PrefixIndex(entries)
+
+        self._needs_include = tuple(
+            bool(route.include_prefixes) for route in self.routes
+        )
+
+        self._dispatch: Dict[Tuple[Optional[str], Optional[str]], Tuple[int, ...]] = {}
+
+        # Union of event types the routes accept (None = unrestricted)
+        self.event_types = (
+            None
+            if any(route.event_types is None for route in self.routes)
+            else frozenset().union(*(route.event_types for route in self.routes))
+        )
+
+    def __len__(self) -> int:
+        return len(self.routes)
+
+    def candidates(
+        self,
+        event_type: Optional[str],
+        path: Optional[str],
+        mime_type: Optional[str] = None,
+    ) -> List[BaseRoute]:
+        """
+        Resolve the routes that may accept an event.
+
+        Parameters
+        ----------
+        event_type : str or None
+            Event type.
+        path : str or None
+            Repository path. Events without a path never match routes
+            declaring include prefixes.
+        mime_type : str or None, optional
+            MIME type of the content.
+
+        Returns
+        -------
+        list of BaseRoute
+            Candidate routes, in evaluation order.
+        """
+        if self.event_types is not None and event_type not in self.event_types:
+            return []
+
+        indexes = self._dispatch.get((event_type, mime_type))
+        if indexes is None:
+            indexes = self._resolve(event_type, mime_type)
+        if not indexes:
+            return []
+
+        included = set()
+        excluded = set()
+        if path:
+            for index, include in self._prefixes.match(path):
+                (included if include else excluded).add(index)
+
+        return [
+            self.routes[index]
+            for index in indexes
+            if index not in excluded
+            and (not self._needs_include[index] or index in included)
+        ]
+
+    def _resolve(
+        self,
+        event_type: Optional[str],
+        mime_type: Optional[str],
+    ) -> Tuple[int, ...]:
+        """
+        Compute and memoize the dispatch entry for a key.
+
+        Parameters
+        ----------
+        event_type : str or None
+            Event type.
+        mime_type : str or None
+            MIME type.
+
+        Returns
+        -------
+        tuple of int
+            Indexes of routes accepting this event and MIME type.
+        """
+        indexes = tuple(
+            index
+            for index, route in enumerate(self.routes)
+            if (route.event_types is None or event_type in route.event_types)
+            and (
+                route.mime_types is None
+                or mime_type_matches(route.mime_types, mime_type)
+            )
+        )
+
+        # Keys come from event data; stop memoizing rather than grow unbounded
+        if len(self._dispatch) < _MAX_DISPATCH_KEYS:
+            self._dispatch[(event_type, mime_type)] = indexes
+        return indexes
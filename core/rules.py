@@ -0,0 +1,324 @@
+"""
+core.rules
+==========
+
+Declarative routing rules.
+
+Besides hand-written `BaseRoute` subclasses, routes can be declared in
+a JSON file referenced by `settings.ROUTE_RULES_FILE`. Each rule is
+compiled into a `RuleRoute` at startup and registered alongside the
+code-based routes, so new destination queues can be added without
+shipping code.
+
+File format
+-----------
+{
+  "routes": [
+    {
+      "name": "autometa",
+      "queue": "${AUTOMETA_QUEUE}",
+      "coalesce": true,
+      "match": {
+        "eventTypes": ["BINARY_CHANGED"],
+        "pathPrefixes": ["/Company Home/Sites"],
+        "excludePrefixes": ["/Company Home/Sites/archive"],
+        "pathGlobs": ["*.pdf", "*.docx"],
+        "mimeTypes": ["application/pdf", "image/*"],
+        "minSize": 1,
+        "maxSize": 104857600,
+        "nodeTypes": ["cm:content"]
+      }
+    }
+  ]
+}
+
+All conditions are optional and combined with AND; list values match
+if any element matches, and a single string is read as a one-element
+list. `minSize` and `maxSize` are integers in bytes. `queue` may
+reference environment variables using `${NAME}` syntax. `coalesce`
+(optional, default false) enables per-node coalescing for the route,
+`enrich` (optional, default false) adds repository metadata to its
+payloads, `encoding`
+(optional, e.g. "msgpack+zstd") selects its output encoding (see
+`core.encodings`), and `lanes` (optional, default false) enables
+priority lanes (see `core.lanes`). Invalid rule files fail fast
+during startup.
+"""
+
+import fnmatch
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, FrozenSet, List, Optional, Pattern, Tuple
+
+from core.base import BaseRoute
+from core.schema import CompactEvent
+
+logger = logging.getLogger("router.rules")
+
+_MATCH_KEYS = {
+    "eventTypes",
+    "pathPrefixes",
+    "excludePrefixes",
+    "pathGlobs",
+    "mimeTypes",
+    "minSize",
+    "maxSize",
+    "nodeTypes",
+}
+
+
+def mime_type_matches(mime_types: FrozenSet[str], mime_type: Optional[str]) -> bool:
+    """
+    Check a MIME type against exact and `major/*` wildcard entries.
+
+    Parameters
+    ----------
+    mime_types : frozenset of str
+        Accepted MIME types.
+    mime_type : str or None
+        MIME type of the event.
+
+    Returns
+    -------
+    bool
+        True if the MIME type is accepted.
+    """
+    if not mime_type:
+        return False
+    if mime_type in mime_types:
+        return True
+    major, _, _ = mime_type.partition("/")
+    return f"{major}/*" in mime_types
+
+
+class RuleRoute(BaseRoute):
+    """
+    Route compiled from a declarative rule.
+
+    Event type, MIME type and path prefix conditions are exposed as
+    `BaseRoute` attributes so the route table can index them; the
+    remaining conditions are checked in `should_route`.
+    """
+
+    def __init__(self, spec: Dict[str, Any]):
+        """
+        Compile a rule.
+
+        Parameters
+        ----------
+        spec : dict
+            Rule definition (see module documentation).
+
+        Raises
+        ------
+        ValueError
+            If the rule is malformed.
+        """
+        if not isinstance(spec, dict):
+            raise ValueError("Route rule must be an object")
+
+        self._name = spec.get("name")
+        if not self._name or not isinstance(self._name, str):
+            raise ValueError("Route rule requires a 'name'")
+
+        self._queue = _expand_queue(self._name, spec.get("queue"))
+        self.coalesce = bool(spec.get("coalesce", False))
+        self.enrich = bool(spec.get("enrich", False))
+        self.lanes = bool(spec.get("lanes", False))
+        self.encoding = spec.get("encoding")
+        if self.encoding is not None and not isinstance(self.encoding, str):
+            raise ValueError(f"Route rule '{self._name}' has a non-string 'encoding'")
+
+        match = spec.get("match") or {}
+        unknown = set(match) - _MATCH_KEYS
+        if unknown:
+            raise ValueError(
+                f"Route rule '{self._name}' has unknown conditions: "
+                f"{', '.join(sorted(unknown))}"
+            )
+
+        name = self._name
+        self.event_types = _optional_set(name, "eventTypes", match.get("eventTypes"))
+        self.mime_types = _optional_set(name, "mimeTypes", match.get("mimeTypes"))
+        self.include_prefixes = _strings(
+            name, "pathPrefixes", match.get("pathPrefixes")
+        )
+        self.exclude_prefixes = _strings(
+            name, "excludePrefixes", match.get("excludePrefixes")
+        )
+
+        globs = _strings(name, "pathGlobs", match.get("pathGlobs"))
+        self._path_pattern: Optional[Pattern] = (
+            re.compile("|".join(fnmatch.translate(g) for g in globs))
+            if globs
+            else None
+        )
+        self._node_types = _optional_set(name, "nodeTypes", match.get("nodeTypes"))
+        self._min_size = _optional_size(name, "minSize", match.get("minSize"))
+        self._max_size = _optional_size(name, "maxSize", match.get("maxSize"))
+
+    @property
+    def name(self) -> str:
+        """
+        Name of the route.
+
+        Returns
+        -------
+        str
+            Rule name.
+        """
+        return self._name
+
+    @property
+    def queue(self) -> str:
+        """
+        Destination queue name.
+
+        Returns
+        -------
+        str
+            Queue name.
+        """
+        return self._queue
+
+    def should_route(self, event: CompactEvent) -> bool:
+        """
+        Evaluate every rule condition against the event.
+
+        Parameters
+        ----------
+        event : CompactEvent
+            Incoming repository event.
+
+        Returns
+        -------
+        bool
+            True if all conditions match.
+        """
+        if self.event_types is not None and event.eventType not in self.event_types:
+            return False
+
+        if self.mime_types is not None and not mime_type_matches(
+            self.mime_types, event.mimeType
+        ):
+            return False
+
+        path = event.path or ""
+        if self.include_prefixes and not path.startswith(self.include_prefixes):
+            return False
+        if self.exclude_prefixes and path.startswith(self.exclude_prefixes):
+            return False
+        if self._path_pattern is not None and not self._path_pattern.match(path):
+            return False
+
+        if self._node_types is not None and event.nodeType not in self._node_types:
+            return False
+
+        if self._min_size is not None or self._max_size is not None:
+            if event.size is None:
+                return False
+            if self._min_size is not None and event.size < self._min_size:
+                return False
+            if self._max_size is not None and event.size > self._max_size:
+                return False
+
+        return True
+
+
+def load_rule_routes(path: str) -> List[RuleRoute]:
+    """
+    Load and compile routes from a rule file.
+
+    Parameters
+    ----------
+    path : str
+        Path to the JSON rule file.
+
+    Returns
+    -------
+    list of RuleRoute
+        Compiled routes, in file order.
+
+    Raises
+    ------
+    OSError
+        If the file cannot be read.
+    ValueError
+        If the file or any rule is malformed, or two rules share a
+        name.
+    """
+    with open(path, encoding="utf-8") as fh:
+        document = json.load(fh)
+
+    specs = document.get("routes") if isinstance(document, dict) else None
+    if not isinstance(specs, list):
+        raise ValueError(f"Rule file {path} must contain a 'routes' list")
+
+    routes = [RuleRoute(spec) for spec in specs]
+    names = [route.name for route in routes]
+    duplicates = sorted({n for n in names if names.count(n) > 1})
+    if duplicates:
+        raise ValueError(
+            f"Rule file {path} declares duplicate route names: {', '.join(duplicates)}"
+        )
+    for route in routes:
+        logger.info("Loaded rule route: %s -> %s", route.name, route.queue)
+    return routes
+
+
+# ----------------------------------------------------------------------
+# Internal helpers
+# ----------------------------------------------------------------------
+def _strings(name: str, key: str, values: Any) -> Tuple[str, ...]:
+    """
+    Convert an optional list condition into a tuple of strings.
+
+    A single string is treated as a one-element list.
+    """
+    if values is None:
+        return ()
+    if isinstance(values, str):
+        return (values,)
+    if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+        raise ValueError(
+            f"Route rule '{name}' condition '{key}' must be a string "
+            "or a list of strings"
+        )
+    return tuple(values)
+
+
+def _optional_set(name: str, key: str, values: Any) -> Optional[FrozenSet[str]]:
+    """
+    Convert an optional list condition into a frozenset.
+    """
+    if values is None:
+        return None
+    return frozenset(_strings(name, key, values))
+
+
+def _optional_size(name: str, key: str, value: Any) -> Optional[int]:
+    """
+    Validate an optional size condition in bytes.
+    """
+    if value is None:
+        return None
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ValueError(f"Route rule '{name}' condition '{key}' must be an integer")
+    return value
+
+
+def _expand_queue(name: str, queue: Any) -> str:
+    """
+    Resolve `${NAME}` references in a rule's queue.
+    """
+    if not queue or not isinstance(queue, str):
+        raise ValueError(f"Route rule '{name}' requires a 'queue'")
+
+    expanded = os.path.expandvars(queue)
+    if "$" in expanded:
+        raise ValueError(
+            f"Route rule '{name}' references an undefined variable: {queue}"
+        )
+    return expanded
@@ -8,16 +8,70 @@ Alfresco → ActiveMQ → Python Event Router pipeline.
 This module contains normalized, forward-compatible representations
 of repository events emitted by Alfresco repository extensions.
 
+`RepoEvent` is the validating model at the edge. Routes receive a
+`CompactEvent`: a slotted record with the same fields, built straight
+from the decoded JSON when every field already has its exact schema
+type, and from a validated `RepoEvent` otherwise. This keeps pydantic
+off the hot path for well-formed events without changing which events
+are accepted.
+
 Design goals:
 - Strict but flexible validation
 - Backward compatibility with evolving event producers
 - Clear separation between transport schema and business logic
 """
 
-from typing import Optional, Union
+import operator
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Set, Tuple, Union
+
 from pydantic import BaseModel, field_validator
 
 
+class EventEnvelope(NamedTuple):
+    """
+    Lightweight view of the event envelope fields.
+
+    Read straight from the decoded JSON without validation so that
+    events no route is interested in can be discarded before the
+    full `RepoEvent` model is built.
+    """
+
+    eventType: Optional[str]
+    schemaVersion: Optional[int]
+    path: Optional[str]
+    mimeType: Optional[str]
+
+    @classmethod
+    def peek(cls, raw: Any) -> Optional["EventEnvelope"]:
+        """
+        Extract envelope fields from a decoded payload.
+
+        Parameters
+        ----------
+        raw : Any
+            Decoded JSON payload.
+
+        Returns
+        -------
+        EventEnvelope or None
+            Envelope view, or None when the payload is not a JSON
+            object (full validation will reject it). Fields of an
+            unexpected type are reported as None.
+        """
+        if not isinstance(raw, dict):
+            return None
+        event_type = raw.get("eventType")
+        version = raw.get("schemaVersion")
+        path = raw.get("path")
+        mime_type = raw.get("mimeType")
+        return cls(
+            event_type if type(event_type) is str else None,
+            version if type(version) is int else None,
+            path if type(path) is str else None,
+            mime_type if type(mime_type) is str else None,
+        )
+
+
 class RepoEvent(BaseModel):
     # -------- Core envelope --------
     schemaVersion: int
@@ -67,3 +121,188 @@ class RepoEvent(BaseModel):
 
     class Config:
         extra = "ignore"
+
+
+
+_NONE = type(None)
+
+# Exact types per field, in declaration order, for which the model would
+# return the value unchanged. Payloads with other types (including ones
+# pydantic coerces) are validated by the model.
+_EXACT_TYPES = tuple(
+    (int,) if name in ("schemaVersion", "timestamp")
+    else (str,) if name in ("eventType", "nodeRef", "storeRef")
+    else (int, _NONE) if name == "size"
+    else (int, str, _NONE) if name in ("createdAt", "modifiedAt")
+    else (str, _NONE)
+    for name in RepoEvent.model_fields
+)
+
+# Type signatures of payloads known to match `_EXACT_TYPES`
+_ACCEPTED: Set[Tuple[type, ...]] = set()
+_MAX_SIGNATURES = 1024
+
+
+class CompactEvent:
+    """
+    Slotted event passed to routes.
+
+    Has the fields of `RepoEvent` as attributes, and `model_dump` for
+    routes that serialize the event, at a fraction of the memory and
+    construction cost of the pydantic model. Treat it as read-only.
+    """
+
+    __slots__ = (
+        "schemaVersion",
+        "eventType",
+        "timestamp",
+        "nodeRef",
+        "storeRef",
+        "parentNodeRef",
+        "name",
+        "path",
+        "mimeType",
+        "size",
+        "encoding",
+        "versionLabel",
+        "creator",
+        "modifier",
+        "createdAt",
+        "modifiedAt",
+        "nodeType",
+    )
+
+    def __init__(self, *values: Any):
+        """
+        Parameters
+        ----------
+        *values : Any
+            Field values in `__slots__` order.
+        """
+        (
+            self.schemaVersion,
+            self.eventType,
+            self.timestamp,
+            self.nodeRef,
+            self.storeRef,
+            self.parentNodeRef,
+            self.name,
+            self.path,
+            self.mimeType,
+            self.size,
+            self.encoding,
+            self.versionLabel,
+            self.creator,
+            self.modifier,
+            self.createdAt,
+            self.modifiedAt,
+            self.nodeType,
+        ) = values
+
+    @classmethod
+    def from_dict(cls, raw: Any, strict: bool = False) -> "CompactEvent":
+        """
+        Build an event from a decoded payload.
+
+        Without `strict`, a payload whose fields all have their exact
+        schema types is used as-is; anything else is validated by
+        `RepoEvent`, so the same payloads are accepted either way.
+
+        Parameters
+        ----------
+        raw : Any
+            Decoded JSON payload.
+        strict : bool, optional
+            Always validate with `RepoEvent`, by default False.
+
+        Returns
+        -------
+        CompactEvent
+            Event with the payload's schema fields.
+
+        Raises
+        ------
+        pydantic.ValidationError
+            If the payload does not match the schema.
+        """
+        if not strict and type(raw) is dict:
+            values = tuple(map(raw.get, cls.__slots__))
+            signature = tuple(map(type, values))
+            if signature in _ACCEPTED:
+                return cls(*values)
+            if all(map(operator.contains, _EXACT_TYPES, signature)):
+                if len(_ACCEPTED) < _MAX_SIGNATURES:
+                    _ACCEPTED.add(signature)
+                return cls(*values)
+        return cls.from_model(RepoEvent.model_validate(raw))
+
+    @classmethod
+    def from_model(cls, model: RepoEvent) -> "CompactEvent":
+        """
+        Copy a validated `RepoEvent`.
+        """
+        return cls(*_values(model))
+
+    def model_dump(
+        self,
+        *,
+        mode: str = "python",
+        include: Optional[Iterable[str]] = None,
+        exclude: Optional[Iterable[str]] = None,
+        by_alias: bool = False,
+        exclude_none: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Fields as a dict, like `RepoEvent.model_dump()`.
+
+        Supports the `RepoEvent.model_dump` options that apply to a
+        flat model; any other option raises `TypeError`.
+
+        Parameters
+        ----------
+        mode : {"python", "json"}, optional
+            Output mode; every field value is already JSON-compatible,
+            so both give the same result.
+        include : iterable of str, optional
+            Fields to include (a set, or a dict whose keys are used).
+        exclude : iterable of str, optional
+            Fields to exclude.
+        by_alias : bool, optional
+            Accepted; `RepoEvent` declares no aliases.
+        exclude_none : bool, optional
+            Omit fields whose value is None, by default False.
+
+        Returns
+        -------
+        dict
+            Field values in declaration order.
+        """
+        if mode not in ("python", "json"):
+            raise ValueError(f"Unknown model_dump mode {mode!r}")
+        data = dict(zip(self.__slots__, _values(self)))
+        if include is not None:
+            include = set(include)
+            data = {k: v for k, v in data.items() if k in include}
+        if exclude is not None:
+            exclude = set(exclude)
+            data = {k: v for k, v in data.items() if k not in exclude}
+        if exclude_none:
+            data = {k: v for k, v in data.items() if v is not None}
+        return data
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, CompactEvent):
+            return NotImplemented
+        return _values(self) == _values(other)
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"CompactEvent(eventType={self.eventType!r}, nodeRef={self.nodeRef!r})"
+
+
+if CompactEvent.__slots__ != tuple(RepoEvent.model_fields):
+    raise TypeError("CompactEvent fields do not match RepoEvent")
+
+# All field values of a RepoEvent or CompactEvent, in declaration order
+_values = operator.attrgetter(*CompactEvent.__slots__)
@@ -0,0 +1,209 @@
+"""
+core.senders
+============
+
+Per-destination asynchronous publishing.
+
+By default the listener publishes to each matching route serially,
+so one slow destination (e.g. a queue at its memory limit blocking
+producers) holds up every other route and the worker that handles
+the event.
+
+In isolation mode each destination queue gets its own bounded buffer,
+sender thread and producer connection. The listener hands payloads to the senders, waits
+for every route to confirm within its timeout, and only then ACKs the
+source frame. A route that cannot confirm in time turns into a NACK,
+so the broker redelivers the frame instead of a thread hanging on a
+stuck destination.
+
+Isolation mode requires a producer pool (`PUBLISHER_CONNECTIONS`);
+each sender opens a dedicated connection from it rather than sharing
+the pool's round-robin connections, where a send blocked on one
+destination would hold up every other sender using that connection.
+On the consuming connection a blocked destination would stall ACKs,
+NACKs and every other route anyway.
+
+Because a frame is redelivered as a whole, routes that did succeed
+may receive the event again (at-least-once delivery).
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Optional
+
+logger = logging.getLogger("router.senders")
+
+# Sentinel placed on the queue to stop a sender thread
+_STOP = object()
+
+
+class RouteSender:
+    """
+    Bounded outbound buffer with a dedicated sender thread.
+    """
+
+    def __init__(self, publisher, destination: str, queue_size: int):
+        """
+        Initialize and start the sender.
+
+        Parameters
+        ----------
+        publisher : QueuePublisher
+            Publisher used to send payloads, owned by the sender.
+        destination : str
+            Queue served by this sender.
+        queue_size : int
+            Maximum payloads waiting to be sent.
+        """
+        self.publisher = publisher
+        self.destination = destination
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f"router-sender-{destination}",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def submit(self, payload: dict, timeout: float) -> Future:
+        """
+        Queue a payload for sending.
+
+        Parameters
+        ----------
+        payload : dict
+            Message payload.
+        timeout : float
+            Seconds the payload may wait, both for buffer space and
+            in the buffer, before it is abandoned.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Resolves to None once the payload has been sent, or fails
+            with the send error or `TimeoutError`.
+        """
+        future: Future = Future()
+        deadline = time.monotonic() + timeout
+
+        try:
+            self._queue.put((future, payload, deadline), timeout=timeout)
+        except queue.Full:
+            future.set_exception(
+                TimeoutError(f"Send buffer for {self.destination} is full")
+            )
+
+        return future
+
+    def stop(self) -> None:
+        """
+        Stop the sender after draining queued payloads and close its
+        publisher.
+        """
+        self._queue.put(_STOP)
+        self._thread.join()
+        self.publisher.close()
+
+    def _run(self) -> None:
+        """
+        Sender thread main loop.
+        """
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+
+            future, payload, deadline = item
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            if time.monotonic() > deadline:
+                future.set_exception(
+                    TimeoutError(f"Send to {self.destination} expired in buffer")
+                )
+                continue
+
+            try:
+                self.publisher.publish(self.destination, payload)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(None)
+
+
+class RouteSenders:
+    """
+    Registry of per-destination senders, created on first use.
+    """
+
+    def __init__(self, publisher, queue_size: int):
+        """
+        Parameters
+        ----------
+        publisher : QueuePublisher
+            Publisher from which each sender gets a dedicated one.
+        queue_size : int
+            Buffer size of each sender.
+        """
+        self.publisher = publisher
+        self.queue_size = queue_size
+        self._senders: Dict[str, RouteSender] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, destination: str, payload: dict, timeout: float) -> Future:
+        """
+        Queue a payload on the sender for its destination.
+
+        Parameters
+        ----------
+        destination : str
+            Queue name.
+        payload : dict
+            Message payload.
+        timeout : float
+            Seconds before the send is abandoned.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Send result; see `RouteSender.submit`.
+        """
+        sender: Optional[RouteSender] = self._senders.get(destination)
+        if sender is None:
+            with self._lock:
+                sender = self._senders.get(destination)
+                if sender is None:
+                    sender = RouteSender(
+                        self.publisher.dedicated(), destination, self.queue_size
+                    )
+                    self._senders[destination] = sender
+                    logger.info("Started sender for %s", destination)
+
+        return sender.submit(payload, timeout)
+
+    def rebind(self, conn) -> None:
+        """
+        Re-establish the senders' producer connections after the
+        consumer reconnected; see `PooledQueuePublisher.rebind`.
+
+        Parameters
+        ----------
+        conn : Any
+            Newly connected consumer connection.
+        """
+        with self._lock:
+            senders = list(self._senders.values())
+        for sender in senders:
+            sender.publisher.rebind(conn)
+
+    def close(self) -> None:
+        """
+        Stop all senders after draining their buffers.
+        """
+        with self._lock:
+            senders, self._senders = list(self._senders.values()), {}
+        for sender in senders:
+            sender.stop()
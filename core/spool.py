@@ -0,0 +1,552 @@
+"""
+core.spool
+==========
+
+Local durable spool for payloads that could not be published.
+
+Without a spool a failed publish leaves the source frame un-ACKed and
+the broker redelivers it, so a flapping destination turns into a
+redelivery storm that decodes and routes the same events again and
+again. With `settings.SPOOL_DIR` set, a routed payload whose publish
+fails is appended to the spool instead, and the source frame is ACKed
+once the payload is safely on disk. A background drainer republishes
+spooled payloads in order as soon as their destination recovers.
+
+While a destination has payloads in the spool, new payloads for it
+are spooled directly, so they are not published ahead of the backlog.
+
+On-disk format
+--------------
+The spool is an append-only log split into segment files
+(`<sequence>.seg`, rotated at `SPOOL_SEGMENT_BYTES`). Each record is
+
+    length (u32) | crc32 (u32) | meta length (u16) | meta JSON | body
+
+where the JSON holds the destination and content headers. Appends are
+made durable with group commit: concurrent writers share one `fsync`.
+The drainer reads segments through `mmap`, deletes each segment once
+it is fully republished, and keeps its position in a `cursor` file.
+
+On startup, records after the cursor are validated; a torn or corrupt
+tail (e.g. from a crash mid-write) is truncated. Delivery is
+at-least-once: payloads republished since the last cursor update are
+published again after a crash.
+"""
+
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections import Counter
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from settings import settings
+from core.codec import Encoded, dumps, loads
+from core.metrics import SPOOL_BYTES, SPOOL_DRAINED, SPOOL_PENDING, SPOOLED
+from core.reconnect import Backoff
+
+logger = logging.getLogger("router.spool")
+
+_HEADER = struct.Struct("<II")
+_META = struct.Struct("<H")
+_CURSOR = "cursor"
+_SUFFIX = ".seg"
+
+# Drained records between cursor file updates
+_CURSOR_EVERY = 64
+
+
+class SpoolFull(Exception):
+    """
+    Raised when the spool has reached `SPOOL_MAX_BYTES`.
+    """
+
+
+def _pack(destination: str, payload) -> bytes:
+    """
+    Serialize a spool record (without the length / CRC header).
+    """
+    if not isinstance(payload, Encoded):
+        payload = Encoded(dumps(payload))
+    body = payload.body
+    meta = {"d": destination, "t": payload.content_type}
+    if payload.content_encoding is not None:
+        meta["e"] = payload.content_encoding
+    if payload.priority is not None:
+        meta["p"] = payload.priority
+    if payload.headers:
+        meta["h"] = payload.headers
+    if isinstance(body, str):
+        meta["s"] = True
+        body = body.encode("utf-8")
+    meta_bytes = dumps(meta).encode("utf-8")
+    return _META.pack(len(meta_bytes)) + meta_bytes + body
+
+
+def _unpack(record: bytes) -> Tuple[str, Encoded]:
+    """
+    Decode a spool record into its destination and payload.
+    """
+    (meta_length,) = _META.unpack_from(record)
+    start = _META.size
+    meta = loads(record[start:start + meta_length])
+    body = record[start + meta_length:]
+    if meta.get("s"):
+        body = body.decode("utf-8")
+    return meta["d"], Encoded(
+        body, meta["t"], meta.get("e"), meta.get("p"), meta.get("h")
+    )
+
+
+def _records(data, offset: int, end: int) -> Iterator[Tuple[int, bytes]]:
+    """
+    Iterate over valid records of a segment.
+
+    Parameters
+    ----------
+    data : bytes-like
+        Segment contents (typically an mmap).
+    offset : int
+        Position of the first record.
+    end : int
+        End of the readable data.
+
+    Yields
+    ------
+    tuple of (int, bytes)
+        Position after the record, and the record.
+        Iteration stops at the first torn or corrupt record.
+    """
+    while offset + _HEADER.size <= end:
+        length, crc = _HEADER.unpack_from(data, offset)
+        start = offset + _HEADER.size
+        if length < _META.size or start + length > end:
+            return
+        record = bytes(data[start:start + length])
+        if zlib.crc32(record) != crc:
+            return
+        offset = start + length
+        yield offset, record
+
+
+class Spool:
+    """
+    Durable FIFO of payloads awaiting republishing.
+
+    Thread-safe: payloads may be appended from any worker thread.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        publish: Callable,
+        segment_bytes: int = 64 * 1024 * 1024,
+        max_bytes: int = 1024 * 1024 * 1024,
+        fsync: bool = True,
+        backoff: Optional[Backoff] = None,
+    ):
+        """
+        Open (or recover) the spool and start the drainer.
+
+        Parameters
+        ----------
+        directory : str
+            Spool directory; created if missing. Must not be shared
+            with another router process.
+        publish : callable
+            `publish(destination, payload)` used to republish; raises
+            on failure.
+        segment_bytes : int, optional
+            Size at which a new segment file is started.
+        max_bytes : int, optional
+            Capacity of the spool.
+        fsync : bool, optional
+            Make appends durable before `append` returns.
+        backoff : Backoff, optional
+            Delay between republish attempts of a failing payload.
+        """
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self._publish = publish
+        self._backoff = backoff or Backoff(1.0, 30.0)
+
+        self._lock = threading.Lock()
+        self._readable = threading.Condition(self._lock)
+        self._sync_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+        # Segment sequence -> bytes written (and flushed to the OS)
+        self._sizes = {}
+        self._bytes = 0
+        # Payloads not yet republished, per destination
+        self._pending = Counter()
+
+        # Group commit state
+        self._appended = 0
+        self._synced = 0
+        self._unsynced: List = []
+        self._new_segment = False
+
+        os.makedirs(directory, exist_ok=True)
+        self._cursor = self._recover()
+        self._file = None
+        self._active = 0
+        self._open_segment(max(max(self._sizes, default=0) + 1, self._cursor[0]))
+
+        self._drainer = threading.Thread(
+            target=self._drain,
+            name="router-spool",
+            daemon=True,
+        )
+        self._drainer.start()
+
+    @classmethod
+    def from_settings(cls, publish: Callable) -> Optional["Spool"]:
+        """
+        Open the spool configured by `settings.SPOOL_DIR`.
+
+        Parameters
+        ----------
+        publish : callable
+            `publish(destination, payload)` used to republish.
+
+        Returns
+        -------
+        Spool or None
+            Spool, or None when spooling is disabled.
+        """
+        if not settings.SPOOL_DIR:
+            return None
+        return cls(
+            settings.SPOOL_DIR,
+            publish,
+            segment_bytes=settings.SPOOL_SEGMENT_BYTES,
+            max_bytes=settings.SPOOL_MAX_BYTES,
+            fsync=settings.SPOOL_FSYNC,
+            backoff=Backoff(
+                settings.SPOOL_RETRY_INITIAL_MS / 1000.0,
+                settings.SPOOL_RETRY_MAX_MS / 1000.0,
+            ),
+        )
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def holds(self, destination: str) -> bool:
+        """
+        Whether payloads for a destination are waiting in the spool.
+
+        New payloads for such a destination should be appended rather
+        than published, to keep them in order.
+        """
+        return self._pending[destination] > 0
+
+    @property
+    def pending(self) -> int:
+        """
+        Number of payloads awaiting republishing.
+        """
+        return sum(self._pending.values())
+
+    def append(self, destination: str, payload) -> None:
+        """
+        Durably append a payload.
+
+        Returns once the payload is on disk (or, with `fsync`
+        disabled, handed to the operating system).
+
+        Parameters
+        ----------
+        destination : str
+            Destination queue.
+        payload : dict or Encoded
+            Payload to republish.
+
+        Raises
+        ------
+        SpoolFull
+            If the spool has reached its capacity.
+        OSError
+            If the spool cannot be written.
+        """
+        record = _pack(destination, payload)
+        data = _HEADER.pack(len(record), zlib.crc32(record)) + record
+
+        with self._lock:
+            if self._bytes + len(data) > self.max_bytes:
+                raise SpoolFull(f"Spool full ({self._bytes} bytes)")
+            if self._sizes[self._active] and self._sizes[self._active] + len(data) > self.segment_bytes:
+                self._rotate()
+            self._file.write(data)
+            # Flush to the OS so the drainer's mmap sees the record
+            self._file.flush()
+            self._sizes[self._active] += len(data)
+            self._bytes += len(data)
+            self._appended += 1
+            sequence = self._appended
+            self._pending[destination] += 1
+            self._readable.notify()
+
+        if self.fsync:
+            self._commit(sequence)
+        SPOOLED.inc(queue=destination)
+        SPOOL_PENDING.set(self.pending)
+        SPOOL_BYTES.set(self._bytes)
+
+    def close(self) -> None:
+        """
+        Stop the drainer, save its position and close the spool.
+
+        Payloads not yet republished stay on disk for the next start.
+        """
+        self._stopped.set()
+        with self._lock:
+            self._readable.notify_all()
+        self._drainer.join()
+        with self._lock:
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._file.close()
+            for retired in self._unsynced:
+                retired.close()
+            self._unsynced = []
+        if self.pending:
+            logger.warning("Spool closed with %d payloads pending", self.pending)
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+    def _path(self, sequence: int) -> str:
+        return os.path.join(self.directory, f"{sequence:012d}{_SUFFIX}")
+
+    def _open_segment(self, sequence: int) -> None:
+        """
+        Start a new active segment. Caller holds the lock (or is
+        initializing).
+        """
+        self._file = open(self._path(sequence), "ab")
+        self._active = sequence
+        self._sizes[sequence] = 0
+        self._new_segment = True
+
+    def _rotate(self) -> None:
+        """
+        Seal the active segment. Caller holds the lock.
+
+        The old file is closed by the next group commit, after its
+        final fsync.
+        """
+        if self.fsync:
+            self._unsynced.append(self._file)
+        else:
+            self._file.close()
+        self._open_segment(self._active + 1)
+
+    def _commit(self, sequence: int) -> None:
+        """
+        Group commit: fsync unless another writer's fsync already
+        covered this append.
+        """
+        with self._sync_lock:
+            if self._synced >= sequence:
+                return
+            with self._lock:
+                target = self._appended
+                files = self._unsynced + [self._file]
+                self._unsynced = []
+                new_segment, self._new_segment = self._new_segment, False
+
+            for file in files:
+                os.fsync(file.fileno())
+            for file in files[:-1]:
+                file.close()
+            if new_segment:
+                # Persist the directory entry of the new segment
+                fd = os.open(self.directory, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            self._synced = target
+
+    # ------------------------------------------------------------------
+    # Recovery
+    # ------------------------------------------------------------------
+    def _recover(self) -> Tuple[int, int]:
+        """
+        Load segments and the drain cursor left by a previous run.
+
+        Returns
+        -------
+        tuple of (int, int)
+            Segment and offset of the next record to republish.
+        """
+        segments = sorted(
+            int(name[:-len(_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.endswith(_SUFFIX) and name[:-len(_SUFFIX)].isdigit()
+        )
+        cursor = self._read_cursor() or ((segments[0], 0) if segments else (1, 0))
+
+        for sequence in segments:
+            path = self._path(sequence)
+            if sequence < cursor[0]:
+                os.remove(path)
+                continue
+
+            size = os.path.getsize(path)
+            start = cursor[1] if sequence == cursor[0] else 0
+            end = start
+            if size > start:
+                with open(path, "rb") as f, mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as data:
+                    for end, record in _records(data, start, size):
+                        self._pending[_unpack(record)[0]] += 1
+            if end < size:
+                logger.warning(
+                    "Truncating torn spool segment",
+                    extra={"segment": path, "valid_bytes": end, "size": size},
+                )
+                os.truncate(path, end)
+                size = end
+            self._sizes[sequence] = size
+            self._bytes += size
+
+        if cursor[0] not in self._sizes:
+            # Cursor segment already deleted: continue with the next one
+            cursor = (min((s for s in self._sizes if s > cursor[0]), default=cursor[0]), 0)
+
+        if self.pending:
+            logger.warning(
+                "Recovered %d spooled payloads",
+                self.pending,
+                extra={"destinations": ",".join(sorted(self._pending))},
+            )
+        SPOOL_PENDING.set(self.pending)
+        SPOOL_BYTES.set(self._bytes)
+        return cursor
+
+    def _read_cursor(self) -> Optional[Tuple[int, int]]:
+        try:
+            with open(os.path.join(self.directory, _CURSOR)) as f:
+                sequence, offset = f.read().split()
+            return int(sequence), int(offset)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.warning("Ignoring invalid spool cursor file")
+            return None
+
+    def _write_cursor(self) -> None:
+        path = os.path.join(self.directory, _CURSOR)
+        with open(path + ".tmp", "w") as f:
+            f.write(f"{self._cursor[0]} {self._cursor[1]}")
+        os.replace(path + ".tmp", path)
+
+    # ------------------------------------------------------------------
+    # Draining
+    # ------------------------------------------------------------------
+    def _drain(self) -> None:
+        """
+        Republish spooled payloads in order until closed.
+        """
+        drained = 0
+        while not self._stopped.is_set():
+            with self._lock:
+                sequence, offset = self._cursor
+                while (
+                    not self._stopped.is_set()
+                    and sequence == self._active
+                    and offset >= self._sizes[sequence]
+                ):
+                    if drained:
+                        self._write_cursor()
+                        drained = 0
+                    self._readable.wait()
+                if self._stopped.is_set():
+                    break
+                end = self._sizes.get(sequence, 0)
+                sealed = sequence != self._active
+
+            if offset >= end and sealed:
+                self._finish_segment(sequence)
+                continue
+
+            drained += self._drain_segment(sequence, offset, end)
+            if drained >= _CURSOR_EVERY:
+                with self._lock:
+                    self._write_cursor()
+                drained = 0
+
+        with self._lock:
+            self._write_cursor()
+
+    def _drain_segment(self, sequence: int, offset: int, end: int) -> int:
+        """
+        Republish the records of a segment between two offsets.
+
+        Returns
+        -------
+        int
+            Number of records republished.
+        """
+        count = 0
+        with open(self._path(sequence), "rb") as f, mmap.mmap(f.fileno(), end, access=mmap.ACCESS_READ) as data:
+            for position, record in _records(data, offset, end):
+                destination, payload = _unpack(record)
+                if not self._republish(destination, payload):
+                    break
+                with self._lock:
+                    self._cursor = (sequence, position)
+                    self._pending[destination] -= 1
+                    if not self._pending[destination]:
+                        del self._pending[destination]
+                SPOOL_DRAINED.inc(queue=destination)
+                SPOOL_PENDING.set(self.pending)
+                count += 1
+            else:
+                if count == 0 and offset < end:
+                    # Corrupt record after recovery; cannot happen for
+                    # records written by this process
+                    logger.error("Skipping unreadable spool segment %d", sequence)
+                    with self._lock:
+                        self._cursor = (sequence, end)
+        return count
+
+    def _republish(self, destination: str, payload: Encoded) -> bool:
+        """
+        Publish a spooled payload, retrying with backoff until it
+        succeeds or the spool is closed.
+        """
+        while not self._stopped.is_set():
+            try:
+                self._publish(destination, payload)
+            except Exception as e:
+                delay = self._backoff.next()
+                logger.warning(
+                    "Republish to %s failed, retrying in %.1fs: %s",
+                    destination,
+                    delay,
+                    str(e) or type(e).__name__,
+                )
+                self._stopped.wait(delay)
+                continue
+            self._backoff.reset()
+            return True
+        return False
+
+    def _finish_segment(self, sequence: int) -> None:
+        """
+        Delete a fully republished segment and move to the next one.
+        """
+        os.remove(self._path(sequence))
+        with self._lock:
+            self._bytes -= self._sizes.pop(sequence)
+            self._cursor = (sequence + 1, 0)
+            self._write_cursor()
+        SPOOL_BYTES.set(self._bytes)
+        logger.debug("Spool segment %d drained", sequence)
@@ -0,0 +1,161 @@
+"""
+core.workers
+============
+
+Bounded worker pool used to move routing work off the STOMP
+receiver thread.
+
+stomp.py delivers every frame on a single receiver thread. When the
+listener parses, validates, routes, publishes and ACKs on that thread,
+throughput is capped at one event per broker round trip regardless of
+the configured prefetch.
+
+The pool in this module accepts work items from the receiver thread
+and processes them on a fixed number of worker threads.
+
+Design principles:
+- Bounded buffering: a full pool blocks the submitter (backpressure)
+- No silent drops: every accepted item is processed or drained on stop
+- Transport agnostic: the pool knows nothing about STOMP or routes
+"""
+
+import logging
+import queue
+import threading
+from typing import Callable, List, Optional
+
+logger = logging.getLogger("router.workers")
+
+# Sentinel placed on the queue to stop a worker thread
+_STOP = object()
+
+
+class WorkerPool:
+    """
+    Fixed-size thread pool with a bounded work queue.
+
+    `submit` blocks while the queue is full. When called from the STOMP
+    receiver thread this stops the connection from reading further
+    frames, so the broker's prefetch window naturally throttles
+    delivery instead of the router buffering without limit.
+    """
+
+    def __init__(
+        self,
+        handler: Callable,
+        workers: int,
+        queue_size: int,
+        name: str = "router-worker",
+    ):
+        """
+        Initialize and start the worker pool.
+
+        Parameters
+        ----------
+        handler : callable
+            Function invoked with each submitted item. Exceptions are
+            logged and never terminate the worker thread.
+        workers : int
+            Number of worker threads.
+        queue_size : int
+            Maximum number of items waiting for a worker.
+        name : str, optional
+            Thread name prefix, by default "router-worker".
+        """
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+
+        self._handler = handler
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+        self._threads: List[threading.Thread] = []
+        self._closed = False
+
+        for index in range(workers):
+            thread = threading.Thread(
+                target=self._run,
+                name=f"{name}-{index}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+        logger.info(
+            "Worker pool started",
+            extra={"workers": workers, "queue_size": queue_size},
+        )
+
+    @property
+    def size(self) -> int:
+        """
+        Number of worker threads.
+
+        Returns
+        -------
+        int
+            Worker thread count.
+        """
+        return len(self._threads)
+
+    def submit(self, item, timeout: Optional[float] = None) -> None:
+        """
+        Queue an item for processing.
+
+        Blocks while the queue is full. Once the pool has been shut
+        down, items are not accepted and are dropped unprocessed: the
+        listener keeps receiving frames until its connection closes,
+        and leaving them un-ACKed has the broker redeliver them.
+
+        Parameters
+        ----------
+        item : Any
+            Work item passed to the handler.
+        timeout : float, optional
+            Maximum seconds to wait for queue space. Waits forever
+            when None.
+
+        Raises
+        ------
+        queue.Full
+            If `timeout` elapses before space becomes available.
+        """
+        if self._closed:
+            logger.debug("Worker pool is shut down, item not accepted")
+            return
+        self._queue.put(item, timeout=timeout)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stop accepting work and stop the worker threads.
+
+        Items already queued are processed before the workers exit.
+
+        Parameters
+        ----------
+        wait : bool, optional
+            Block until all worker threads have exited, by default True.
+        """
+        if self._closed:
+            return
+        self._closed = True
+
+        for _ in self._threads:
+            self._queue.put(_STOP)
+
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+        logger.info("Worker pool stopped")
+
+    def _run(self) -> None:
+        """
+        Worker thread main loop.
+        """
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            try:
+                self._handler(item)
+            except Exception:
+                logger.exception("Unhandled error in worker thread")
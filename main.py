@@ -8,25 +8,43 @@ This module is responsible for:
 - Initializing logging
 - Establishing the STOMP connection
 - Subscribing to the event topic
+- Running the threaded (stomp.py) or asyncio runtime
+- Polling destination depths for adaptive rate limits
+- Reconnecting with backoff when the broker connection is lost
+- Supervising several router processes in virtual-topic mode
 - Managing application lifecycle and graceful shutdown
 """
 
+import asyncio
 import logging
+import multiprocessing
+import os
 import signal
 import sys
 import time
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
 import stomp
 
 from settings import settings
+from core.aiorouter import AsyncTopicRouter
+from core.aiostomp import AsyncStompConnection
 from core.listener import TopicRouterListener
+from core.publisher import PooledQueuePublisher, QueuePublisher
 from core.logging_config import setup_logging
+from core.metrics import start_metrics_server
+from core.ratelimit import QueueDepthProbe, RateLimiter
+from core.reconnect import ConnectionSupervisor
 
 logger = logging.getLogger("router.main")
 
 _shutdown_requested: bool = False
 
+# Supervisor: minimum seconds between restarts of a process slot
+_RESTART_DELAY = 5.0
+# Supervisor: seconds a process gets to shut down before it is killed
+_STOP_TIMEOUT = 30.0
+
 
 def _handle_shutdown(signum, frame) -> None:
     """
@@ -62,67 +80,508 @@ def _create_connection() -> stomp.Connection12:
     )
 
 
+def _connect_producer() -> stomp.Connection12:
+    """
+    Create and connect a dedicated producer connection.
+
+    Producer connections do not subscribe and do not use the durable
+    client-id, which the broker only allows once.
+
+    Returns
+    -------
+    stomp.Connection12
+        Connected STOMP connection.
+    """
+    conn = _create_connection()
+    conn.connect(
+        login=settings.ACTIVEMQ_USER,
+        passcode=settings.ACTIVEMQ_PASSWORD,
+        wait=True,
+    )
+    return conn
+
+
+def _create_publisher(conn: stomp.Connection12) -> QueuePublisher:
+    """
+    Create the publisher used for routed payloads.
+
+    Parameters
+    ----------
+    conn : stomp.Connection12
+        Consuming connection, used when no producer pool is configured.
+
+    Returns
+    -------
+    QueuePublisher
+        Single-connection or pooled publisher.
+    """
+    if settings.PUBLISHER_CONNECTIONS > 0:
+        return PooledQueuePublisher(
+            _connect_producer,
+            size=settings.PUBLISHER_CONNECTIONS,
+        )
+    return QueuePublisher(conn)
+
+
+def _connect_headers() -> Dict[str, str]:
+    """
+    CONNECT headers for the consuming connection.
+
+    Durable subscriptions are bound to the client-id, which the broker
+    allows only once. Virtual-topic consumers are plain queue consumers
+    and connect without one, so any number of processes can share the
+    consumer queue.
+
+    Returns
+    -------
+    dict
+        Extra CONNECT headers.
+    """
+    if settings.CONSUMER_MODE == "durable":
+        return {"client-id": settings.ROUTER_CLIENT_ID}
+    return {}
+
+
+def _subscription() -> Tuple[str, Dict[str, str]]:
+    """
+    Destination and SUBSCRIBE headers for the configured consumer mode.
+
+    Returns
+    -------
+    tuple of (str, dict)
+        Destination to subscribe to and extra SUBSCRIBE headers.
+    """
+    headers = {"activemq.prefetchSize": str(settings.ACTIVEMQ_PREFETCH)}
+    if settings.CONSUMER_MODE == "virtual-topic":
+        return settings.consumer_queue, headers
+
+    headers["activemq.subscriptionName"] = settings.ROUTER_SUBSCRIPTION_NAME
+    return settings.EVENT_TOPIC, headers
+
+
+def _start_probe(limiter: Optional[RateLimiter]) -> Optional[QueueDepthProbe]:
+    """
+    Start polling destination depths for adaptive rate limits.
+
+    Parameters
+    ----------
+    limiter : RateLimiter, optional
+        Router's rate limiter; None when no route is rate limited.
+
+    Returns
+    -------
+    QueueDepthProbe or None
+        Running probe, or None when flow control is disabled.
+    """
+    if limiter is None or settings.FLOW_PROBE_INTERVAL_SECONDS <= 0:
+        return None
+    probe = QueueDepthProbe(
+        _connect_producer,
+        limiter,
+        interval=settings.FLOW_PROBE_INTERVAL_SECONDS,
+    )
+    probe.start()
+    return probe
+
+
+def _create_async_connection() -> AsyncStompConnection:
+    """
+    Create an asyncio STOMP connection.
+
+    Returns
+    -------
+    AsyncStompConnection
+        Configured, not yet connected connection.
+    """
+    return AsyncStompConnection(
+        settings.ACTIVEMQ_HOST,
+        settings.ACTIVEMQ_PORT,
+        heartbeats=(
+            settings.STOMP_HEARTBEAT_OUT,
+            settings.STOMP_HEARTBEAT_IN,
+        ),
+    )
+
+
+async def _open_async_consumer(
+    conn: AsyncStompConnection,
+    router: AsyncTopicRouter,
+) -> AsyncStompConnection:
+    """
+    Connect, rebind the router if needed, and subscribe.
+
+    Parameters
+    ----------
+    conn : AsyncStompConnection
+        Connection to open.
+    router : AsyncTopicRouter
+        Router consuming from the connection; rebound to it when
+        created on an earlier connection.
+
+    Returns
+    -------
+    AsyncStompConnection
+        The subscribed connection.
+    """
+    await conn.connect(
+        login=settings.ACTIVEMQ_USER,
+        passcode=settings.ACTIVEMQ_PASSWORD,
+        headers=_connect_headers(),
+    )
+
+    logger.info(
+        "Connected to ActiveMQ",
+        extra={
+            "host": settings.ACTIVEMQ_HOST,
+            "port": settings.ACTIVEMQ_PORT,
+        },
+    )
+
+    try:
+        if router.conn is not conn:
+            await router.rebind(conn)
+
+        destination, headers = _subscription()
+        await conn.subscribe(
+            destination=destination,
+            id=settings.ROUTER_SUBSCRIPTION_NAME,
+            ack="client-individual",
+            headers=headers,
+        )
+    except Exception:
+        if conn.is_connected():
+            await conn.disconnect()
+        raise
+
+    logger.info(
+        "Subscribed",
+        extra={
+            "destination": destination,
+            "mode": settings.CONSUMER_MODE,
+            "subscription": settings.ROUTER_SUBSCRIPTION_NAME,
+            "prefetch": settings.ACTIVEMQ_PREFETCH,
+        },
+    )
+    return conn
+
+
+async def _run_asyncio() -> None:
+    """
+    Run the router on a single asyncio event loop.
+
+    Returns after a shutdown signal once in-flight events have been
+    handled. A lost broker connection is re-established with backoff.
+
+    Raises
+    ------
+    ConnectionError
+        If `RECONNECT_MAX_ATTEMPTS` reconnect attempts failed.
+    """
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+
+    conn = _create_async_connection()
+    router = AsyncTopicRouter(conn)
+    await _open_async_consumer(conn, router)
+
+    supervisor = ConnectionSupervisor.from_settings()
+    probe = _start_probe(router.limiter)
+    consume: Optional[asyncio.Task] = None
+    stopped = asyncio.create_task(stop.wait())
+    try:
+        while True:
+            consume = asyncio.create_task(router.run())
+            await asyncio.wait({consume, stopped}, return_when=asyncio.FIRST_COMPLETED)
+            if stop.is_set():
+                logger.warning("Shutdown signal received")
+                break
+
+            supervisor.on_disconnected()
+            logger.error("Connection to ActiveMQ lost, reconnecting")
+            reconnected = await supervisor.recover_async(
+                lambda: _open_async_consumer(_create_async_connection(), router),
+                stop.is_set,
+            )
+            if reconnected is None:
+                break
+            conn = reconnected
+    finally:
+        if consume is not None:
+            consume.cancel()
+        stopped.cancel()
+        if probe is not None:
+            await asyncio.to_thread(probe.close)
+        await router.close()
+        if conn.is_connected():
+            logger.info("Disconnecting from ActiveMQ")
+            await conn.disconnect()
+
+
 def main() -> None:
     """
     Application entry point.
     """
-    setup_logging(settings.LOG_LEVEL)
+    setup_logging(
+        settings.LOG_LEVEL,
+        settings.LOG_FORMAT,
+        settings.LOG_ASYNC,
+        settings.LOG_RATE_LIMITS,
+        settings.LOG_QUEUE_SIZE,
+    )
+
+    if settings.ROUTER_PROCESSES > 1:
+        _supervise(settings.ROUTER_PROCESSES)
+    else:
+        _run_router()
+
+
+def _run_router(index: int = 0) -> None:
+    """
+    Run one router instance in the current process.
+
+    Parameters
+    ----------
+    index : int, optional
+        Process index under the supervisor; offsets the metrics port.
+    """
+    logger.info(
+        "Starting Alfresco Event Router",
+        extra={"runtime": settings.ROUTER_RUNTIME, "process": index},
+    )
+
+    if settings.METRICS_PORT > 0:
+        start_metrics_server(settings.METRICS_HOST, settings.METRICS_PORT + index)
+
+    if settings.ROUTER_RUNTIME == "asyncio":
+        try:
+            asyncio.run(_run_asyncio())
+        except Exception:
+            logger.exception("Fatal router error")
+            sys.exit(1)
+        logger.info("Event router stopped cleanly")
+        return
+
+    _run_threaded()
+
+
+def _router_process(index: int) -> None:
+    """
+    Entry point of a router process started by the supervisor.
+
+    Parameters
+    ----------
+    index : int
+        Process index.
+    """
+    setup_logging(
+        settings.LOG_LEVEL,
+        settings.LOG_FORMAT,
+        settings.LOG_ASYNC,
+        settings.LOG_RATE_LIMITS,
+        settings.LOG_QUEUE_SIZE,
+    )
+
+    # Processes must not append to the same gzip stream
+    if settings.CAPTURE_FILE:
+        settings.CAPTURE_FILE = f"{settings.CAPTURE_FILE}.{index}"
+    # Each process drains its own spool
+    if settings.SPOOL_DIR:
+        settings.SPOOL_DIR = os.path.join(settings.SPOOL_DIR, str(index))
+
+    _run_router(index)
+
+
+def _supervise(processes: int) -> None:
+    """
+    Run several router processes sharing the virtual-topic queue.
+
+    Each process has its own broker connection and consumer, so the
+    broker load-balances events across them and routing scales past
+    the core count of one Python process. A process that exits is
+    restarted; on SIGTERM / SIGINT all processes are stopped
+    gracefully.
 
-    logger.info("Starting Alfresco Event Router")
-    
+    Parameters
+    ----------
+    processes : int
+        Number of router processes.
+    """
     signal.signal(signal.SIGTERM, _handle_shutdown)
     signal.signal(signal.SIGINT, _handle_shutdown)
 
-    conn: Optional[stomp.Connection12] = None
+    logger.info(
+        "Starting router processes",
+        extra={"processes": processes, "queue": settings.consumer_queue},
+    )
+
+    context = multiprocessing.get_context("spawn")
+    children: List[Optional[multiprocessing.Process]] = [None] * processes
+    started = [float("-inf")] * processes
 
     try:
-        conn = _create_connection()
-        conn.set_listener("", TopicRouterListener(conn))
-
-        conn.connect(
-            login=settings.ACTIVEMQ_USER,
-            passcode=settings.ACTIVEMQ_PASSWORD,
-            wait=True,
-            headers={
-                "client-id": settings.ROUTER_CLIENT_ID,
-            },
-        )
+        while not _shutdown_requested:
+            now = time.monotonic()
+            for index, child in enumerate(children):
+                if child is not None:
+                    if child.is_alive():
+                        continue
+                    logger.error(
+                        "Router process %d exited, restarting",
+                        index,
+                        extra={"exitcode": child.exitcode},
+                    )
+                    children[index] = None
 
-        logger.info(
-            "Connected to ActiveMQ",
-            extra={
-                "host": settings.ACTIVEMQ_HOST,
-                "port": settings.ACTIVEMQ_PORT,
-            },
-        )
+                # Avoid a tight restart loop when processes fail at startup
+                if now - started[index] < _RESTART_DELAY:
+                    continue
+
+                child = context.Process(
+                    target=_router_process,
+                    args=(index,),
+                    name=f"router-{index}",
+                )
+                child.start()
+                children[index] = child
+                started[index] = now
+
+            time.sleep(1)
+
+    finally:
+        running = [child for child in children if child is not None]
+        for child in running:
+            if child.is_alive():
+                child.terminate()
+        for child in running:
+            child.join(_STOP_TIMEOUT)
+            if child.is_alive():
+                logger.warning("Router process %s did not stop, killing", child.name)
+                child.kill()
+
+        logger.info("Router processes stopped")
+
+
+def _open_consumer(
+    conn: stomp.Connection12,
+    listener: TopicRouterListener,
+    supervisor: ConnectionSupervisor,
+) -> stomp.Connection12:
+    """
+    Connect, rebind the listener if needed, and subscribe.
+
+    Parameters
+    ----------
+    conn : stomp.Connection12
+        Connection to open.
+    listener : TopicRouterListener
+        Listener consuming from the connection; rebound to it when
+        created on an earlier connection.
+    supervisor : ConnectionSupervisor
+        Notified when the connection is lost.
+
+    Returns
+    -------
+    stomp.Connection12
+        The subscribed connection.
+    """
+    conn.set_listener("", listener)
+    conn.set_listener("reconnect", supervisor)
+    conn.connect(
+        login=settings.ACTIVEMQ_USER,
+        passcode=settings.ACTIVEMQ_PASSWORD,
+        wait=True,
+        headers=_connect_headers(),
+    )
+
+    logger.info(
+        "Connected to ActiveMQ",
+        extra={
+            "host": settings.ACTIVEMQ_HOST,
+            "port": settings.ACTIVEMQ_PORT,
+        },
+    )
+
+    try:
+        if listener.conn is not conn:
+            listener.rebind(conn)
 
+        destination, headers = _subscription()
         conn.subscribe(
-            destination=settings.EVENT_TOPIC,
+            destination=destination,
             id=settings.ROUTER_SUBSCRIPTION_NAME,
             ack="client-individual",
-            headers={
-                "activemq.subscriptionName": settings.ROUTER_SUBSCRIPTION_NAME,
-                "activemq.prefetchSize": str(settings.ACTIVEMQ_PREFETCH),
-            },
+            headers=headers,
         )
+    except Exception:
+        if conn.is_connected():
+            conn.disconnect()
+        raise
 
-        logger.info(
-            "Subscribed to topic",
-            extra={
-                "topic": settings.EVENT_TOPIC,
-                "subscription": settings.ROUTER_SUBSCRIPTION_NAME,
-                "prefetch": settings.ACTIVEMQ_PREFETCH,
-            },
-        )
+    logger.info(
+        "Subscribed",
+        extra={
+            "destination": destination,
+            "mode": settings.CONSUMER_MODE,
+            "subscription": settings.ROUTER_SUBSCRIPTION_NAME,
+            "prefetch": settings.ACTIVEMQ_PREFETCH,
+        },
+    )
+    return conn
+
+
+def _run_threaded() -> None:
+    """
+    Run the router on stomp.py's receiver thread (and worker threads).
+    """
+    signal.signal(signal.SIGTERM, _handle_shutdown)
+    signal.signal(signal.SIGINT, _handle_shutdown)
+
+    conn: Optional[stomp.Connection12] = None
+    listener: Optional[TopicRouterListener] = None
+    publisher: Optional[QueuePublisher] = None
+    probe: Optional[QueueDepthProbe] = None
+    supervisor = ConnectionSupervisor.from_settings()
+
+    try:
+        conn = _create_connection()
+        publisher = _create_publisher(conn)
+        listener = TopicRouterListener(conn, publisher=publisher)
+        _open_consumer(conn, listener, supervisor)
+
+        probe = _start_probe(listener.limiter)
 
         while not _shutdown_requested:
-            time.sleep(1)
+            if not supervisor.lost.wait(1) and conn.is_connected():
+                continue
+            if _shutdown_requested:
+                break
+
+            supervisor.on_disconnected()
+            logger.error("Connection to ActiveMQ lost, reconnecting")
+            reconnected = supervisor.recover(
+                lambda: _open_consumer(_create_connection(), listener, supervisor),
+                lambda: _shutdown_requested,
+            )
+            if reconnected is None:
+                break
+            conn = reconnected
 
     except Exception:
         logger.exception("Fatal router error")
         sys.exit(1)
 
     finally:
+        if probe:
+            probe.close()
+
+        if listener:
+            listener.close()
+
+        if publisher:
+            publisher.close()
+
         if conn and conn.is_connected():
             logger.info("Disconnecting from ActiveMQ")
             conn.disconnect()
@@ -12,7 +12,8 @@ to avoid recursive or internal processing.
 import logging
 
 from core.base import BaseRoute
-from core.schema import RepoEvent
+from core.prefix import PrefixIndex
+from core.schema import CompactEvent
 from settings import settings
 
 logger = logging.getLogger("router.route.autotag")
@@ -26,6 +27,11 @@ class AutoTagRoute(BaseRoute):
     when they satisfy defined eligibility criteria.
     """
 
+    event_types = frozenset({"BINARY_CHANGED"})
+    exclude_prefixes = (
+        "/Company Home/RULE_BASED_TAGS",
+    )
+
     # ------------------------------------------------------------------
     # BaseRoute contract
     # ------------------------------------------------------------------
@@ -53,7 +59,7 @@ class AutoTagRoute(BaseRoute):
         """
         return settings.AUTOTAG_QUEUE
 
-    def should_route(self, event: RepoEvent) -> bool:
+    def should_route(self, event: CompactEvent) -> bool:
         """
         Determine whether the event should be routed for auto-tagging.
 
@@ -64,7 +70,7 @@ class AutoTagRoute(BaseRoute):
 
         Parameters
         ----------
-        event : RepoEvent
+        event : CompactEvent
             Incoming repository event.
 
         Returns
@@ -92,13 +98,13 @@ class AutoTagRoute(BaseRoute):
     # Internal helpers
     # ------------------------------------------------------------------
     @staticmethod
-    def _is_binary_changed(event: RepoEvent) -> bool:
+    def _is_binary_changed(event: CompactEvent) -> bool:
         """
         Check if the event represents a binary content change.
 
         Parameters
         ----------
-        event : RepoEvent
+        event : CompactEvent
 
         Returns
         -------
@@ -125,8 +131,7 @@ class AutoTagRoute(BaseRoute):
         if not path:
             return True
 
-        excluded_prefixes = (
-            "/Company Home/RULE_BASED_TAGS",
-        )
+        return _EXCLUDED_PREFIXES.matches(path)
+
 
-        return any(path.startswith(prefix) for prefix in excluded_prefixes)
+_EXCLUDED_PREFIXES = PrefixIndex.of(AutoTagRoute.exclude_prefixes)
@@ -15,7 +15,9 @@ Design principles:
 - Environment-first (12-factor app)
 """
 
-from pydantic import Field
+from typing import Literal, Optional
+
+from pydantic import Field, model_validator
 from pydantic_settings import BaseSettings
 
 
@@ -69,6 +71,123 @@ class Settings(BaseSettings):
         ge=1,
     )
 
+    RECONNECT_INITIAL_DELAY_MS: int = Field(
+        default=500,
+        description="Upper bound of the first jittered reconnect delay (ms)",
+        ge=1,
+    )
+    RECONNECT_MAX_DELAY_MS: int = Field(
+        default=30_000,
+        description="Cap of the exponential reconnect delay (ms)",
+        ge=1,
+    )
+    RECONNECT_MAX_ATTEMPTS: int = Field(
+        default=0,
+        description="Reconnect attempts before giving up and exiting (0 = unlimited)",
+        ge=0,
+    )
+
+    # ------------------------------------------------------------------
+    # Concurrency and batching
+    # ------------------------------------------------------------------
+    ROUTER_RUNTIME: Literal["threaded", "asyncio"] = Field(
+        default="threaded",
+        description="Router runtime: stomp.py threads or a single asyncio event loop",
+    )
+    ROUTER_ASYNC_CONCURRENCY: int = Field(
+        default=100,
+        description="Maximum events handled concurrently by the asyncio runtime",
+        ge=1,
+    )
+    ROUTER_WORKERS: int = Field(
+        default=0,
+        description=(
+            "Number of routing worker threads "
+            "(0 = process frames on the STOMP receiver thread)"
+        ),
+        ge=0,
+    )
+    ROUTER_WORK_QUEUE_SIZE: int = Field(
+        default=100,
+        description="Maximum frames waiting for a worker before the receiver blocks",
+        ge=1,
+    )
+
+    BATCH_MAX_EVENTS: int = Field(
+        default=0,
+        description=(
+            "Events committed per STOMP transaction "
+            "(0 = publish and ACK each event individually)"
+        ),
+        ge=0,
+    )
+    BATCH_MAX_DELAY_MS: int = Field(
+        default=50,
+        description="Maximum time an event waits for its batch to commit (ms)",
+        ge=1,
+    )
+
+    PUBLISHER_CONNECTIONS: int = Field(
+        default=0,
+        description=(
+            "Dedicated producer connections for publishing "
+            "(0 = publish on the consuming connection)"
+        ),
+        ge=0,
+    )
+
+    ROUTE_ISOLATION: bool = Field(
+        default=False,
+        description=(
+            "Publish through a bounded sender and a dedicated producer "
+            "connection per destination queue so a slow destination cannot "
+            "stall other routes; threaded runtime only, requires "
+            "PUBLISHER_CONNECTIONS > 0"
+        ),
+    )
+    ROUTE_SEND_QUEUE_SIZE: int = Field(
+        default=100,
+        description="Payloads buffered per destination in isolation mode",
+        ge=1,
+    )
+    ROUTE_PUBLISH_TIMEOUT_MS: int = Field(
+        default=30_000,
+        description="Time a destination has to confirm a publish before NACK (ms)",
+        ge=1,
+    )
+
+    DEDUP_WINDOW_SECONDS: float = Field(
+        default=0,
+        description=(
+            "Suppress repeats of an already published event (same nodeRef, "
+            "eventType, versionLabel and size) within this window (0 = disabled)"
+        ),
+        ge=0,
+    )
+    DEDUP_MAX_ENTRIES: int = Field(
+        default=10_000,
+        description="Maximum events remembered for duplicate suppression",
+        ge=1,
+    )
+
+    COALESCE_QUIET_MS: int = Field(
+        default=0,
+        description=(
+            "Quiet period before publishing the latest held event of a node "
+            "on coalescing routes (0 = disabled)"
+        ),
+        ge=0,
+    )
+    COALESCE_ROUTES: str = Field(
+        default="",
+        description="Comma-separated route names to coalesce per node",
+    )
+    COALESCE_MAX_PENDING: int = Field(
+        default=1_000,
+        description="Maximum nodes held for coalescing before early publish",
+        ge=1,
+    )
+
     # ------------------------------------------------------------------
     # Routing configuration
     # ------------------------------------------------------------------
@@ -90,9 +209,262 @@ class Settings(BaseSettings):
         description="Destination queue for auto-tagging events",
     )
 
+    ROUTE_RULES_FILE: Optional[str] = Field(
+        default=None,
+        description="JSON file with declarative route rules (see core.rules)",
+    )
+    SCHEMA_FALLBACK_VERSION: int = Field(
+        default=1,
+        description="Schema version whose decoder handles unknown schemaVersion values (0 = reject them)",
+        ge=0,
+    )
+    STRICT_VALIDATION: bool = Field(
+        default=False,
+        description="Validate every event with the pydantic model, not only events whose fields need coercion",
+    )
+
+    JSON_BACKEND: Literal["auto", "orjson", "json"] = Field(
+        default="auto",
+        description=(
+            "JSON library for decoding events and encoding json-compact "
+            "payloads (auto = orjson if installed)"
+        ),
+    )
+    PAYLOAD_ENCODING: str = Field(
+        default="json",
+        description=(
+            "Default output encoding: json, json-compact or msgpack, "
+            "optionally with +gzip or +zstd (see core.encodings)"
+        ),
+    )
+    ROUTE_ENCODINGS: str = Field(
+        default="",
+        description="Comma-separated route=encoding overrides, e.g. vector=msgpack+zstd",
+    )
+    PAYLOAD_COMPRESS_MIN_BYTES: int = Field(
+        default=512,
+        description="Bodies smaller than this are published uncompressed",
+        ge=0,
+    )
+
     # Future extensions
-    # AUTOMETA_QUEUE: str
-    # VECTOR_QUEUE: str
+    # AUTOMETA_QUEUE / VECTOR_QUEUE can be added without code changes by
+    # declaring rules in ROUTE_RULES_FILE with "queue": "${AUTOMETA_QUEUE}"
+
+    # ------------------------------------------------------------------
+    # Priority lanes
+    # ------------------------------------------------------------------
+    LANE_ROUTES: str = Field(
+        default="",
+        description="Comma-separated route names whose events are split into small/large lanes",
+    )
+    LANE_MODE: Literal["priority", "queue", "both"] = Field(
+        default="priority",
+        description=(
+            "priority: set the JMS priority header; queue: publish to "
+            "<queue>.small / <queue>.large; both: do both"
+        ),
+    )
+    LANE_LARGE_MIN_BYTES: int = Field(
+        default=50 * 1024 * 1024,
+        description="Events at least this large use the large lane",
+        ge=0,
+    )
+    LANE_LARGE_MIME_TYPES: str = Field(
+        default="video/*,audio/*",
+        description="Comma-separated MIME types (major/* allowed) that always use the large lane",
+    )
+    LANE_LARGE_PATH_PREFIXES: str = Field(
+        default="",
+        description="Comma-separated path prefixes (e.g. bulk-import folders) that always use the large lane",
+    )
+    LANE_SMALL_PRIORITY: int = Field(
+        default=7,
+        description="JMS priority of small-lane messages",
+        ge=0,
+        le=9,
+    )
+    LANE_LARGE_PRIORITY: int = Field(
+        default=2,
+        description="JMS priority of large-lane messages",
+        ge=0,
+        le=9,
+    )
+
+    # ------------------------------------------------------------------
+    # Rate limiting and flow control
+    # ------------------------------------------------------------------
+    ROUTE_RATE_LIMITS: str = Field(
+        default="",
+        description="Comma-separated route=rate[:burst] limits in events per second, eg: autotag=5:20",
+    )
+    FLOW_PROBE_INTERVAL_SECONDS: float = Field(
+        default=0,
+        description="Seconds between destination depth polls of rate-limited routes (0 = disabled)",
+        ge=0,
+    )
+    FLOW_QUEUE_LOW_WATERMARK: int = Field(
+        default=1_000,
+        description="Destination depth up to which rate-limited routes run at full rate",
+        ge=0,
+    )
+    FLOW_QUEUE_HIGH_WATERMARK: int = Field(
+        default=10_000,
+        description="Destination depth at which rate-limited routes are paused",
+        ge=1,
+    )
+
+    # ------------------------------------------------------------------
+    # Spool
+    # ------------------------------------------------------------------
+    SPOOL_DIR: Optional[str] = Field(
+        default=None,
+        description="Directory of the on-disk spool for failed publishes (unset = disabled)",
+    )
+    SPOOL_SEGMENT_BYTES: int = Field(
+        default=64 * 1024 * 1024,
+        description="Size at which the spool starts a new segment file",
+        ge=4096,
+    )
+    SPOOL_MAX_BYTES: int = Field(
+        default=1024 * 1024 * 1024,
+        description="Spool capacity; when full, failed publishes fall back to redelivery",
+        ge=4096,
+    )
+    SPOOL_FSYNC: bool = Field(
+        default=True,
+        description="fsync spooled payloads (group commit) before ACKing their source frames",
+    )
+    SPOOL_RETRY_INITIAL_MS: int = Field(
+        default=1_000,
+        description="Upper bound of the first jittered delay before the drainer retries a publish (ms)",
+        ge=1,
+    )
+    SPOOL_RETRY_MAX_MS: int = Field(
+        default=30_000,
+        description="Cap of the drainer's retry delay (ms)",
+        ge=1,
+    )
+
+    # ------------------------------------------------------------------
+    # Dead-letter queue
+    # ------------------------------------------------------------------
+    DLQ_QUEUE: Optional[str] = Field(
+        default=None,
+        description="Queue receiving poison and crash-looping events (unset = ACK & drop / redeliver)",
+    )
+    DLQ_MAX_DELIVERIES: int = Field(
+        default=5,
+        description="Deliveries of a failing event before it is dead-lettered",
+        ge=1,
+    )
+    DLQ_TRACK_SECONDS: float = Field(
+        default=3600.0,
+        description="How long the delivery count of a failing event is remembered",
+        gt=0,
+    )
+    DLQ_TRACK_MAX_ENTRIES: int = Field(
+        default=10_000,
+        description="Maximum failing events tracked at once",
+        ge=1,
+    )
+
+    # ------------------------------------------------------------------
+    # Scale-out
+    # ------------------------------------------------------------------
+    CONSUMER_MODE: Literal["durable", "virtual-topic"] = Field(
+        default="durable",
+        description=(
+            "durable = one durable topic subscriber; virtual-topic = "
+            "competing consumers on an ActiveMQ virtual-topic queue"
+        ),
+    )
+    VIRTUAL_TOPIC_QUEUE: Optional[str] = Field(
+        default=None,
+        description=(
+            "Consumer queue in virtual-topic mode (default: "
+            "/queue/Consumer.<ROUTER_SUBSCRIPTION_NAME>.<EVENT_TOPIC name>)"
+        ),
+    )
+    ROUTER_PROCESSES: int = Field(
+        default=1,
+        description="Router processes started by main (> 1 needs CONSUMER_MODE=virtual-topic)",
+        ge=1,
+    )
+
+    # ------------------------------------------------------------------
+    # Enrichment
+    # ------------------------------------------------------------------
+    ALFRESCO_URL: Optional[str] = Field(
+        default=None,
+        description="Alfresco repository URL for metadata enrichment (unset = disabled)",
+    )
+    ALFRESCO_USER: str = Field(
+        default="admin",
+        description="Alfresco username for enrichment lookups",
+    )
+    ALFRESCO_PASSWORD: str = Field(
+        default="admin",
+        description="Alfresco password for enrichment lookups",
+        repr=False,
+    )
+    ENRICH_ROUTES: str = Field(
+        default="",
+        description="Comma-separated route names whose payloads are enriched",
+    )
+    ENRICH_REQUIRED: bool = Field(
+        default=False,
+        description="NACK events whose metadata lookup fails instead of publishing without it",
+    )
+    ENRICH_CACHE_TTL_SECONDS: float = Field(
+        default=300,
+        description="Lifetime of cached node metadata",
+        gt=0,
+    )
+    ENRICH_CACHE_MAX_ENTRIES: int = Field(
+        default=10_000,
+        description="Maximum cached nodes",
+        ge=1,
+    )
+    ENRICH_BATCH_SIZE: int = Field(
+        default=20,
+        description="Maximum nodes fetched per repository request",
+        ge=1,
+    )
+    ENRICH_BATCH_WAIT_MS: int = Field(
+        default=0,
+        description=(
+            "Extra time a lookup waits for others to share its request "
+            "(0: batch only lookups queued while the previous request ran)"
+        ),
+        ge=0,
+    )
+    ENRICH_TIMEOUT_MS: int = Field(
+        default=5_000,
+        description="Time an event may wait for its metadata",
+        ge=1,
+    )
+
+    # ------------------------------------------------------------------
+    # Metrics
+    # ------------------------------------------------------------------
+    METRICS_HOST: str = Field(
+        default="127.0.0.1",
+        description="Bind address of the metrics HTTP endpoint",
+    )
+    METRICS_PORT: int = Field(
+        default=0,
+        description="Port of the Prometheus metrics endpoint (0 = disabled)",
+        ge=0,
+    )
+
+    # ------------------------------------------------------------------
+    # Capture
+    # ------------------------------------------------------------------
+    CAPTURE_FILE: Optional[str] = Field(
+        default=None,
+        description="Append received frames to this gzip file for replay",
+    )
 
     # ------------------------------------------------------------------
     # Logging
@@ -101,6 +473,71 @@ class Settings(BaseSettings):
         default="INFO",
         description="Application log level",
     )
+    LOG_FORMAT: Literal["text", "json"] = Field(
+        default="text",
+        description="Log output format: text lines or one JSON object per line",
+    )
+    LOG_ASYNC: bool = Field(
+        default=False,
+        description="Format and write log records on a background thread",
+    )
+    LOG_QUEUE_SIZE: int = Field(
+        default=10_000,
+        description="Log records buffered for the background thread; further records are dropped",
+        ge=1,
+    )
+    LOG_RATE_LIMITS: str = Field(
+        default="",
+        description="Comma-separated logger=rate[:burst] limits (records/s) below WARNING, e.g. router.pipeline=10",
+    )
+
+    @model_validator(mode="after")
+    def _check_scale_out(self) -> "Settings":
+        """
+        Reject several processes sharing one durable subscription.
+
+        The broker allows a client-id only once, so extra processes
+        would fail to connect instead of sharing the load.
+        """
+        if self.ROUTER_PROCESSES > 1 and self.CONSUMER_MODE == "durable":
+            raise ValueError(
+                "ROUTER_PROCESSES > 1 requires CONSUMER_MODE=virtual-topic"
+            )
+        return self
+
+    @model_validator(mode="after")
+    def _check_route_isolation(self) -> "Settings":
+        """
+        Reject route isolation on the consuming connection.
+
+        Without dedicated producer connections every sender writes on
+        the consumer's connection; a destination blocked by producer
+        flow control stalls ACKs, NACKs and every other route. The
+        asyncio runtime always publishes on the consumer's connection.
+        """
+        if not self.ROUTE_ISOLATION:
+            return self
+        if self.ROUTER_RUNTIME == "asyncio":
+            raise ValueError("ROUTE_ISOLATION is not supported by the asyncio runtime")
+        if self.PUBLISHER_CONNECTIONS == 0:
+            raise ValueError("ROUTE_ISOLATION requires PUBLISHER_CONNECTIONS > 0")
+        return self
+
+    @property
+    def consumer_queue(self) -> str:
+        """
+        Queue consumed in virtual-topic mode.
+
+        Returns
+        -------
+        str
+            `VIRTUAL_TOPIC_QUEUE`, or the ActiveMQ default consumer
+            queue name derived from `EVENT_TOPIC`.
+        """
+        if self.VIRTUAL_TOPIC_QUEUE:
+            return self.VIRTUAL_TOPIC_QUEUE
+        topic = self.EVENT_TOPIC.rsplit("/", 1)[-1]
+        return f"/queue/Consumer.{self.ROUTER_SUBSCRIPTION_NAME}.{topic}"
 
     # ------------------------------------------------------------------
     # Pydantic configuration
@@ -0,0 +1,29 @@
+"""
+Shared test setup.
+
+`settings` is validated on import, so the required variables get
+placeholder values before any router module is imported.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("EVENT_TOPIC", "/topic/events")
+os.environ.setdefault("ROUTER_CLIENT_ID", "router-tests")
+os.environ.setdefault("ROUTER_SUBSCRIPTION_NAME", "router-tests")
+os.environ.setdefault("AUTOTAG_QUEUE", "/queue/autotag")
+
+
+def wait_for(predicate, timeout: float = 5.0) -> bool:
+    """
+    Poll until `predicate()` is true or `timeout` seconds have passed.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
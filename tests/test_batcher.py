@@ -0,0 +1,140 @@
+"""
+Transactional batches against the fake broker: committed batches ACK
+their frames, failed batches are aborted and NACKed for redelivery.
+"""
+
+import threading
+
+import pytest
+import stomp
+
+from bench.fake_broker import FakeStompBroker
+from conftest import wait_for
+from core.batcher import TransactionBatcher
+from core.frames import Frame
+from core.publisher import QueuePublisher
+
+TOPIC = "/topic/events"
+QUEUE = "/queue/out"
+
+
+class _RejectingBroker(FakeStompBroker):
+    """
+    Broker answering every COMMIT with an ERROR instead of a RECEIPT.
+    """
+
+    def _on_commit(self, session, frame):
+        with self._lock:
+            session.transactions.pop(frame.headers["transaction"], None)
+        session.send(
+            Frame(
+                "ERROR",
+                {
+                    "receipt-id": frame.headers.pop("receipt"),
+                    "message": "Journal full",
+                },
+            )
+        )
+
+
+class _FailingPublisher(QueuePublisher):
+    def publish_batch(self, messages, transaction=None):
+        raise ConnectionError("destination unavailable")
+
+
+class _Frames:
+    """
+    stomp.py listener collecting received MESSAGE frames.
+    """
+
+    def __init__(self):
+        self.frames = []
+        self._lock = threading.Lock()
+
+    def on_message(self, frame):
+        with self._lock:
+            self.frames.append(frame)
+
+    def take(self):
+        with self._lock:
+            frames, self.frames = self.frames, []
+        return frames
+
+
+@pytest.fixture
+def consumer(request):
+    broker = getattr(request, "param", FakeStompBroker)()
+    host, port = broker.start()
+    conn = stomp.Connection12([(host, port)], heartbeats=(0, 0))
+    received = _Frames()
+    conn.set_listener("frames", received)
+    conn.connect(wait=True, headers={"client-id": "router-tests"})
+    conn.subscribe(
+        destination=TOPIC,
+        id="sub-1",
+        ack="client-individual",
+        headers={"activemq.prefetchSize": "10"},
+    )
+    assert broker.wait_for_subscriber(TOPIC)
+    yield broker, conn, received
+    conn.disconnect()
+    broker.stop()
+
+
+def _deliver(broker, received, count):
+    for n in range(count):
+        broker.publish(TOPIC, b'{"n": %d}' % n)
+    assert wait_for(lambda: len(received.frames) == count)
+    return received.take()
+
+
+def _add(batcher, frames):
+    for frame in frames:
+        batcher.add(
+            [(QUEUE, {"n": frame.body})],
+            {"id": frame.headers["ack"], "subscription": frame.headers["subscription"]},
+        )
+
+
+def test_full_batch_is_committed_and_acked(consumer):
+    broker, conn, received = consumer
+    frames = _deliver(broker, received, 3)
+
+    batcher = TransactionBatcher(conn, QueuePublisher(conn), max_events=3, max_delay_ms=10000)
+    try:
+        _add(batcher, frames)
+        assert wait_for(lambda: broker.acked == 3)
+    finally:
+        batcher.close()
+
+    assert broker.nacked == 0
+    assert broker.queue_depth(QUEUE) == 3
+
+
+@pytest.mark.parametrize(
+    "consumer, publisher",
+    [
+        pytest.param(FakeStompBroker, _FailingPublisher, id="publish-failed"),
+        pytest.param(_RejectingBroker, QueuePublisher, id="commit-rejected"),
+    ],
+    indirect=["consumer"],
+)
+def test_failed_batch_is_aborted_and_nacked(consumer, publisher):
+    broker, conn, received = consumer
+    frames = _deliver(broker, received, 3)
+
+    batcher = TransactionBatcher(conn, publisher(conn), max_events=3, max_delay_ms=10000)
+    try:
+        _add(batcher, frames)
+        assert wait_for(lambda: broker.nacked == 3)
+    finally:
+        batcher.close()
+
+    assert broker.acked == 0
+    # Nothing of the aborted transaction reached the destination
+    assert broker.queue_depth(QUEUE) == 0
+    # The broker redelivers the NACKed frames
+    assert wait_for(lambda: len(received.frames) == 3)
+    redelivered = received.take()
+    assert [frame.body for frame in redelivered] == [frame.body for frame in frames]
+    assert all(frame.headers.get("redelivered") == "true" for frame in redelivered)
@@ -0,0 +1,34 @@
+"""
+Route name uniqueness at load time.
+"""
+
+import json
+
+import pytest
+
+from core.registry import RouteTable
+from core.rules import RuleRoute, load_rule_routes
+
+
+def _rule(name, queue="/queue/out"):
+    return {"name": name, "queue": queue, "eventTypes": ["BINARY_CHANGED"]}
+
+
+def test_rule_file_with_duplicate_names_is_rejected(tmp_path):
+    path = tmp_path / "routes.json"
+    rules = [_rule("vector"), _rule("vector", "/queue/other")]
+    path.write_text(json.dumps({"routes": rules}))
+
+    with pytest.raises(ValueError, match="duplicate route names: vector"):
+        load_rule_routes(str(path))
+
+
+def test_route_table_rejects_duplicate_names():
+    routes = [RuleRoute(_rule("vector")), RuleRoute(_rule("vector", "/queue/other"))]
+    with pytest.raises(ValueError, match="Duplicate route names: vector"):
+        RouteTable(routes)
+
+
+def test_route_table_accepts_unique_names():
+    table = RouteTable([RuleRoute(_rule("vector")), RuleRoute(_rule("autometa"))])
+    assert [route.name for route in table.routes] == ["vector", "autometa"]
@@ -0,0 +1,110 @@
+"""
+Spool append, recovery and draining across a torn write.
+"""
+
+import os
+import zlib
+
+import pytest
+
+from conftest import wait_for
+from core.codec import Encoded
+from core.reconnect import Backoff
+from core.spool import _HEADER, Spool, _pack
+
+
+def _unavailable(destination, payload):
+    raise ConnectionError("destination unavailable")
+
+
+def _open(directory, publish):
+    return Spool(
+        str(directory),
+        publish,
+        segment_bytes=256,
+        fsync=False,
+        backoff=Backoff(0.01, 0.01),
+    )
+
+
+def _segments(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".seg"))
+
+
+@pytest.mark.parametrize(
+    "torn",
+    [
+        pytest.param(lambda record: record[:_HEADER.size - 1], id="partial-header"),
+        pytest.param(lambda record: record[:-3], id="partial-record"),
+        pytest.param(
+            lambda record: record[:-1] + bytes([record[-1] ^ 0xFF]), id="bad-crc"
+        ),
+    ],
+)
+def test_recover_truncates_torn_tail_and_drains_in_order(tmp_path, torn):
+    spool = _open(tmp_path, _unavailable)
+    for n in range(10):
+        spool.append("/queue/out", {"n": n, "name": "x" * 40})
+    spool.append("/queue/other", Encoded(b"\x00\x01", "application/msgpack", "zstd"))
+    assert spool.pending == 11
+    assert spool.holds("/queue/out")
+    spool.close()
+
+    segments = _segments(tmp_path)
+    assert len(segments) > 1, "records should span several segments"
+
+    # Crash mid-write of another record at the end of the last segment
+    last = os.path.join(tmp_path, segments[-1])
+    valid_size = os.path.getsize(last)
+    record = _pack("/queue/out", {"n": "torn"})
+    with open(last, "ab") as f:
+        f.write(torn(_HEADER.pack(len(record), zlib.crc32(record)) + record))
+
+    published = []
+    spool = _open(tmp_path, lambda destination, payload: published.append((destination, payload)))
+    try:
+        assert os.path.getsize(last) == valid_size
+        assert wait_for(lambda: spool.pending == 0)
+    finally:
+        spool.close()
+
+    assert [destination for destination, _ in published] == ["/queue/out"] * 10 + ["/queue/other"]
+    assert [payload.body for _, payload in published[:3]] == [
+        '{"n":0,"name":"%s"}' % ("x" * 40),
+        '{"n":1,"name":"%s"}' % ("x" * 40),
+        '{"n":2,"name":"%s"}' % ("x" * 40),
+    ]
+    binary = published[-1][1]
+    assert (binary.body, binary.content_type, binary.content_encoding) == (
+        b"\x00\x01",
+        "application/msgpack",
+        "zstd",
+    )
+    # Drained segments are deleted; only the active one is left
+    assert len(_segments(tmp_path)) == 1
+
+
+def test_drain_resumes_after_failed_republish(tmp_path):
+    attempts = []
+
+    def flaky(destination, payload):
+        attempts.append(payload.body)
+        if len(attempts) <= 3:
+            raise ConnectionError("destination unavailable")
+
+    spool = _open(tmp_path, flaky)
+    try:
+        spool.append("/queue/out", {"n": 0})
+        spool.append("/queue/out", {"n": 1})
+        assert wait_for(lambda: spool.pending == 0)
+        assert not spool.holds("/queue/out")
+    finally:
+        spool.close()
+
+    assert attempts == ['{"n":0}'] * 4 + ['{"n":1}']
+
+    spool = _open(tmp_path, _unavailable)
+    try:
+        assert spool.pending == 0
+    finally:
+        spool.close()